@@ -0,0 +1,161 @@
+# Near-duplicate question removal between merge and expansion.
+#
+#   merged_datasets.py -> dedup_seeds.py -> data_expand.py
+#
+# The same question comes back across years with small wording changes.
+# Per (subject, marks), every question is normalised, cut into word
+# shingles and MinHashed; LSH banding only compares questions that share a
+# band, so the work grows roughly linearly with the corpus instead of
+# all-pairs. Candidate pairs are confirmed with exact shingle Jaccard and
+# clustered (union-find).
+# Each cluster keeps one canonical seed with an "occurrences" count.
+# The task verb is part of the question ("Define X" for 2 marks and
+# "Derive X" for 10 are different exam questions), so it's kept, and seeds
+# with different marks are never merged.
+
+import os
+import re
+import sys
+import random
+import zlib
+from collections import defaultdict
+
+# shared modules live one level up (dataset_expansion/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from seed_io import iter_seeds, write_jsonl_line
+
+# ---------------- CONFIG ----------------
+
+INPUT_FILE = "merged_dataset.jsonl"
+OUTPUT_FILE = "deduped_dataset.jsonl"
+CLUSTERS_FILE = "dedup_clusters.jsonl"   # what got merged into what, for review
+
+SHINGLE_SIZE = 3          # words per shingle
+NUM_PERM = 64             # MinHash signature length
+BANDS = 16                # LSH bands (NUM_PERM / BANDS rows each -> ~0.5 candidate threshold)
+JACCARD_THRESHOLD = 0.7   # confirmed near-duplicate
+
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(42)
+PERMS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+
+# ---------------- NORMALISATION ----------------
+
+LATEX_SPACING = re.compile(r"\\[,;:! ]|\$")
+NON_WORD = re.compile(r"[^\w\s]")
+MULTI_SPACE = re.compile(r"\s+")
+
+
+def normalise(question):
+    text = question.lower()
+    text = LATEX_SPACING.sub(" ", text)
+    text = NON_WORD.sub(" ", text)
+    return MULTI_SPACE.sub(" ", text).strip()
+
+
+def shingles(text):
+    words = text.split()
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(shingle_set):
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in shingle_set]
+    return tuple(min((a * h + b) % _MERSENNE for h in hashes) for a, b in PERMS)
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+# ---------------- CLUSTERING ----------------
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def cluster_stratum(seeds):
+    """
+    Returns clusters as lists of positions into `seeds`.
+    """
+    sets = [shingles(normalise(s["question"])) for s in seeds]
+    rows = NUM_PERM // BANDS
+    buckets = defaultdict(list)
+
+    for pos, sh in enumerate(sets):
+        sig = minhash(sh)
+        for band in range(BANDS):
+            buckets[(band, sig[band * rows:(band + 1) * rows])].append(pos)
+
+    uf = UnionFind(len(seeds))
+    checked = set()
+    for members in buckets.values():
+        for i in range(len(members)):
+            for j in range(i + 1, len(members)):
+                pair = (members[i], members[j])
+                if pair in checked:
+                    continue
+                checked.add(pair)
+                if jaccard(sets[pair[0]], sets[pair[1]]) >= JACCARD_THRESHOLD:
+                    uf.union(*pair)
+
+    clusters = defaultdict(list)
+    for pos in range(len(seeds)):
+        clusters[uf.find(pos)].append(pos)
+    return list(clusters.values())
+
+
+def pick_canonical(members):
+    # same marks; the longer wording usually asks for the most
+    return max(members, key=lambda s: len(s["question"]))
+
+
+# ---------------- MAIN ----------------
+
+def main():
+    by_stratum = defaultdict(list)
+    total = 0
+    for seed in iter_seeds(INPUT_FILE):
+        by_stratum[(seed["subject"], seed.get("mark"))].append(seed)
+        total += 1
+
+    kept = 0
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as out, \
+         open(CLUSTERS_FILE, "w", encoding="utf-8") as log:
+
+        for (subject, mark), seeds in by_stratum.items():
+            for cluster in cluster_stratum(seeds):
+                members = [seeds[p] for p in cluster]
+                canonical = dict(pick_canonical(members))
+                canonical["occurrences"] = len(members)
+                write_jsonl_line(out, canonical)
+                kept += 1
+
+                if len(members) > 1:
+                    write_jsonl_line(log, {
+                        "subject": subject,
+                        "mark": mark,
+                        "kept": canonical["question"],
+                        "merged": [m["question"] for m in members if m["question"] != canonical["question"]]
+                    })
+
+    print(f"Seeds in: {total}")
+    print(f"Seeds kept: {kept}  (removed {total - kept} near-duplicates)")
+    print(f"Output file: {OUTPUT_FILE}  (clusters: {CLUSTERS_FILE})")
+
+
+if __name__ == "__main__":
+    main()
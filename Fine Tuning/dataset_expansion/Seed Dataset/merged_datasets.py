@@ -2,11 +2,24 @@
 794
 dict_keys(['subject', 'question', 'mark', 'paper_type', 'section', 'semester', 'family'])
 '''
+# Streams every semester JSON file into merged_dataset.jsonl (one seed per line).
+# Files are parsed + schema-checked in parallel worker processes and written
+# in a stable (sorted) order, so memory stays at a few files per worker no
+# matter how many semesters/years get added. Read it back lazily with
+# seed_io.iter_seeds().
 import os
+import sys
 import json
+from concurrent.futures import ProcessPoolExecutor
+
+# shared modules live one level up (dataset_expansion/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from seed_io import validate_seed, write_jsonl_line
 
 BASE_DIR = ""      # root folder
-OUTPUT_FILE = "merged_dataset.json"
+OUTPUT_FILE = "merged_dataset.jsonl"
+REJECTS_FILE = "merged_rejects.jsonl"   # schema failures, for fixing at the source
+WORKERS = os.cpu_count() or 1
 
 SEM_FOLDERS = [
     "1st Sem",
@@ -14,11 +27,9 @@ SEM_FOLDERS = [
     "3rd Sem"
 ]
 
-def merge_all_jsons():
-    merged = []
-    file_count = 0
-    item_count = 0
 
+def list_files():
+    files = []
     for sem in SEM_FOLDERS:
         sem_path = os.path.join(BASE_DIR, sem)
 
@@ -26,33 +37,67 @@ def merge_all_jsons():
             print(f"Skipping missing folder: {sem_path}")
             continue
 
-        for fname in os.listdir(sem_path):
-            if not fname.endswith(".json"):
-                continue
+        for fname in sorted(os.listdir(sem_path)):
+            if fname.endswith(".json"):
+                files.append(os.path.join(sem_path, fname))
+    return files
 
-            file_path = os.path.join(sem_path, fname)
 
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
+def load_and_validate(file_path):
+    """
+    Runs in a worker process. Returns (file_path, valid, rejects, error).
+    """
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        return file_path, [], [], f"Failed to read: {e}"
 
-                if not isinstance(data, list):
-                    print(f"Skipping non-list JSON: {file_path}")
-                    continue
+    if not isinstance(data, list):
+        return file_path, [], [], "Skipping non-list JSON"
 
-                merged.extend(data)
-                file_count += 1
-                item_count += len(data)
+    valid, rejects = [], []
+    for pos, item in enumerate(data):
+        errors = validate_seed(item)
+        if errors:
+            rejects.append({"file": file_path, "position": pos, "errors": errors, "item": item})
+        else:
+            valid.append(item)
+    return file_path, valid, rejects, None
 
-            except Exception as e:
-                print(f"Failed to read {file_path}: {e}")
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as out:
-        json.dump(merged, out, indent=2, ensure_ascii=False)
+def merge_all_jsons():
+    files = list_files()
+    file_count = 0
+    item_count = 0
+    reject_count = 0
+
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as out, \
+         open(REJECTS_FILE, "w", encoding="utf-8") as rej, \
+         ProcessPoolExecutor(max_workers=WORKERS) as pool:
+
+        # map() keeps input order while files are parsed concurrently; going
+        # window by window bounds how many parsed files wait in memory
+        window = WORKERS * 2
+        for start in range(0, len(files), window):
+            for file_path, valid, rejects, error in pool.map(load_and_validate, files[start:start + window]):
+                if error:
+                    print(f"{error}: {file_path}")
+                    continue
+
+                for item in valid:
+                    write_jsonl_line(out, item)
+                for r in rejects:
+                    write_jsonl_line(rej, r)
+
+                file_count += 1
+                item_count += len(valid)
+                reject_count += len(rejects)
 
     print(f"Merge complete.")
     print(f"Files merged: {file_count}")
     print(f"Total items: {item_count}")
+    print(f"Rejected by schema: {reject_count} (see {REJECTS_FILE})")
     print(f"Output file: {OUTPUT_FILE}")
 
 
@@ -1,9 +1,16 @@
 import os
+import re
 import json
+import hashlib
+import tempfile
+from functools import lru_cache
 
 #configuration file
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# content hash of every annotated file; unchanged files are skipped without parsing
+MANIFEST_FILE = os.path.join(BASE_DIR, ".annotation_manifest.json")
+
 SEMESTER_MAP = {
     "1st Sem": 1,
     "2nd Sem": 2,
@@ -25,19 +32,69 @@ FAMILY_MAP = {
     "ENGT": "design"
 }
 
+NON_ALPHA = re.compile(r"[\W\d_]+")
+
 #helpers
+@lru_cache(maxsize=None)
 def infer_family(subject_code: str) -> str:
     """
     This extracts prefix from subject code and map to family.
+    Subject codes repeat on every question, so results are memoised.
     """
-    prefix = "".join([c for c in subject_code if c.isalpha()])
+    prefix = NON_ALPHA.sub("", subject_code)
     return FAMILY_MAP.get(prefix, "general")
 
 
-def process_file(file_path: str, semester: int):
-    with open(file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def file_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def load_manifest() -> dict:
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
 
+def atomic_write(path: str, data: bytes):
+    """
+    Temp file in the same folder + os.replace, so a crash never leaves a
+    half-written JSON behind.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_", suffix=".json")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def process_file(file_path: str, semester: int, manifest: dict):
+    """
+    Returns "skipped", "clean" or "updated". `manifest` is updated in place.
+    """
+    key = os.path.relpath(file_path, BASE_DIR)
+    entry = manifest.get(key)
+    stat = os.stat(file_path)
+
+    # fast path: size + mtime unchanged since we last recorded the file
+    if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+        return "skipped"
+
+    with open(file_path, "rb") as f:
+        raw = f.read()
+    digest = file_hash(raw)
+
+    # touched but same content
+    if entry and entry["sha256"] == digest:
+        manifest[key] = {"sha256": digest, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+        return "skipped"
+
+    data = json.loads(raw)
     updated = False
 
     for item in data:
@@ -53,16 +110,21 @@ def process_file(file_path: str, semester: int):
             updated = True
 
     if updated:
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        print(f"Updated: {file_path}")
-    else:
-        print(f"⏭kipped (already clean): {file_path}")
+        raw = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+        atomic_write(file_path, raw)
+        digest = file_hash(raw)
+        stat = os.stat(file_path)
+
+    manifest[key] = {"sha256": digest, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+    return "updated" if updated else "clean"
 
 #main
 def run():
     print("\nLets Beginnnnnnnnnn\n")
 
+    manifest = load_manifest()
+    counts = {"updated": 0, "clean": 0, "skipped": 0}
+
     for sem_folder, semester in SEMESTER_MAP.items():
         sem_path = os.path.join(BASE_DIR, sem_folder)
 
@@ -75,9 +137,18 @@ def run():
                 continue
 
             file_path = os.path.join(sem_path, filename)
-            process_file(file_path, semester)
+            result = process_file(file_path, semester, manifest)
+            counts[result] += 1
+
+            if result == "updated":
+                print(f"Updated: {file_path}")
+            elif result == "clean":
+                print(f"⏭kipped (already clean): {file_path}")
+
+    atomic_write(MANIFEST_FILE, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
 
-    print("\nDone. Files updated.\n")
+    print(f"\nDone. Updated: {counts['updated']}, already clean: {counts['clean']}, "
+          f"unchanged since last run: {counts['skipped']}\n")
 
 if __name__ == "__main__":
     run()
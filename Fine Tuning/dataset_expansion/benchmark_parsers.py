@@ -0,0 +1,116 @@
+# Micro-benchmark: single-scan tag parser (output_parsers.py) vs the old
+# per-tag regex extraction.
+#
+# Model responses aren't kept, so each record of the expanded dataset is
+# rendered back into the single-pass <TAG> format the prompts ask for, plus
+# damaged copies (cut off mid-answer like a max_tokens stop, one tag dropped)
+# so the error paths are timed too. Both parsers must agree on every field.
+#
+#   python benchmark_parsers.py
+#   python benchmark_parsers.py --dataset expanded_dataset_v1.jsonl --repeat 20
+
+import argparse
+import json
+import random
+import re
+import time
+from collections import Counter
+
+from output_parsers import SINGLE_TAGS, parse_single_tagged, split_keywords
+
+
+# ---------------- CONFIG ----------------
+
+DATASET = "expanded_dataset_v1.jsonl"
+REPEAT = 10
+SEED = 0
+
+
+# ---------------- OLD PARSER ----------------
+
+def legacy_extract_tag(text, tag):
+    m = re.search(fr"<{tag}>(.*?)</{tag}>", text, re.S)
+    return m.group(1).strip() if m else None
+
+
+def legacy_parse_single_tagged(text):
+    return {
+        "guided_mode_answer": legacy_extract_tag(text, "GUIDED_MODE"),
+        "guided_f_question": legacy_extract_tag(text, "GUIDED_FOLLOWUP"),
+        "exam_f_question": legacy_extract_tag(text, "EXAM_FOLLOWUP"),
+        "keywords": split_keywords(legacy_extract_tag(text, "KEYWORDS")),
+        "exam_mode_answer": legacy_extract_tag(text, "EXAM_MODE")
+    }
+
+
+# ---------------- RESPONSES ----------------
+
+def render(record):
+    parts = ["<RESULT>", f"<SUBJECT>{record.get('subject')}</SUBJECT>", f"<QUESTION>{record.get('question')}</QUESTION>"]
+    for field, tag in SINGLE_TAGS.items():
+        value = record.get(field) or ""
+        if field == "keywords":
+            value = ", ".join(value)
+        parts.append(f"<{tag}>\n{value}\n</{tag}>")
+    parts.append("</RESULT>")
+    return "\n\n".join(parts)
+
+
+def build_responses(path, rng):
+    responses = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            text = render(record)
+            responses.append(text)
+            # cut off somewhere in the second half, like a max_tokens stop
+            responses.append(text[:rng.randint(len(text) // 2, len(text) - 1)])
+            tag = rng.choice(list(SINGLE_TAGS.values()))
+            responses.append(re.sub(fr"</?{tag}>", "", text))
+    return responses
+
+
+# ---------------- MAIN ----------------
+
+def timed(parse, responses, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in responses:
+            parse(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tag parsers on rendered dataset records")
+    parser.add_argument("--dataset", default=DATASET)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    args = parser.parse_args()
+
+    responses = build_responses(args.dataset, random.Random(SEED))
+
+    mismatches = 0
+    errors = Counter()
+    for text in responses:
+        parsed = parse_single_tagged(text)
+        mismatches += dict(parsed) != legacy_parse_single_tagged(text)
+        errors.update(e.kind for e in parsed.errors)
+
+    old = timed(legacy_parse_single_tagged, responses, args.repeat)
+    new = timed(parse_single_tagged, responses, args.repeat)
+    mb = sum(len(t) for t in responses) / 1e6
+
+    print(f"Responses       : {len(responses)} ({mb:.1f} MB, full + truncated + missing tag)")
+    print(f"Per-tag regex   : {old * 1000:.1f} ms  ({len(responses) / old:,.0f} responses/s)")
+    print(f"Single scan     : {new * 1000:.1f} ms  ({len(responses) / new:,.0f} responses/s)")
+    print(f"Speedup         : {old / new:.2f}x")
+    print(f"Field mismatches: {mismatches}")
+    print(f"Parse errors    : {dict(errors)}")
+
+
+if __name__ == "__main__":
+    main()
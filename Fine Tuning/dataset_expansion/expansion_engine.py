@@ -0,0 +1,297 @@
+# Seed expansion engine shared by data_expand.py and test_data_expand.py.
+#
+# Two pipeline modes over the same family registry (families.py):
+#   staged - exam pass -> validate -> guided pass -> validate
+#   single - one call producing everything -> parse (tags or JSON) -> validate
+#
+# When only guided fields fail, a repair call asks for just those fields
+# (up to repair_rounds times) and keeps everything that already passed,
+# instead of re-sending the whole guided prompt or dropping the seed.
+#
+# Both run through the same concurrent, rate-limited, cached client
+# (llm_client.py / response_cache.py) and the same per-seed state store
+# (expansion_state.py), so throughput and resume fixes land once.
+
+import os
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+from tqdm import tqdm
+
+from families import get_family
+from llm_client import ChatClient, run_concurrent
+from expansion_state import ExpansionState
+from output_parsers import GUIDED_TAGS, parse_guided_tagged, parse_tagged, SINGLE_PARSERS
+from response_cache import ResponseCache
+from seed_io import iter_seeds
+
+
+# ---------------- CONFIG ----------------
+
+@dataclass
+class ExpansionConfig:
+    input_file: str
+    output_file: str
+    failed_file: str
+    state_db: str
+    mode: str = "staged"                     # "staged" | "single"
+    legacy_checkpoint: Optional[str] = None  # old integer checkpoint, imported once
+
+    # currently using DeepSeek v3.2 chat model (non-thinking)
+    model_name: str = "deepseek-chat"
+    api_url: str = os.environ.get("DEEPSEEK_API_URL", "https://api.deepseek.com/chat/completions")
+    temperature: float = 0.2
+
+    max_tokens_exam: int = 1200
+    max_tokens_guided: int = 1000
+    max_tokens_single: int = 1400
+    repair_rounds: int = 2  # field-level retries before a seed counts as failed
+
+    # seeds expanded in parallel / global request rate (token bucket, honours 429 Retry-After)
+    concurrency: int = int(os.environ.get("EXPAND_CONCURRENCY", 8))
+    requests_per_second: float = float(os.environ.get("EXPAND_RPS", 4))
+    max_attempts: int = 2  # failed seeds are retried on the next run until this many attempts
+
+    # responses cached by (model, temperature, max_tokens, prompt hash); EXPAND_NO_CACHE=1 bypasses
+    cache_db: Optional[str] = None if os.environ.get("EXPAND_NO_CACHE") else os.environ.get("EXPAND_CACHE_DB", "llm_cache.db")
+    cache_ttl_days: float = 30
+    cache_max_entries: int = 50000
+
+
+# max_tokens a repair call gets per missing field (capped at max_tokens_guided)
+REPAIR_TOKENS = {
+    "guided_mode_answer": 700,
+    "guided_f_question": 200,
+    "exam_f_question": 150,
+    "keywords": 80
+}
+
+
+# ---------------- VALIDATION STAGES ----------------
+
+def is_valid_exam_answer(text):
+    # allow short answers for programming / design
+    return bool(text) and len(text.strip()) >= 15
+
+
+def required_guided_fields(mark):
+    required = ["guided_mode_answer", "guided_f_question"]
+
+    # exam follow-up only required for >= 4 marks
+    if mark >= 4:
+        required.append("exam_f_question")
+
+    return required
+
+
+def is_valid_guided(parsed, mark):
+    return all(parsed.get(k) and parsed[k].strip() for k in required_guided_fields(mark))
+
+
+def fields_to_repair(parsed, mark):
+    """
+    Guided fields a repair call should ask for: the required ones that
+    failed, plus any other field the parser flagged (missing keywords come
+    along for free). Empty when the guided part is already valid.
+    """
+    failed = [k for k in required_guided_fields(mark) if not (parsed.get(k) and parsed[k].strip())]
+    if not failed:
+        return []
+
+    flagged = {e.field for e in getattr(parsed, "errors", [])}
+    if not parsed.get("keywords"):
+        flagged.add("keywords")
+    return [f for f in GUIDED_TAGS if f in failed or f in flagged]
+
+
+def validate_record(parsed, mark):
+    """
+    Single-pass outputs carry both halves; check them in pipeline order and
+    return the first failing stage (None if valid).
+    """
+    if not parsed:
+        return "Parse failed"
+    if not is_valid_exam_answer(parsed.get("exam_mode_answer")):
+        return "Exam pass failed"
+    if not is_valid_guided(parsed, mark):
+        return "Guided pass failed"
+    return None
+
+
+def build_record(item, exam_answer, guided):
+    return {
+        "subject": item["subject"],
+        "question": item["question"],
+        "marks": item["mark"],
+        "semester": item.get("semester"),
+        "exam_mode_answer": exam_answer,
+        "exam_f_question": guided.get("exam_f_question"),
+        "guided_mode_answer": guided["guided_mode_answer"],
+        "guided_f_question": guided["guided_f_question"],
+        "keywords": guided.get("keywords") or []
+    }
+
+
+# ---------------- ENGINE ----------------
+
+class ExpansionEngine:
+
+    def __init__(self, config: ExpansionConfig):
+        api_key = os.environ.get("DEEPSEEK_API_KEY")
+        if not api_key:
+            raise RuntimeError("DEEPSEEK_API_KEY not found in environment")
+        if config.mode not in ("staged", "single"):
+            raise ValueError(f"Unknown mode: {config.mode}")
+
+        self.config = config
+        self.cache = (
+            ResponseCache(config.cache_db, config.cache_ttl_days, config.cache_max_entries)
+            if config.cache_db else None
+        )
+        self.client = ChatClient(
+            config.api_url, api_key, config.model_name, config.temperature,
+            requests_per_second=config.requests_per_second,
+            burst=config.concurrency,
+            pool_size=config.concurrency,
+            cache=self.cache
+        )
+        self.repairs = Counter()
+        self.repairs_lock = threading.Lock()
+
+    # ---------------- FIELD REPAIR ----------------
+
+    def repair_guided(self, item, exam_answer, parsed):
+        """
+        Re-requests only the guided fields that failed and merges them into
+        `parsed`. Returns the merged fields, valid or not.
+        """
+        family = get_family(item)
+        cfg = self.config
+        parsed = dict(parsed)
+        stats = Counter(seeds=1)
+
+        for _ in range(cfg.repair_rounds):
+            fields = fields_to_repair(parsed, item["mark"])
+            if not fields:
+                break
+
+            prompt = family.repair_prompt(item, exam_answer, parsed, fields)
+            max_tokens = min(cfg.max_tokens_guided, sum(REPAIR_TOKENS[f] for f in fields))
+            repaired = parse_tagged(
+                self.client.complete(prompt, max_tokens),
+                {f: GUIDED_TAGS[f] for f in fields}
+            )
+            for f in fields:
+                if repaired[f]:
+                    parsed[f] = repaired[f]
+
+            stats["calls"] += 1
+            stats["max_tokens"] += max_tokens
+            stats.update(f"field:{f}" for f in fields)
+
+            if not is_valid_guided(parsed, item["mark"]):
+                # the next round (or run) must not get this response back from the cache
+                self.client.discard(prompt, max_tokens)
+
+        stats["repaired" if is_valid_guided(parsed, item["mark"]) else "unrepaired"] += 1
+        with self.repairs_lock:
+            self.repairs.update(stats)
+        return parsed
+
+    # ---------------- STAGED MODE ----------------
+
+    def expand_staged(self, item):
+        family = get_family(item)
+        cfg = self.config
+
+        # ---------- PASS 1: EXAM ----------
+        exam_prompt = family.exam_prompt(item)
+        exam_answer = self.client.complete(exam_prompt, cfg.max_tokens_exam).strip()
+
+        if not is_valid_exam_answer(exam_answer):
+            self.client.discard(exam_prompt, cfg.max_tokens_exam)
+            raise ValueError("Exam pass failed")
+
+        # ---------- PASS 2: GUIDED ----------
+        guided_prompt = family.guided_prompt(item, exam_answer)
+        guided = parse_guided_tagged(self.client.complete(guided_prompt, cfg.max_tokens_guided))
+
+        # Ask again only for what failed; the exam answer and the valid guided
+        # fields stay (and stay cached, so a later run starts from them too)
+        if not is_valid_guided(guided, item["mark"]):
+            guided = self.repair_guided(item, exam_answer, guided)
+
+        if not is_valid_guided(guided, item["mark"]):
+            missing = fields_to_repair(guided, item["mark"])
+            raise ValueError(f"Guided pass failed ({', '.join(missing)})")
+
+        return build_record(item, exam_answer, guided)
+
+    # ---------------- SINGLE MODE ----------------
+
+    def expand_single(self, item):
+        family = get_family(item)
+        cfg = self.config
+
+        prompt = family.single_prompt(item)
+        parsed = SINGLE_PARSERS[family.single_format](
+            self.client.complete(prompt, cfg.max_tokens_single)
+        )
+
+        # a good exam answer with broken guided fields only needs those fields
+        if (parsed and is_valid_exam_answer(parsed.get("exam_mode_answer"))
+                and not is_valid_guided(parsed, item["mark"])):
+            parsed = self.repair_guided(item, parsed["exam_mode_answer"].strip(), parsed)
+
+        error = validate_record(parsed, item["mark"])
+        if error:
+            # don't let an unparseable response stick in the cache; one with a
+            # usable exam answer stays so the next run only repairs the rest
+            if error != "Guided pass failed":
+                self.client.discard(prompt, cfg.max_tokens_single)
+            raise ValueError(error)
+
+        return build_record(item, parsed["exam_mode_answer"].strip(), parsed)
+
+    # ---------------- RUN ----------------
+
+    def run(self):
+        cfg = self.config
+        expand = self.expand_staged if cfg.mode == "staged" else self.expand_single
+
+        # seeds are streamed from the input file; only the ones still to do are kept in memory
+        state = ExpansionState(cfg.state_db, cfg.output_file)
+        total = state.register(iter_seeds(cfg.input_file))
+        migrated = (
+            state.import_legacy_checkpoint(iter_seeds(cfg.input_file), cfg.legacy_checkpoint)
+            if cfg.legacy_checkpoint else 0
+        )
+        todo = list(state.todo(iter_seeds(cfg.input_file), cfg.max_attempts))
+        seeds = dict(todo)
+
+        print(f"Starting dataset generation using {cfg.model_name} ({cfg.mode} mode)")
+        if migrated:
+            print(f"Imported legacy checkpoint: {migrated} seeds marked done")
+        print(f"Seeds to process: {len(todo)} / {total}  (state: {state.counts()})")
+        print(f"Concurrency: {cfg.concurrency}, rate limit: {cfg.requests_per_second} req/s")
+
+        # results arrive in completion order; each one is recorded on its own
+        for i, record, error in tqdm(run_concurrent(todo, expand, cfg.concurrency), total=len(todo)):
+            if error is not None:
+                state.record_failure(seeds[i], error)
+            else:
+                state.record_success(seeds[i], record)
+
+        self.client.close()
+
+        n_failed = state.export_failed(cfg.failed_file)
+        print(f"Done: {state.counts()}, failed seeds written: {n_failed}")
+        if self.repairs:
+            print(f"Field repairs: {dict(self.repairs)}")
+        state.close()
+
+        if self.cache:
+            print(f"Response cache: {self.cache.summary()}")
+            self.cache.close()
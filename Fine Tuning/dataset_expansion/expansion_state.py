@@ -0,0 +1,196 @@
+# Per-seed progress store for the expansion scripts (replaces checkpoint.txt).
+#
+# Every seed gets a row keyed by a hash of its content, holding
+# pending/writing/done/failed status, attempts, last error and the byte
+# offset of its line in the output JSONL.
+#
+# Output lines are written exactly once with a two-phase write:
+#   1. mark the seed "writing" with the current end-of-file offset
+#   2. append + fsync the line
+#   3. mark it "done"
+# If the process dies between 1 and 3, the next open() truncates the output
+# back to the recorded offset and puts the seed back to pending, so a crash
+# can never leave a duplicate (or half-written) record behind.
+
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import time
+
+PENDING = "pending"
+WRITING = "writing"
+DONE = "done"
+FAILED = "failed"
+
+
+# bookkeeping added by dedup_seeds.py, not part of the seed: a seed keeps
+# its key whether or not it went through dedup
+UNHASHED_FIELDS = ("occurrences",)
+
+
+def seed_key(seed):
+    """
+    Stable id for a seed, independent of its position in the input file.
+    """
+    content = {k: v for k, v in seed.items() if k not in UNHASHED_FIELDS}
+    canonical = json.dumps(content, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class ExpansionState:
+    """
+    Single-writer store: only the main thread should touch it. Workers
+    return results and main() records them.
+    """
+
+    def __init__(self, db_path, output_file):
+        self.output_file = output_file
+        self.db = sqlite3.connect(db_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS seeds (
+                key        TEXT PRIMARY KEY,
+                idx        INTEGER,
+                seed       TEXT,
+                status     TEXT NOT NULL,
+                attempts   INTEGER NOT NULL DEFAULT 0,
+                error      TEXT,
+                out_offset INTEGER,
+                out_length INTEGER,
+                updated    REAL
+            )
+        """)
+        self.db.commit()
+        self.recover()
+
+    # ---------------- RECOVERY ----------------
+
+    def recover(self):
+        """
+        Rolls back any half-finished output write from a previous run.
+        """
+        rows = self.db.execute(
+            "SELECT key, out_offset FROM seeds WHERE status = ?", (WRITING,)
+        ).fetchall()
+        if not rows:
+            return
+
+        # writes are sequential, so the earliest "writing" offset is the
+        # first byte that was never confirmed
+        offset = min(r[1] for r in rows)
+        if os.path.exists(self.output_file) and os.path.getsize(self.output_file) > offset:
+            with open(self.output_file, "r+b") as f:
+                f.truncate(offset)
+
+        self.db.executemany(
+            "UPDATE seeds SET status = ?, out_offset = NULL, updated = ? WHERE key = ?",
+            [(PENDING, time.time(), r[0]) for r in rows]
+        )
+        self.db.commit()
+        print(f"Recovered {len(rows)} interrupted write(s), output truncated to {offset} bytes")
+
+    # ---------------- REGISTRATION ----------------
+
+    def register(self, seeds):
+        """
+        Adds unseen seeds as pending. Already-known seeds keep their state,
+        so the input file can be reordered or extended between runs.
+        Accepts any iterable and returns how many seeds it saw.
+        """
+        now = time.time()
+        count = 0
+        for i, s in enumerate(seeds):
+            self.db.execute(
+                "INSERT OR IGNORE INTO seeds (key, idx, seed, status, updated) VALUES (?, ?, ?, ?, ?)",
+                (seed_key(s), i, json.dumps(s, ensure_ascii=False), PENDING, now)
+            )
+            count += 1
+        self.db.commit()
+        return count
+
+    def import_legacy_checkpoint(self, seeds, checkpoint_file):
+        """
+        One-off migration: seeds before the old integer checkpoint count as done.
+        """
+        if not os.path.exists(checkpoint_file):
+            return 0
+        if self.db.execute("SELECT 1 FROM seeds WHERE status != ? LIMIT 1", (PENDING,)).fetchone():
+            return 0
+
+        start_idx = int(open(checkpoint_file).read().strip() or 0)
+        keys = [(DONE, time.time(), seed_key(s)) for s in itertools.islice(seeds, start_idx)]
+        self.db.executemany("UPDATE seeds SET status = ?, updated = ? WHERE key = ?", keys)
+        self.db.commit()
+        return len(keys)
+
+    def todo(self, seeds, max_attempts):
+        """
+        (index, seed) pairs that still need work: pending, or failed with
+        attempts left.
+        """
+        status = dict(self.db.execute("SELECT key, status || ':' || attempts FROM seeds"))
+        seen = set()
+        for i, s in enumerate(seeds):
+            key = seed_key(s)
+            if key in seen:
+                continue
+            seen.add(key)
+            state, attempts = status.get(key, PENDING + ":0").split(":")
+            if state == PENDING or (state == FAILED and int(attempts) < max_attempts):
+                yield i, s
+
+    # ---------------- RESULTS ----------------
+
+    def record_success(self, seed, record):
+        key = seed_key(seed)
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+        with open(self.output_file, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+
+            self.db.execute(
+                "UPDATE seeds SET status = ?, out_offset = ?, attempts = attempts + 1, updated = ? WHERE key = ?",
+                (WRITING, offset, time.time(), key)
+            )
+            self.db.commit()
+
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.db.execute(
+            "UPDATE seeds SET status = ?, out_length = ?, error = NULL, updated = ? WHERE key = ?",
+            (DONE, len(line), time.time(), key)
+        )
+        self.db.commit()
+
+    def record_failure(self, seed, error):
+        self.db.execute(
+            "UPDATE seeds SET status = ?, error = ?, attempts = attempts + 1, updated = ? WHERE key = ?",
+            (FAILED, str(error), time.time(), seed_key(seed))
+        )
+        self.db.commit()
+
+    # ---------------- REPORTING ----------------
+
+    def counts(self):
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM seeds GROUP BY status"))
+
+    def export_failed(self, path):
+        """
+        Writes failed seeds in the old failed_seeds*.json format
+        ({index, seed, error}) so the failed-seed pass still works.
+        """
+        rows = self.db.execute(
+            "SELECT idx, seed, error FROM seeds WHERE status = ? ORDER BY idx", (FAILED,)
+        ).fetchall()
+        if rows:
+            failed = [{"index": i, "seed": json.loads(s), "error": e} for i, s, e in rows]
+            json.dump(failed, open(path, "w"), indent=2, ensure_ascii=False)
+        return len(rows)
+
+    def close(self):
+        self.db.close()
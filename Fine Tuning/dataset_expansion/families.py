@@ -0,0 +1,626 @@
+# Prompt families for the expansion engine.
+#
+# Every family provides prompts for both pipeline modes:
+#   staged - exam pass (raw text), then a guided pass in <TAG> format
+#   single - one call producing everything, parsed as tags or JSON
+#
+# Adding a family = write its prompt functions and call register_family().
+# A family may also pass its own repair_prompt (the field-level retry asking
+# only for the guided fields that failed); the default one fits all families.
+# Seeds pick their family through the "family" field set by
+# syllbus_family_mapping.py; unknown families fall back to "general".
+
+
+from output_parsers import GUIDED_TAGS
+
+
+class Family:
+    def __init__(self, name, exam_prompt, guided_prompt, single_prompt, single_format, repair_prompt):
+        self.name = name
+        self.exam_prompt = exam_prompt          # item -> str
+        self.guided_prompt = guided_prompt      # (item, exam_answer) -> str
+        self.single_prompt = single_prompt      # item -> str
+        self.single_format = single_format      # "tagged" | "json"
+        self.repair_prompt = repair_prompt      # (item, exam_answer, parsed, fields) -> str
+
+
+FAMILIES = {}
+
+
+def register_family(name, exam_prompt, guided_prompt, single_prompt, single_format="tagged", repair_prompt=None):
+    FAMILIES[name] = Family(
+        name, exam_prompt, guided_prompt, single_prompt, single_format,
+        repair_prompt or get_prompt_repair
+    )
+
+
+def get_family(item):
+    return FAMILIES.get(item.get("family")) or FAMILIES["general"]
+
+
+# ---------------- STAGED PROMPTS (EXAM + GUIDED) ----------------
+
+def get_prompt_math_phys_exam(item):
+    return f"""
+You are answering a Kathmandu University engineering exam question.
+
+SUBJECT: {item['subject']}
+SEMESTER: {item['semester']}
+MARKS: {item['mark']}
+
+QUESTION:
+{item['question']}
+
+ABSOLUTE RULES:
+- Write ONLY the exam answer.
+- Do NOT include headings, tags, or guided explanations.
+
+MINIMUM STRUCTURE (MANDATORY FOR ALL MARKS):
+1. State the relevant definition, law, or principle.
+2. Show reasoning, derivation, or formula usage.
+3. Conclude with a clear result or expression.
+
+DEPTH ENFORCEMENT:
+- Do NOT write only the final formula or result.
+- Even low-mark answers must show method or logic.
+- Skipping steps is NOT allowed if it harms understanding.
+
+DERIVATION FLOW (USE WHEN APPLICABLE):
+Here, its given that,
+We know,
+Now, by the definition of,
+Substituting,
+Then / Similarly,
+We get,
+Hence,
+
+MARKS HANDLING:
+- Marks control how many steps or how detailed the derivation is.
+- Marks do NOT allow omission of logic or explanation.
+
+IMPORTANT:
+- Output ONLY the answer text.
+- Do NOT add anything before or after.
+"""
+
+def get_prompt_math_phys_guided(item, exam_answer):
+    return f"""
+You are generating guided study material based on an exam answer.
+
+SUBJECT: {item['subject']}
+SEMESTER: {item['semester']}
+QUESTION:
+{item['question']}
+
+EXAM ANSWER (for reference):
+{exam_answer}
+
+CRITICAL:
+- Every tag below MUST appear exactly once.
+- Do NOT output anything outside the tags.
+- If something is not applicable, write "N/A".
+
+TASKS:
+1. Explain the concept at Beginner → Intermediate level.
+2. Generate ONE exam follow-up question.
+3. Generate THREE guided follow-up questions.
+4. Extract 4–6 syllabus-level technical keywords.
+
+----------OUTPUT FORMAT----------
+<RESULT>
+
+<EXAM_FOLLOWUP>
+...
+</EXAM_FOLLOWUP>
+
+<GUIDED_MODE>
+...
+</GUIDED_MODE>
+
+<GUIDED_FOLLOWUP>
+1. ...
+2. ...
+3. ...
+</GUIDED_FOLLOWUP>
+
+<KEYWORDS>
+term1, term2, term3, term4
+</KEYWORDS>
+
+</RESULT>
+"""
+
+def get_prompt_programming_exam(item):
+    return f"""
+You are answering a Kathmandu University programming exam question.
+
+SUBJECT: {item['subject']}
+SEMESTER: {item['semester']}
+MARKS: {item['mark']}
+
+QUESTION:
+{item['question']}
+
+ABSOLUTE RULES (DO NOT VIOLATE):
+- Write ONLY the exam answer.
+- Do NOT include headings, tags, metadata, or guided explanations.
+- Write exactly as a KU student would write in exams.
+
+DEPTH ENFORCEMENT (MANDATORY):
+- If the question asks to LIST, STATE, or NAME:
+  → EACH item MUST include a brief explanation (1–2 lines minimum).
+  → Pure listing of names is NOT allowed.
+
+- If the question asks to EXPLAIN:
+  → Give definition + working + relevance.
+  → One-line explanations are NOT allowed.
+
+- If the question asks for EXAMPLES:
+  → At least ONE correct code example is MANDATORY.
+  → Examples must directly match the concept being explained.
+
+MARKS HANDLING (IMPORTANT):
+- Marks determine HOW MANY examples or how detailed the explanation is.
+- Marks do NOT reduce the minimum explanation depth.
+- Even 2–3 mark answers must explain concepts clearly.
+
+CODE RULES:
+- Use C / C++ syntax where applicable.
+- Code must be minimal, correct, and relevant.
+- Inline comments are allowed if they improve clarity.
+
+SPECIAL RULE — COMPARISON QUESTIONS:
+- If the question asks to compare, differentiate, or distinguish:
+  → Answer MUST be in TABULAR FORM.
+  → Use plain text table with clear column headers.
+  → No paragraph-style comparison allowed.
+
+IMPORTANT:
+- Output ONLY the answer text.
+- Do NOT add anything before or after.
+"""
+
+def get_prompt_programming_guided(item, exam_answer):
+    return f"""
+You are generating guided study material based on an exam answer.
+
+SUBJECT: {item['subject']}
+SEMESTER: {item['semester']}
+QUESTION:
+{item['question']}
+
+EXAM ANSWER (for reference):
+{exam_answer}
+
+CRITICAL:
+- Every tag below MUST appear exactly once.
+- Do NOT output anything outside the tags.
+- If something is not applicable, write "N/A".
+
+TASKS:
+1. Explain the concept at Beginner → Intermediate level.
+2. Generate ONE exam follow-up question.
+3. Generate THREE guided follow-up questions.
+4. Extract 4–6 syllabus-level technical keywords.
+
+----------OUTPUT FORMAT----------
+<RESULT>
+
+<EXAM_FOLLOWUP>
+...
+</EXAM_FOLLOWUP>
+
+<GUIDED_MODE>
+...
+</GUIDED_MODE>
+
+<GUIDED_FOLLOWUP>
+1. ...
+2. ...
+3. ...
+</GUIDED_FOLLOWUP>
+
+<KEYWORDS>
+term1, term2, term3, term4
+</KEYWORDS>
+
+</RESULT>
+"""
+
+def get_prompt_design_exam(item):
+    return f"""
+You are answering a Kathmandu University engineering drawing / design exam question.
+
+SUBJECT: {item['subject']}
+SEMESTER: {item['semester']}
+MARKS: {item['mark']}
+PAPER TYPE: {item.get('paper_type', 'N/A')}
+SECTION: {item.get('section', 'N/A')}
+
+QUESTION:
+{item['question']}
+
+ABSOLUTE RULES:
+- Write ONLY the exam answer.
+- Do NOT include headings, tags, or guided explanations.
+- Do NOT draw diagrams.
+
+DEPTH ENFORCEMENT (MANDATORY):
+- Every step, rule, standard, or convention mentioned MUST be briefly explained.
+- Do NOT list steps or standards without stating their purpose.
+
+MARKS HANDLING:
+- Marks decide number of steps or comparisons.
+- Marks do NOT remove the need for explanation.
+
+SPECIAL RULE — COMPARISON QUESTIONS:
+- If the question asks to compare, differentiate, or distinguish:
+  → Answer MUST be in TABULAR FORM.
+  → Use clear column headings.
+  → No paragraph-style comparison.
+
+IMPORTANT:
+- Output ONLY the answer text.
+- Do NOT add anything before or after.
+"""
+
+def get_prompt_design_guided(item, exam_answer):
+    return f"""
+You are generating guided study material based on an exam answer.
+
+SUBJECT: {item['subject']}
+SEMESTER: {item['semester']}
+QUESTION:
+{item['question']}
+
+EXAM ANSWER (for reference):
+{exam_answer}
+
+CRITICAL:
+- Every tag below MUST appear exactly once.
+- Do NOT output anything outside the tags.
+- If something is not applicable, write "N/A".
+
+TASKS:
+1. Explain the task at Beginner → Intermediate level.
+2. Generate ONE exam follow-up question.
+3. Generate THREE guided follow-up questions.
+4. Extract 4–6 syllabus-level technical keywords.
+
+----------OUTPUT FORMAT----------
+<RESULT>
+
+<EXAM_FOLLOWUP>
+...
+</EXAM_FOLLOWUP>
+
+<GUIDED_MODE>
+...
+</GUIDED_MODE>
+
+<GUIDED_FOLLOWUP>
+1. ...
+2. ...
+3. ...
+</GUIDED_FOLLOWUP>
+
+<KEYWORDS>
+term1, term2, term3, term4
+</KEYWORDS>
+
+</RESULT>
+"""
+
+
+# ---------------- SINGLE-PASS PROMPTS ----------------
+
+def get_prompt_math_phys_single(item):
+    return f"""
+You are generating study material for Kathmandu University engineering students.
+
+SUBJECT: {item['subject']}
+SEMESTER: {item['semester']}
+MARKS: {item['mark']}
+
+QUESTION:
+{item['question']}
+
+----------EXAM MODE INSTRUCTIONS----------
+Write the answer exactly as a KU student would write in exams.
+
+Rules:
+- Optimize strictly for {item['mark']} marks.
+- No unnecessary theory.
+- Clear derivations and numericals when required.
+- Mention assumptions ONLY if they earn marks.
+- Do NOT reference figures; describe steps instead.
+
+For numericals / derivations, follow this flow whenever applicable:
+- Here, its given that,
+- We know,
+- Now, by the definition of,
+- Substituting,
+- Similarly / Then,
+- We get,
+- Hence,
+
+----------GUIDED MODE----------
+Teach the same concept at Beginner → Intermediate level.
+
+Rules:
+- Explain physical or geometric intuition first.
+- Then explain mathematics step by step.
+- Assume the student is learning this for the first time.
+- It is OK if guided mode is longer than exam mode.
+
+----------FOLLOW-UP QUESTIONS----------
+Exam follow-up:
+- ONE question only.
+- More complex OR next syllabus topic.
+
+Guided follow-up:
+- THREE questions:
+  1. Check understanding of the core principle.
+  2. Identify key variables / assumptions.
+  3. Bridge intuition to mathematics.
+
+----------OUTPUT FORMAT (STRICT TAGS)----------
+<RESULT>
+<SUBJECT>{item['subject']}</SUBJECT>
+<QUESTION>{item['question']}</QUESTION>
+<MARKS>{item['mark']}</MARKS>
+
+<EXAM_MODE>
+... exam-style answer ...
+</EXAM_MODE>
+
+<EXAM_FOLLOWUP>
+... exam follow-up question ...
+</EXAM_FOLLOWUP>
+
+<GUIDED_MODE>
+... guided explanation ...
+</GUIDED_MODE>
+
+<GUIDED_FOLLOWUP>
+1. ...
+2. ...
+3. ...
+</GUIDED_FOLLOWUP>
+
+<KEYWORDS>
+keyword1, keyword2, keyword3, keyword4, keyword5
+</KEYWORDS>
+</RESULT>
+
+Rules:
+- Do NOT output JSON.
+- Do NOT escape LaTeX.
+- Do NOT add text outside tags.
+"""
+
+def get_prompt_programming_single(item):
+    return f"""
+You are generating a Kathmandu University programming exam answer AND a guided tutoring answer.
+
+Subject: {item['subject']}
+Semester: {item['semester']}
+Marks: {item['mark']}
+
+Question:
+{item['question']}
+
+----------EXAM MODE INSTRUCTIONS----------
+
+- STRICTLY optimize for {item['mark']} marks.
+- Write as a KU student would in exams.
+- Correctness > verbosity.
+- Avoid unnecessary theory.
+- Use C/C++ syntax where applicable.
+- Include examples ONLY if marks justify it.
+
+----------GUIDED MODE INSTRUCTIONS----------
+
+- Level: Beginner → Intermediate.
+- Explain the idea first, then syntax.
+- Break logic into small steps.
+- Avoid assuming deep prior knowledge.
+- Guided mode may be longer than exam mode.
+
+----------FOLLOW-UP QUESTIONS----------
+
+Exam follow-up:
+- Generate EXACTLY ONE question.
+- More complex OR next syllabus topic.
+
+Guided follow-up:
+- Generate EXACTLY THREE questions:
+  1. What problem does this concept solve?
+  2. What are the main components / flow?
+  3. How does it work in an actual program?
+
+----------OUTPUT FORMAT (STRICT JSON ONLY)----------
+{{
+  "results": [{{
+    "subject": "{item['subject']}",
+    "question": "{item['question']}",
+    "keywords": ["..."],
+    "marks": {item['mark']},
+
+    "exam_mode_answer": "...",
+
+    "exam_f_question": "...",
+
+    "guided_mode_answer": "...",
+
+    "guided_f_question": "1. ...\\n2. ...\\n3. ..."
+  }}]
+}}
+
+Rules:
+- Output ONLY valid JSON.
+- No markdown outside JSON.
+- Keywords must align with syllabus terminology.
+"""
+
+def get_prompt_design_single(item):
+    return f"""
+You are generating a Kathmandu University exam answer AND a guided tutoring answer.
+
+Subject: {item['subject']}
+Semester: {item['semester']}
+Marks: {item['mark']}
+Paper Type: {item.get('paper_type', 'unknown')}
+Section: {item.get('section', 'unknown')}
+
+Question:
+{item['question']}
+
+----------EXAM MODE INSTRUCTIONS----------
+- STRICTLY optimize for {item['mark']} marks.
+- Write exactly as a KU student would in exams.
+- Be structured and concise.
+- Do NOT attempt to draw diagrams.
+- Explain steps, standards, or conventions instead.
+
+----------GUIDED MODE INSTRUCTIONS----------
+- Level: Beginner → Intermediate.
+- Explain the purpose first, then the procedure.
+- Break explanations into clear steps.
+- Avoid unnecessary technical depth.
+
+----------FOLLOW-UP QUESTIONS----------
+Exam follow-up:
+- Generate EXACTLY ONE question.
+- More complex OR next syllabus task.
+
+----------Guided follow-up:----------
+- Generate EXACTLY THREE questions:
+  1. Why is this concept / step important?
+  2. What are the main rules or conventions?
+  3. How is it applied in practice or exams?
+
+----------OUTPUT FORMAT (STRICT JSON ONLY)----------
+{{
+  "results": [{{
+    "subject": "{item['subject']}",
+    "question": "{item['question']}",
+    "keywords": ["..."],
+    "marks": {item['mark']},
+
+    "exam_mode_answer": "...",
+
+    "exam_f_question": "...",
+
+    "guided_mode_answer": "...",
+
+    "guided_f_question": "1. ...\\n2. ...\\n3. ..."
+  }}]
+}}
+
+Rules:
+- Output ONLY valid JSON object.
+- Keywords must match syllabus language.
+- Newlines inside strings are allowed.
+- Do NOT include markdown.
+- Do NOT include text outside JSON.
+"""
+
+# ---------------- GENERAL FAMILY (FALLBACK) ----------------
+# Subjects without a dedicated family (see FAMILY_MAP in syllbus_family_mapping.py)
+
+def get_prompt_general_exam(item):
+    return f"""
+You are answering a Kathmandu University exam question.
+
+SUBJECT: {item['subject']}
+SEMESTER: {item['semester']}
+MARKS: {item['mark']}
+
+QUESTION:
+{item['question']}
+
+ABSOLUTE RULES:
+- Write ONLY the exam answer.
+- Do NOT include headings, tags, or guided explanations.
+- Write exactly as a KU student would write in exams.
+
+DEPTH ENFORCEMENT:
+- Define the key terms before using them.
+- Every point listed MUST be briefly explained.
+- One-line answers are NOT allowed.
+
+MARKS HANDLING:
+- Marks decide how many points or how much detail to include.
+- Marks do NOT remove the need for explanation.
+
+IMPORTANT:
+- Output ONLY the answer text.
+- Do NOT add anything before or after.
+"""
+
+
+def get_prompt_general_guided(item, exam_answer):
+    return get_prompt_math_phys_guided(item, exam_answer)
+
+
+def get_prompt_general_single(item):
+    return get_prompt_math_phys_single(item)
+
+
+# ---------------- REPAIR PROMPT (FIELD-LEVEL RETRY) ----------------
+
+REPAIR_TASKS = {
+    "guided_mode_answer": "Explain the concept at Beginner → Intermediate level.",
+    "exam_f_question": "Generate ONE exam follow-up question.",
+    "guided_f_question": "Generate THREE guided follow-up questions, numbered 1. 2. 3.",
+    "keywords": "Extract 4–6 syllabus-level technical keywords, comma separated."
+}
+
+
+def get_prompt_repair(item, exam_answer, parsed, fields):
+    """
+    Asks only for `fields` (record field names); the exam answer and a
+    guided explanation that already passed are given as context.
+    """
+    explanation = ""
+    if "guided_mode_answer" not in fields and parsed.get("guided_mode_answer"):
+        explanation = f"\nGUIDED EXPLANATION (already written):\n{parsed['guided_mode_answer']}\n"
+
+    tasks = "\n".join(f"{i}. {REPAIR_TASKS[f]}" for i, f in enumerate(fields, 1))
+    blocks = "\n\n".join(f"<{GUIDED_TAGS[f]}>\n...\n</{GUIDED_TAGS[f]}>" for f in fields)
+
+    return f"""
+You are completing guided study material based on an exam answer.
+Only the parts listed below are missing; do NOT rewrite anything else.
+
+SUBJECT: {item['subject']}
+SEMESTER: {item['semester']}
+QUESTION:
+{item['question']}
+
+EXAM ANSWER (for reference):
+{exam_answer}
+{explanation}
+CRITICAL:
+- Output ONLY the tags below, each exactly once.
+- Do NOT output anything outside the tags.
+
+TASKS:
+{tasks}
+
+----------OUTPUT FORMAT----------
+<RESULT>
+
+{blocks}
+
+</RESULT>
+"""
+
+
+# ---------------- REGISTRY ----------------
+
+register_family("math_phys", get_prompt_math_phys_exam, get_prompt_math_phys_guided, get_prompt_math_phys_single, "tagged")
+register_family("programming", get_prompt_programming_exam, get_prompt_programming_guided, get_prompt_programming_single, "json")
+register_family("design", get_prompt_design_exam, get_prompt_design_guided, get_prompt_design_single, "json")
+register_family("general", get_prompt_general_exam, get_prompt_general_guided, get_prompt_general_single, "tagged")
@@ -0,0 +1,300 @@
+"""
+Whole-corpus QA for the expanded dataset, run before splitting.
+
+Loads the JSONL into one DataFrame and computes every check as a column
+operation over all records at once:
+
+  validity   the expansion engine's rules (exam answer >= 15 chars, guided
+             answer + follow-up present, exam follow-up for >= 4 marks)
+             plus leftover <TAG>s, unbalanced LaTeX, LaTeX mangled by JSON
+             escapes ("\text" -> TAB + "ext"), leaked meta comments
+  lengths    chars/words per answer field, exam length by marks
+  marks      distribution, missing values
+  keywords   share of each record's keywords that appear in its answers
+  duplicates same (subject, normalised question) / same exam answer
+
+    python dataset_qa.py --input expanded_dataset.jsonl --report qa_report.json
+
+Only the structural rules (the engine's own ones and leftover tags) make a
+record invalid; the content rules are reported as warnings. final_splitter.py
+runs the same checks and refuses to split when the invalid or duplicate
+rate is over its threshold. ~10s for 100k records, most of it JSON parsing
+and C++ regex passes.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+TEXT_FIELDS = [
+    "subject", "question", "exam_mode_answer", "exam_f_question",
+    "guided_mode_answer", "guided_f_question"
+]
+ANSWER_FIELDS = ["exam_mode_answer", "exam_f_question", "guided_mode_answer", "guided_f_question"]
+
+MIN_EXAM_CHARS = 15          # is_valid_exam_answer
+EXAM_FOLLOWUP_MIN_MARKS = 4  # is_valid_guided
+
+# records breaking these can't train (empty or missing fields) and count
+# towards the gate; the other rules are content warnings, reported only
+BLOCKING_RULES = ["missing_question", "exam_too_short", "guided_missing", "exam_followup_missing", "leftover_tags"]
+
+MAX_INVALID_RATE = 0.05
+MAX_DUPLICATE_RATE = 0.10
+EXAMPLES_PER_RULE = 20
+
+LEFTOVER_TAG = r"</?[A-Z][A-Z_]{2,}>"
+# the generator's own commentary, e.g. "This is likely a Long question (5+ marks)."
+META_COMMENT = r"(?i)this is (?:likely )?an? (?:long|short|medium)\b[^.\n]{0,30}question|as an ai\b"
+# a LaTeX command whose backslash was read as a JSON escape: "\text" -> TAB + "ext"
+ESCAPE_DAMAGE = r"[\x09\x0c\x08\x0d](?:ext|imes|heta|rac|eta|ight|ho|ightarrow|f)\b|\n(?:abla|eq|u)\b"
+
+# pyarrow-backed strings run the regexes below in C++ (RE2, hence no lookbehind)
+STRING_DTYPE = pd.StringDtype("pyarrow")
+
+
+# ---------------- LOADING ----------------
+
+def load_frame(path):
+    """
+    One row per valid JSON object line; returns (frame, malformed line count).
+    The "line" column keeps the 1-based line number for the report.
+    """
+    records, lines, malformed = [], [], 0
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                malformed += 1
+                continue
+            if not isinstance(record, dict):
+                malformed += 1
+                continue
+            records.append(record)
+            lines.append(n)
+
+    df = pd.DataFrame.from_records(records)
+    for field in TEXT_FIELDS:
+        column = df[field] if field in df else pd.Series(index=df.index, dtype=object)
+        df[field] = column.where(column.map(type) == str, "").astype(STRING_DTYPE).str.strip()
+    marks = df["marks"] if "marks" in df else df.get("mark", pd.Series(index=df.index, dtype=float))
+    # float: seeds have half-mark questions (2.5)
+    df["marks"] = pd.to_numeric(marks, errors="coerce").astype("Float64")
+    keywords = df["keywords"] if "keywords" in df else pd.Series(index=df.index, dtype=object)
+    df["keywords"] = keywords.apply(lambda k: k if isinstance(k, list) else [])
+    df["line"] = lines
+    return df, malformed
+
+
+# ---------------- CHECKS ----------------
+
+def latex_unbalanced(text):
+    """
+    Odd number of unescaped $, or \\( \\) / \\[ \\] / { } counts that don't pair up.
+    """
+    return (
+        ((text.str.count(r"\$") - text.str.count(r"\\\$")) % 2 == 1)
+        | (text.str.count(r"\\\(") != text.str.count(r"\\\)"))
+        | (text.str.count(r"\\\[") != text.str.count(r"\\\]"))
+        | (text.str.count(r"\{") != text.str.count(r"\}"))
+    )
+
+
+def validity_rules(df):
+    """
+    Boolean frame, one column per rule, True where the record breaks it.
+    """
+    joined = df[ANSWER_FIELDS[0]]
+    for field in ANSWER_FIELDS[1:]:
+        joined = joined + "\n" + df[field]
+    return pd.DataFrame({
+        "missing_question": df["question"].str.len() == 0,
+        "exam_too_short": df["exam_mode_answer"].str.len() < MIN_EXAM_CHARS,
+        "guided_missing": (df["guided_mode_answer"].str.len() == 0) | (df["guided_f_question"].str.len() == 0),
+        "exam_followup_missing": (df["marks"].fillna(0) >= EXAM_FOLLOWUP_MIN_MARKS).to_numpy(bool)
+                                 & (df["exam_f_question"].str.len() == 0),
+        "leftover_tags": joined.str.contains(LEFTOVER_TAG, regex=True),
+        "latex_unbalanced": latex_unbalanced(joined),
+        "latex_escape_damage": joined.str.contains(ESCAPE_DAMAGE, regex=True),
+        "meta_comment": joined.str.contains(META_COMMENT, regex=True),
+    })
+
+
+def length_stats(lengths):
+    lengths = lengths[lengths > 0]
+    if lengths.empty:
+        return {"count": 0}
+    q = lengths.quantile([0.05, 0.5, 0.95])
+    return {
+        "count": int(lengths.size),
+        "mean": round(float(lengths.mean()), 1),
+        "p05": int(q[0.05]),
+        "p50": int(q[0.5]),
+        "p95": int(q[0.95]),
+        "max": int(lengths.max()),
+    }
+
+
+def keyword_coverage(df):
+    """
+    Per record: share of its keywords found (case-insensitive) in its answers.
+    NaN for records without keywords.
+    """
+    pairs = df[["keywords"]].explode("keywords").dropna()
+    pairs = pairs[pairs["keywords"].astype(str).str.strip() != ""]
+    if pairs.empty:
+        return pd.Series(np.nan, index=df.index)
+    text = (df["exam_mode_answer"] + "\n" + df["guided_mode_answer"]).str.lower()
+    keyword = pairs["keywords"].astype(str).str.strip().str.lower()
+    found = pd.Series(
+        [k in t for k, t in zip(keyword.to_numpy(), text.loc[pairs.index].to_numpy())],
+        index=pairs.index,
+    )
+    return found.groupby(level=0).mean().reindex(df.index)
+
+
+def normalized(text):
+    # one regex pass: punctuation and whitespace runs both become a single space
+    return text.str.lower().str.replace(r"[\W_]+", " ", regex=True).str.strip()
+
+
+def duplicate_flags(df):
+    subject = df["subject"].str.replace(r"\s+", "", regex=True).str.upper()
+    question = normalized(df["question"])
+    exam = normalized(df["exam_mode_answer"])
+    return pd.DataFrame({
+        "duplicate_question": (question != "") & pd.DataFrame({"s": subject, "q": question}).duplicated(keep="first"),
+        "duplicate_exam_answer": (exam != "") & exam.duplicated(keep="first"),
+    })
+
+
+# ---------------- REPORT ----------------
+
+def build_report(path):
+    start = time.perf_counter()
+    df, malformed = load_frame(path)
+    total = len(df)
+    rules = validity_rules(df)
+    dups = duplicate_flags(df)
+    coverage = keyword_coverage(df)
+
+    invalid = rules[BLOCKING_RULES].any(axis=1)
+    warned = rules.drop(columns=BLOCKING_RULES).any(axis=1)
+    duplicate = dups.any(axis=1)
+
+    def examples(mask):
+        return df.loc[mask, "line"].head(EXAMPLES_PER_RULE).tolist()
+
+    def rate(n):
+        return round(n / total, 4) if total else 0.0
+
+    marks = df["marks"]
+    by_marks = {
+        f"{m:g}": length_stats(group.str.len())
+        for m, group in df.loc[marks.notna(), "exam_mode_answer"].groupby(marks.dropna())
+    }
+
+    return {
+        "input": str(path),
+        "records": total,
+        "malformed_lines": malformed,
+        "invalid_records": int(invalid.sum()),
+        "invalid_rate": rate(int(invalid.sum())),
+        "records_with_warnings": int(warned.sum()),
+        "duplicate_records": int(duplicate.sum()),
+        "duplicate_rate": rate(int(duplicate.sum())),
+        "rules": {
+            name: {
+                "blocking": name in BLOCKING_RULES,
+                "count": int(rules[name].sum()),
+                "rate": rate(int(rules[name].sum())),
+                "lines": examples(rules[name]),
+            }
+            for name in rules.columns
+        },
+        "duplicates": {
+            name: {"count": int(dups[name].sum()), "rate": rate(int(dups[name].sum())), "lines": examples(dups[name])}
+            for name in dups.columns
+        },
+        "lengths_chars": {field: length_stats(df[field].str.len()) for field in ANSWER_FIELDS},
+        "lengths_words": {field: length_stats(df[field].str.count(r"\S+")) for field in ANSWER_FIELDS},
+        "exam_chars_by_marks": by_marks,
+        "marks": {
+            "missing": int(marks.isna().sum()),
+            "distribution": {f"{k:g}": int(v) for k, v in marks.value_counts().sort_index().items()},
+        },
+        "subjects": {k: int(v) for k, v in df["subject"].value_counts().items()},
+        "keywords": {
+            "records_without_keywords": int(coverage.isna().sum()),
+            "mean_coverage": round(float(coverage.mean()), 3) if coverage.notna().any() else None,
+            "records_below_half_coverage": int((coverage < 0.5).sum()),
+        },
+        "took_s": round(time.perf_counter() - start, 2),
+    }
+
+
+def gate(report, max_invalid_rate=MAX_INVALID_RATE, max_duplicate_rate=MAX_DUPLICATE_RATE):
+    """
+    Reasons the dataset shouldn't be split (empty list = OK).
+    """
+    failures = []
+    if report["records"] == 0:
+        failures.append("no valid records")
+    if report["invalid_rate"] > max_invalid_rate:
+        blocking = [(name, r) for name, r in report["rules"].items() if r["blocking"]]
+        worst = sorted(blocking, key=lambda kv: -kv[1]["count"])[:3]
+        detail = ", ".join(f"{name}={r['count']}" for name, r in worst if r["count"])
+        failures.append(f"invalid rate {report['invalid_rate']:.2%} > {max_invalid_rate:.2%} ({detail})")
+    if report["duplicate_rate"] > max_duplicate_rate:
+        failures.append(f"duplicate rate {report['duplicate_rate']:.2%} > {max_duplicate_rate:.2%}")
+    return failures
+
+
+def write_report(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+def print_summary(report):
+    print(f"QA: {report['records']} records, {report['malformed_lines']} malformed line(s) in {report['took_s']}s")
+    print(f"  invalid    {report['invalid_records']:>6}  ({report['invalid_rate']:.2%})")
+    for name, r in report["rules"].items():
+        if r["count"] and r["blocking"]:
+            print(f"    {name:<22} {r['count']:>6}")
+    print(f"  warnings   {report['records_with_warnings']:>6}")
+    for name, r in report["rules"].items():
+        if r["count"] and not r["blocking"]:
+            print(f"    {name:<22} {r['count']:>6}")
+    print(f"  duplicates {report['duplicate_records']:>6}  ({report['duplicate_rate']:.2%})")
+    cov = report["keywords"]["mean_coverage"]
+    print(f"  keyword coverage {cov if cov is not None else 'n/a'}, marks missing {report['marks']['missing']}")
+
+
+# ---------------- MAIN ----------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorised QA report for an expanded dataset")
+    parser.add_argument("--input", default="expanded_dataset.jsonl")
+    parser.add_argument("--report", default="qa_report.json")
+    parser.add_argument("--max-invalid-rate", type=float, default=MAX_INVALID_RATE)
+    parser.add_argument("--max-duplicate-rate", type=float, default=MAX_DUPLICATE_RATE)
+    args = parser.parse_args()
+
+    report = build_report(args.input)
+    write_report(report, args.report)
+    print_summary(report)
+    print(f"Report: {args.report}")
+
+    failures = gate(report, args.max_invalid_rate, args.max_duplicate_rate)
+    for failure in failures:
+        print(f"  FAIL {failure}")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
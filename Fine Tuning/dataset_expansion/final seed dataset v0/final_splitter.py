@@ -1,116 +1,285 @@
+"""
+Splits expanded_dataset.jsonl into the four LoRA datasets (exam, exam
+follow-up, guided, guided follow-up), optionally with train/validation/test
+splits stratified by (subject, marks).
+
+    python final_splitter.py --input expanded_dataset.jsonl --output-dir splitted_datasets
+    python final_splitter.py --splits 0.9 0.05 0.05 --workers 4
+
+Records are read in chunks and rendered in worker processes; results come
+back in input order and are written as they arrive, so memory stays flat.
+Each record is parsed and stripped once, then every template is rendered
+from the same fields. A record's outputs always land in the same split, so
+nothing leaks between train and eval.
+
+Train files keep the original names (exam_lora.jsonl, ...); validation and
+test go to exam_lora.validation.jsonl / exam_lora.test.jsonl.
+
+Before splitting, dataset_qa.py profiles the whole input and writes
+qa_report.json to the output directory; the split is refused when the
+invalid or duplicate rate is over --max-invalid-rate / --max-duplicate-rate
+(--skip-qa to bypass).
+"""
+import argparse
 import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
 
-# -------- CONFIG --------
-INPUT_FILE = "expanded_dataset.jsonl"   #777-record file
-OUTPUT_DIR = Path("splitted_datasets")
+# -------- TEMPLATES --------
+# One entry per output dataset. `requires` fields must be non-empty; the
+# strings are str.format()-ed with the stripped record fields.
+# Override with --templates path/to/templates.json (same shape).
+TEMPLATES = [
+    {
+        "name": "exam_lora",
+        "requires": ["question", "exam_mode_answer"],
+        "instruction": (
+            "You are an exam-answering assistant. "
+            "Write an answer appropriate for a {marks}-mark question. "
+            "Be clear, correct, and concise. Do not add follow-up questions."
+        ),
+        "input": "Subject: {subject}\nMarks: {marks}\nQuestion: {question}",
+        "output": "{exam_mode_answer}"
+    },
+    {
+        "name": "exam_followup_lora",
+        "requires": ["exam_f_question", "exam_mode_answer"],
+        "instruction": (
+            "Generate exam-style follow-up questions that test understanding "
+            "of the given answer. Do not provide answers."
+        ),
+        "input": (
+            "Subject: {subject}\nOriginal Marks: {marks}\n"
+            "Original Question: {question}\nExam Answer: {exam_mode_answer}"
+        ),
+        "output": "1. {exam_f_question}"
+    },
+    {
+        "name": "guided_lora",
+        "requires": ["question", "guided_mode_answer"],
+        "instruction": (
+            "You are a tutor. Explain the concept clearly and step-by-step "
+            "for learning. Use simple language and structure the explanation well."
+        ),
+        "input": "Subject: {subject}\nQuestion: {question}",
+        "output": "{guided_mode_answer}"
+    },
+    {
+        "name": "guided_followup_lora",
+        "requires": ["guided_f_question", "guided_mode_answer"],
+        "instruction": (
+            "Generate learning-focused follow-up questions based on the explanation. "
+            "Do not provide answers."
+        ),
+        "input": "Subject: {subject}\nExplanation: {guided_mode_answer}",
+        "output": "{guided_f_question}"
+    }
+]
+
+TEXT_FIELDS = [
+    "subject", "question", "exam_mode_answer", "exam_f_question",
+    "guided_mode_answer", "guided_f_question"
+]
 
-OUTPUT_DIR.mkdir(exist_ok=True)
+SPLIT_NAMES = ["train", "validation", "test"]
 
-exam_out = open(OUTPUT_DIR / "exam_lora.jsonl", "w", encoding="utf-8")
-exam_fu_out = open(OUTPUT_DIR / "exam_followup_lora.jsonl", "w", encoding="utf-8")
-guided_out = open(OUTPUT_DIR / "guided_lora.jsonl", "w", encoding="utf-8")
-guided_fu_out = open(OUTPUT_DIR / "guided_followup_lora.jsonl", "w", encoding="utf-8")
 
-# -------- HELPERS --------
-def write_jsonl(fp, obj):
-    fp.write(json.dumps(obj, ensure_ascii=False) + "\n")
+# -------- RECORD PROCESSING (worker side) --------
 
-# -------- PROCESS --------
-with open(INPUT_FILE, "r", encoding="utf-8") as f:
-    for line in f:
+def render_record(line, templates):
+    """
+    Returns (stratum, {template_name: jsonl_line}), None for blank lines and
+    (None, {}) for lines that are not valid JSON.
+    """
+    if not line.strip():
+        return None
+    try:
         record = json.loads(line)
+    except ValueError:
+        return None, {}
+
+    # strip every text field once; all templates share the result
+    fields = {k: (record.get(k) or "").strip() for k in TEXT_FIELDS}
+    fields["marks"] = record.get("marks")
+    meta = {
+        "subject": fields["subject"],
+        "marks": fields["marks"],
+        "keywords": record.get("keywords", [])
+    }
+
+    rendered = {}
+    for t in templates:
+        if all(fields[k] for k in t["requires"]):
+            rendered[t["name"]] = json.dumps({
+                "instruction": t["instruction"].format(**fields),
+                "input": t["input"].format(**fields),
+                "output": t["output"].format(**fields),
+                "meta": meta
+            }, ensure_ascii=False) + "\n"
+
+    return (fields["subject"], fields["marks"]), rendered
+
+
+def render_chunk(args):
+    lines, templates = args
+    return [render_record(line, templates) for line in lines]
+
+
+def read_chunks(path, chunk_size, templates):
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            lines = list(islice(f, chunk_size))
+            if not lines:
+                return
+            yield lines, templates
+
+
+def imap_bounded(pool, fn, iterable, window):
+    """
+    Like pool.map, but keeps at most `window` tasks submitted so the input
+    is only read as fast as the workers consume it.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# -------- STRATIFIED SPLITTING (main process) --------
+
+class StratifiedAssigner:
+    """
+    Streaming stratified split: the next record of a (subject, marks)
+    stratum goes to the split furthest below its target share, counting
+    both that stratum's deficit and the dataset-wide one. The dataset-wide
+    part carries fractional shares over from stratum to stratum, so strata
+    too small to earn a validation / test record on their own still
+    contribute one in turn; large strata stay within a record or two of the
+    targets. Deterministic for a given input order.
+    """
+
+    def __init__(self, fractions):
+        total = sum(fractions)
+        self.fractions = [f / total for f in fractions]
+        self.counts = {}
+        self.totals = [0] * len(self.fractions)
+
+    def assign(self, stratum):
+        counts = self.counts.setdefault(stratum, [0] * len(self.fractions))
+        n, n_total = sum(counts) + 1, sum(self.totals) + 1
+        deficits = [
+            (f * n - c) + (f * n_total - t)
+            for f, c, t in zip(self.fractions, counts, self.totals)
+        ]
+        split = max(range(len(deficits)), key=lambda i: (deficits[i], -i))
+        counts[split] += 1
+        self.totals[split] += 1
+        return split
+
+
+def output_path(output_dir, template_name, split):
+    if split == "train":
+        return output_dir / f"{template_name}.jsonl"
+    return output_dir / f"{template_name}.{split}.jsonl"
+
+
+# -------- MAIN --------
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Split expanded dataset into LoRA training files")
+    parser.add_argument("--input", default="expanded_dataset.jsonl")
+    parser.add_argument("--output-dir", default="splitted_datasets")
+    parser.add_argument("--templates", default=None, help="JSON file with template definitions")
+    parser.add_argument("--splits", type=float, nargs=3, default=[1.0, 0.0, 0.0],
+                        metavar=("TRAIN", "VAL", "TEST"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--skip-qa", action="store_true", help="split without the dataset QA gate")
+    parser.add_argument("--max-invalid-rate", type=float, default=None)
+    parser.add_argument("--max-duplicate-rate", type=float, default=None)
+    return parser.parse_args()
+
+
+def run_qa_gate(args, output_dir):
+    """
+    Writes the QA report next to the splits; exits if the dataset fails.
+    """
+    import dataset_qa
+
+    report = dataset_qa.build_report(args.input)
+    report_path = output_dir / "qa_report.json"
+    dataset_qa.write_report(report, report_path)
+    dataset_qa.print_summary(report)
+    print(f"QA report: {report_path.resolve()}")
+
+    failures = dataset_qa.gate(
+        report,
+        args.max_invalid_rate if args.max_invalid_rate is not None else dataset_qa.MAX_INVALID_RATE,
+        args.max_duplicate_rate if args.max_duplicate_rate is not None else dataset_qa.MAX_DUPLICATE_RATE,
+    )
+    if failures:
+        for failure in failures:
+            print(f"  FAIL {failure}")
+        raise SystemExit("Dataset failed QA, not splitting (see the report, or --skip-qa)")
+
+
+def main():
+    args = parse_args()
+
+    templates = TEMPLATES
+    if args.templates:
+        with open(args.templates, "r", encoding="utf-8") as f:
+            templates = json.load(f)
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(exist_ok=True)
+
+    if not args.skip_qa:
+        run_qa_gate(args, output_dir)
+
+    active_splits = [s for s, frac in zip(SPLIT_NAMES, args.splits) if frac > 0]
+    fractions = [frac for frac in args.splits if frac > 0]
+    assigner = StratifiedAssigner(fractions)
+
+    outputs = {
+        (t["name"], split): open(output_path(output_dir, t["name"], split), "w", encoding="utf-8")
+        for t in templates for split in active_splits
+    }
+    written = {key: 0 for key in outputs}
+    malformed = 0
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            chunks = read_chunks(args.input, args.chunk_size, templates)
+            for results in imap_bounded(pool, render_chunk, chunks, args.workers * 2):
+                for result in results:
+                    if result is None:
+                        continue
+                    stratum, rendered = result
+                    if stratum is None:
+                        malformed += 1
+                        continue
+                    split = active_splits[assigner.assign(stratum)]
+                    for name, line in rendered.items():
+                        outputs[(name, split)].write(line)
+                        written[(name, split)] += 1
+    finally:
+        for fp in outputs.values():
+            fp.close()
+
+    print("Dataset splitting complete.")
+    if malformed:
+        print(f"  skipped {malformed} malformed line(s)")
+    for (name, split), n in written.items():
+        print(f"  {name:<22} {split:<10} {n}")
+    print(f"Output directory: {output_dir.resolve()}")
+
 
-        subject = record.get("subject", "").strip()
-        question = record.get("question", "").strip()
-        marks = record.get("marks")
-        keywords = record.get("keywords", [])
-
-        # ---------- 1. EXAM LORA ----------
-        if question and record.get("exam_mode_answer"):
-            write_jsonl(exam_out, {
-                "instruction": (
-                    f"You are an exam-answering assistant. "
-                    f"Write an answer appropriate for a {marks}-mark question. "
-                    f"Be clear, correct, and concise. Do not add follow-up questions."
-                ),
-                "input": (
-                    f"Subject: {subject}\n"
-                    f"Marks: {marks}\n"
-                    f"Question: {question}"
-                ),
-                "output": record["exam_mode_answer"].strip(),
-                "meta": {
-                    "subject": subject,
-                    "marks": marks,
-                    "keywords": keywords
-                }
-            })
-
-        # ---------- 2. EXAM FOLLOW-UP LORA ----------
-        if record.get("exam_f_question") and record.get("exam_mode_answer"):
-            write_jsonl(exam_fu_out, {
-                "instruction": (
-                    "Generate exam-style follow-up questions that test understanding "
-                    "of the given answer. Do not provide answers."
-                ),
-                "input": (
-                    f"Subject: {subject}\n"
-                    f"Original Marks: {marks}\n"
-                    f"Original Question: {question}\n"
-                    f"Exam Answer: {record['exam_mode_answer'].strip()}"
-                ),
-                "output": f"1. {record['exam_f_question'].strip()}",
-                "meta": {
-                    "subject": subject,
-                    "marks": marks,
-                    "keywords": keywords
-                }
-            })
-
-        # ---------- 3. GUIDED LORA ----------
-        if question and record.get("guided_mode_answer"):
-            write_jsonl(guided_out, {
-                "instruction": (
-                    "You are a tutor. Explain the concept clearly and step-by-step "
-                    "for learning. Use simple language and structure the explanation well."
-                ),
-                "input": (
-                    f"Subject: {subject}\n"
-                    f"Question: {question}"
-                ),
-                "output": record["guided_mode_answer"].strip(),
-                "meta": {
-                    "subject": subject,
-                    "marks": marks,
-                    "keywords": keywords
-                }
-            })
-
-        # ---------- 4. GUIDED FOLLOW-UP LORA ----------
-        if record.get("guided_f_question") and record.get("guided_mode_answer"):
-            write_jsonl(guided_fu_out, {
-                "instruction": (
-                    "Generate learning-focused follow-up questions based on the explanation. "
-                    "Do not provide answers."
-                ),
-                "input": (
-                    f"Subject: {subject}\n"
-                    f"Explanation: {record['guided_mode_answer'].strip()}"
-                ),
-                "output": record["guided_f_question"].strip(),
-                "meta": {
-                    "subject": subject,
-                    "marks": marks,
-                    "keywords": keywords
-                }
-            })
-
-# -------- CLEANUP --------
-exam_out.close()
-exam_fu_out.close()
-guided_out.close()
-guided_fu_out.close()
-
-print("Dataset splitting complete.")
-print(f"Output directory: {OUTPUT_DIR.resolve()}")
+if __name__ == "__main__":
+    main()
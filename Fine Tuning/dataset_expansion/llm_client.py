@@ -0,0 +1,207 @@
+# Shared chat-completions client for the expansion scripts.
+# One pooled HTTP session, a token-bucket rate limiter that backs off on
+# 429 / Retry-After, and a thread-pool runner that tags results by index.
+#
+# The endpoint is configurable (DEEPSEEK_API_URL), so the whole thing can be
+# pointed at a local mock chat-completions server for dry runs.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ---------------- RATE LIMITER ----------------
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, at most `capacity` stored.
+    `pause()` blocks every caller until the given time (used for Retry-After).
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait_for = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+def parse_retry_after(value, default):
+    """
+    Retry-After is either delta-seconds or an HTTP date.
+    """
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+# ---------------- CLIENT ----------------
+
+class ChatClient:
+    """
+    Thread-safe wrapper around one requests.Session. Every call takes a token
+    from the shared bucket; 429/5xx responses are retried with the server's
+    Retry-After (or exponential backoff) and pause the bucket for everyone.
+
+    With a ResponseCache attached, cached responses are returned without
+    touching the network or the rate limiter.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, api_url, api_key, model, temperature,
+                 requests_per_second=2.0, burst=4, max_retries=5,
+                 timeout=120, pool_size=16, cache=None):
+        self.api_url = api_url
+        self.cache = cache
+        self.model = model
+        self.temperature = temperature
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.bucket = TokenBucket(requests_per_second, burst)
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def complete(self, prompt, max_tokens, refresh=False):
+        """
+        refresh=True skips the cache lookup (the new response still replaces
+        the cached one) - used when a cached response failed validation.
+        """
+        if self.cache and not refresh:
+            cached = self.cache.get(self.model, self.temperature, max_tokens, prompt)
+            if cached is not None:
+                return cached
+
+        content = self._post(prompt, max_tokens)
+        if self.cache:
+            self.cache.put(self.model, self.temperature, max_tokens, prompt, content)
+        return content
+
+    def discard(self, prompt, max_tokens):
+        if self.cache:
+            self.cache.discard(self.model, self.temperature, max_tokens, prompt)
+
+    def _post(self, prompt, max_tokens):
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+            "max_tokens": max_tokens
+        }
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                resp = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(2 ** attempt)
+                continue
+
+            if resp.status_code == 200:
+                return resp.json()["choices"][0]["message"]["content"]
+
+            if resp.status_code in self.RETRY_STATUSES and attempt < self.max_retries:
+                delay = parse_retry_after(resp.headers.get("Retry-After"), 2 ** attempt)
+                self.bucket.pause(delay)
+                continue
+
+            raise RuntimeError(resp.text)
+
+    def close(self):
+        self.session.close()
+
+
+# ---------------- CONCURRENT RUNNER ----------------
+
+def run_concurrent(items, worker, concurrency=8, ordered=False):
+    """
+    Runs worker(item) for (index, item) pairs on a thread pool and yields
+    (index, result, error) - error is the exception or None.
+
+    At most 2 * concurrency tasks are in flight or buffered, so huge inputs
+    don't get submitted up front. With ordered=True results are yielded in
+    input order (out-of-order completions wait in a small buffer).
+    """
+    items = iter(items)
+    window = max(1, concurrency * 2)
+    buffered = {}
+    order = []
+
+    def call(item):
+        try:
+            return worker(item), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = {}
+
+        def fill():
+            while len(in_flight) + len(buffered) < window:
+                try:
+                    index, item = next(items)
+                except StopIteration:
+                    return
+                in_flight[pool.submit(call, item)] = index
+                order.append(index)
+
+        fill()
+        next_pos = 0
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                index = in_flight.pop(fut)
+                result, error = fut.result()
+                if ordered:
+                    buffered[index] = (result, error)
+                else:
+                    yield index, result, error
+
+            if ordered:
+                while next_pos < len(order) and order[next_pos] in buffered:
+                    index = order[next_pos]
+                    result, error = buffered.pop(index)
+                    next_pos += 1
+                    yield index, result, error
+
+            fill()
@@ -0,0 +1,149 @@
+# Parsers for model outputs: the <TAG>...</TAG> format and the loose JSON the
+# single-pass programming/design prompts ask for. Everything returns the same
+# record shape as the guided parser so the engine can validate uniformly.
+#
+# Tagged outputs are read in one scan with a single precompiled pattern; the
+# parsed record also carries `.errors`, one TagError per field that was
+# missing, cut off (opened but never closed, usually max_tokens) or empty, so
+# the engine can re-request just those fields.
+
+import json
+import re
+from collections import namedtuple
+
+
+# ---------------- TAG SCANNER ----------------
+
+TAG_PATTERN = re.compile(r"<(/?)([A-Z][A-Z0-9_]*)>")
+
+# record field -> output tag
+GUIDED_TAGS = {
+    "guided_mode_answer": "GUIDED_MODE",
+    "guided_f_question": "GUIDED_FOLLOWUP",
+    "exam_f_question": "EXAM_FOLLOWUP",
+    "keywords": "KEYWORDS"
+}
+SINGLE_TAGS = {"exam_mode_answer": "EXAM_MODE", **GUIDED_TAGS}
+
+# kind: "missing" (tag never opened), "unclosed" (opened, no closing tag) or "empty"
+TagError = namedtuple("TagError", "field tag kind")
+
+
+class TaggedRecord(dict):
+    """
+    Parsed record (a plain dict to callers) plus the per-field parse errors.
+    """
+
+    def __init__(self, fields, errors):
+        super().__init__(fields)
+        self.errors = errors
+
+    def failed_fields(self):
+        return [e.field for e in self.errors]
+
+
+def scan_tags(text):
+    """
+    One pass over `text`. Returns ({tag: stripped content}, {tag: partial
+    content}) - the first complete <TAG>...</TAG> of each tag, and the tags
+    that were opened but never closed. Tags may wrap other tags (<RESULT>).
+    """
+    closed, opened = {}, {}
+    for m in TAG_PATTERN.finditer(text or ""):
+        tag = m.group(2)
+        if tag in closed:
+            continue
+        if not m.group(1):
+            opened.setdefault(tag, m.end())
+        elif tag in opened:
+            closed[tag] = text[opened.pop(tag):m.start()].strip()
+    partial = {tag: text[start:].strip() for tag, start in opened.items()}
+    return closed, partial
+
+
+def parse_tagged(text, tags):
+    """
+    {field: tag} -> TaggedRecord with every field (None when unusable) and
+    a TagError for each field that isn't there.
+    """
+    closed, partial = scan_tags(text)
+    fields, errors = {}, []
+    for field, tag in tags.items():
+        value = closed.get(tag)
+        if value is None:
+            errors.append(TagError(field, tag, "unclosed" if tag in partial else "missing"))
+        elif not value:
+            errors.append(TagError(field, tag, "empty"))
+        fields[field] = split_keywords(value) if field == "keywords" else value
+    return TaggedRecord(fields, errors)
+
+
+def extract_tag(text, tag):
+    return scan_tags(text)[0].get(tag)
+
+
+def split_keywords(keywords_raw):
+    return [k.strip() for k in keywords_raw.split(",")] if keywords_raw else []
+
+
+# ---------------- GUIDED TAG PARSER (STAGED MODE) ----------------
+
+def parse_guided_tagged(text):
+    return parse_tagged(text, GUIDED_TAGS)
+
+
+# ---------------- SINGLE-PASS TAG PARSER ----------------
+
+def parse_single_tagged(text):
+    return parse_tagged(text, SINGLE_TAGS)
+
+
+# ---------------- SINGLE-PASS JSON PARSER ----------------
+
+def try_parse_json(raw_text):
+    try:
+        return json.loads(raw_text)
+    except ValueError:
+        pass
+
+    start = raw_text.find("{")
+    end = raw_text.rfind("}") + 1
+    if start == -1 or end <= start:
+        return None
+
+    cleaned = raw_text[start:end]
+    cleaned = cleaned.replace("“", "\"").replace("”", "\"")
+    cleaned = cleaned.replace(",}", "}")
+
+    try:
+        return json.loads(cleaned)
+    except ValueError:
+        return None
+
+
+def parse_single_json(text):
+    data = try_parse_json(text)
+    if not isinstance(data, dict):
+        return None
+
+    # prompts ask for {"results": [{...}]}
+    if isinstance(data.get("results"), list) and data["results"]:
+        data = data["results"][0]
+
+    keywords = data.get("keywords") or []
+    if isinstance(keywords, str):
+        keywords = split_keywords(keywords)
+
+    return {
+        "exam_mode_answer": data.get("exam_mode_answer"),
+        "exam_f_question": data.get("exam_f_question"),
+        "guided_mode_answer": data.get("guided_mode_answer"),
+        "guided_f_question": data.get("guided_f_question"),
+        "keywords": keywords
+    }
+
+
+SINGLE_PARSERS = {
+    "tagged": parse_single_tagged,
+    "json": parse_single_json
+}
@@ -0,0 +1,190 @@
+# Persistent cache for chat-completion responses.
+#
+# Key = sha256(model, temperature, max_tokens, sha256(rendered prompt)), so a
+# prompt tweak only re-pays for the prompts whose text actually changed.
+# Entries expire after `ttl_days` and the least recently used ones are evicted
+# once the cache holds more than `max_entries`.
+#
+#   python response_cache.py stats   [--db llm_cache.db]
+#   python response_cache.py prune   [--db llm_cache.db]
+#   python response_cache.py clear   [--db llm_cache.db]
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB = "llm_cache.db"
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def cache_key(model, temperature, max_tokens, prompt):
+    parts = [model, float(temperature), int(max_tokens), prompt_hash(prompt)]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed and safe to share between worker threads.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, ttl_days=30, max_entries=50000):
+        self.ttl = ttl_days * 86400 if ttl_days else None
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key         TEXT PRIMARY KEY,
+                model       TEXT,
+                temperature REAL,
+                max_tokens  INTEGER,
+                prompt_hash TEXT,
+                response    TEXT NOT NULL,
+                created     REAL NOT NULL,
+                last_used   REAL NOT NULL,
+                hits        INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self.db.commit()
+
+    def get(self, model, temperature, max_tokens, prompt):
+        key = cache_key(model, temperature, max_tokens, prompt)
+        now = time.time()
+
+        with self.lock:
+            row = self.db.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row and self.ttl and now - row[1] > self.ttl:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.db.commit()
+                self.stats["evicted"] += 1
+                row = None
+
+            if not row:
+                self.stats["misses"] += 1
+                return None
+
+            self.db.execute(
+                "UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+            self.db.commit()
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, model, temperature, max_tokens, prompt, response):
+        key = cache_key(model, temperature, max_tokens, prompt)
+        now = time.time()
+
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, model, temperature, max_tokens, prompt_hash, response, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, temperature, max_tokens, prompt_hash(prompt), response, now, now)
+            )
+            self.db.commit()
+            self.stats["writes"] += 1
+
+            # cheap: only runs the eviction query every 100 writes
+            if self.max_entries and self.stats["writes"] % 100 == 0:
+                self._evict_lru()
+
+    def discard(self, model, temperature, max_tokens, prompt):
+        """
+        Drops one entry, e.g. a response that later failed validation.
+        """
+        with self.lock:
+            self.db.execute(
+                "DELETE FROM responses WHERE key = ?",
+                (cache_key(model, temperature, max_tokens, prompt),)
+            )
+            self.db.commit()
+
+    # ---------------- MAINTENANCE ----------------
+
+    def prune(self):
+        """
+        Removes expired entries, then trims to max_entries by LRU.
+        """
+        with self.lock:
+            removed = 0
+            if self.ttl:
+                cur = self.db.execute(
+                    "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)
+                )
+                removed += cur.rowcount
+            self.db.commit()
+            removed += self._evict_lru()
+            self.stats["evicted"] += removed
+            return removed
+
+    def _evict_lru(self):
+        # caller holds the lock
+        total = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = total - self.max_entries
+        if excess <= 0:
+            return 0
+        self.db.execute(
+            "DELETE FROM responses WHERE key IN "
+            "(SELECT key FROM responses ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self.db.commit()
+        return excess
+
+    def summary(self):
+        with self.lock:
+            entries, size, hits = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(response)), 0), COALESCE(SUM(hits), 0) FROM responses"
+            ).fetchone()
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "response_bytes": size,
+            "lifetime_hits": hits
+        }
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+# ---------------- CLI ----------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or maintain the LLM response cache")
+    parser.add_argument("command", choices=["stats", "prune", "clear"])
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--ttl-days", type=float, default=30)
+    parser.add_argument("--max-entries", type=int, default=50000)
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.db, args.ttl_days, args.max_entries)
+    if args.command == "prune":
+        print(f"Removed {cache.prune()} entries")
+    elif args.command == "clear":
+        cache.clear()
+        print("Cache cleared")
+    print(json.dumps(cache.summary(), indent=2))
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# Seed schema + lazy readers/writers shared by the merge, annotation and
+# expansion steps. Seeds are stored one JSON object per line (JSONL) so
+# nothing downstream has to json.load the whole corpus.
+
+import json
+
+# field -> (allowed types, required)
+SEED_SCHEMA = {
+    "subject": ((str,), True),
+    "question": ((str,), True),
+    "mark": ((int, float), True),
+    "paper_type": ((str,), False),
+    "section": ((str,), False),
+    "semester": ((int,), False),
+    "family": ((str,), False),
+}
+
+
+def validate_seed(item):
+    """
+    Returns a list of problems (empty if the seed is valid).
+    """
+    if not isinstance(item, dict):
+        return [f"not an object: {type(item).__name__}"]
+
+    errors = []
+    for field, (types, required) in SEED_SCHEMA.items():
+        if field not in item or item[field] is None:
+            if required:
+                errors.append(f"missing {field}")
+            continue
+        value = item[field]
+        # bool is an int subclass - never a valid mark/semester
+        if isinstance(value, bool) or not isinstance(value, types):
+            errors.append(f"{field} has type {type(value).__name__}")
+
+    if isinstance(item.get("question"), str) and not item["question"].strip():
+        errors.append("empty question")
+    return errors
+
+
+def iter_seeds(path):
+    """
+    Yields seeds one at a time. JSONL is streamed line by line; a legacy
+    .json array (merged_dataset.json, failed_seeds*.json) is loaded whole.
+    Failed-seed entries ({index, seed, error}) are unwrapped either way.
+    """
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield _unwrap(json.loads(line))
+        return
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    for item in data:
+        yield _unwrap(item)
+
+
+def _unwrap(item):
+    if isinstance(item, dict) and "seed" in item and "error" in item:
+        return item["seed"]
+    return item
+
+
+def write_jsonl_line(fp, obj):
+    fp.write(json.dumps(obj, ensure_ascii=False) + "\n")
@@ -0,0 +1,309 @@
+"""
+Tokenize-once cache + sequence packing for the LoRA trainer.
+
+The splitter's JSONL ({instruction, input, output}) is tokenized a single
+time into memory-mapped NumPy arrays, keyed by a hash of the dataset file,
+the tokenizer and the prompt template. Later runs (and every adapter in a
+multi-adapter run) just np.load(..., mmap_mode="r") the arrays.
+
+Packing puts several examples into one max_seq_length row (best-fit
+decreasing). Each example keeps its own position ids and the collator builds
+a block-diagonal causal mask, so packed examples never attend to each other,
+and prompt tokens stay masked out of the loss (-100).
+
+    python pack_dataset.py --model_name_or_path unsloth/gemma-3-12b-it-bnb-4bit \
+        --dataset_path exam_lora.jsonl --max_seq_length 1024
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import os
+
+import numpy as np
+
+PROMPT_TEMPLATE = "{instruction}\n\n{input}\n\nAnswer:\n"
+CACHE_VERSION = 1
+IGNORE_INDEX = -100
+
+
+# -----------------------------
+# Cache keys
+# -----------------------------
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def tokenizer_fingerprint(tokenizer):
+    h = hashlib.sha256()
+    h.update(type(tokenizer).__name__.encode())
+    h.update(str(tokenizer.name_or_path).encode())
+    h.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True, default=str).encode())
+    for token, idx in sorted(tokenizer.get_vocab().items(), key=lambda kv: kv[1]):
+        h.update(f"{idx}:{token}\n".encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+def cache_key(dataset_path, tokenizer, max_seq_length, template=PROMPT_TEMPLATE, add_eos=True):
+    parts = {
+        "version": CACHE_VERSION,
+        "dataset": file_sha256(dataset_path),
+        "tokenizer": tokenizer_fingerprint(tokenizer),
+        "template": hashlib.sha256(template.encode("utf-8")).hexdigest(),
+        "max_seq_length": max_seq_length,
+        "add_eos": add_eos,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:16]
+
+
+# -----------------------------
+# Tokenize once
+# -----------------------------
+def iter_batches(dataset_path, batch_size):
+    batch = []
+    with open(dataset_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                batch.append(json.loads(line))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def tokenize_file(dataset_path, tokenizer, max_seq_length, template=PROMPT_TEMPLATE,
+                  add_eos=True, batch_size=1000):
+    """
+    Same masking as the notebook's format_and_tokenize (prompt -> -100,
+    answer -> labels), but batched through the fast tokenizer. An EOS is
+    appended to each answer so packed examples have a clear end and the
+    adapter learns when to stop.
+    """
+    eos = [tokenizer.eos_token_id] if add_eos and tokenizer.eos_token_id is not None else []
+    input_ids, labels, lengths = [], [], []
+
+    for batch in iter_batches(dataset_path, batch_size):
+        prompts = [template.format(instruction=r["instruction"], input=r["input"]) for r in batch]
+        answers = [r["output"] for r in batch]
+
+        prompt_ids = tokenizer(prompts, add_special_tokens=False)["input_ids"]
+        answer_ids = tokenizer(answers, add_special_tokens=False)["input_ids"]
+
+        for p, a in zip(prompt_ids, answer_ids):
+            p = p[:max_seq_length]
+            a = (a + eos)[:max(0, max_seq_length - len(p))]
+            ids = p + a
+            input_ids.append(np.asarray(ids, dtype=np.int32))
+            labels.append(np.asarray([IGNORE_INDEX] * len(p) + a, dtype=np.int32))
+            lengths.append(len(ids))
+
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return np.concatenate(input_ids), np.concatenate(labels), offsets
+
+
+def build_or_load_cache(dataset_path, tokenizer, max_seq_length, cache_dir="tokenized_cache",
+                        template=PROMPT_TEMPLATE, add_eos=True):
+    """
+    Returns the cache directory for this (dataset, tokenizer, template, length),
+    tokenizing only if it doesn't exist yet.
+    """
+    key = cache_key(dataset_path, tokenizer, max_seq_length, template, add_eos)
+    name = os.path.splitext(os.path.basename(dataset_path))[0]
+    path = os.path.join(cache_dir, f"{name}-{key}")
+
+    if os.path.exists(os.path.join(path, "meta.json")):
+        print(f"Using tokenized cache: {path}")
+        return path
+
+    print(f"Tokenizing {dataset_path} -> {path}")
+    input_ids, labels, offsets = tokenize_file(dataset_path, tokenizer, max_seq_length, template, add_eos)
+
+    tmp = path + ".tmp"
+    os.makedirs(tmp, exist_ok=True)
+    np.save(os.path.join(tmp, "input_ids.npy"), input_ids)
+    np.save(os.path.join(tmp, "labels.npy"), labels)
+    np.save(os.path.join(tmp, "offsets.npy"), offsets)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({
+            "dataset_path": dataset_path,
+            "tokenizer": tokenizer.name_or_path,
+            "max_seq_length": max_seq_length,
+            "template": template,
+            "add_eos": add_eos,
+            "examples": len(offsets) - 1,
+            "tokens": int(offsets[-1]),
+        }, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def load_cache(path):
+    """
+    Memory-mapped arrays: (input_ids, labels, offsets).
+    """
+    return tuple(
+        np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in ("input_ids", "labels", "offsets")
+    )
+
+
+# -----------------------------
+# Packing
+# -----------------------------
+def pack_lengths(lengths, max_seq_length):
+    """
+    Best-fit decreasing: returns a list of bins, each a list of example ids
+    whose total length fits in max_seq_length.
+    """
+    order = np.argsort(-np.asarray(lengths), kind="stable")
+    bins = []
+    free = []  # sorted (remaining capacity, bin id)
+
+    for idx in order:
+        length = int(lengths[idx])
+        pos = bisect.bisect_left(free, (length, -1))
+        if pos < len(free):
+            remaining, bin_id = free.pop(pos)
+            bins[bin_id].append(int(idx))
+            bisect.insort(free, (remaining - length, bin_id))
+        else:
+            bins.append([int(idx)])
+            bisect.insort(free, (max_seq_length - length, len(bins) - 1))
+    return bins
+
+
+def packing_report(lengths, bins, max_seq_length):
+    lengths = np.asarray(lengths)
+    tokens = int(lengths.sum())
+    packed_rows = len(bins)
+    return {
+        "examples": int(len(lengths)),
+        "real_tokens": tokens,
+        "unpacked_rows": int(len(lengths)),
+        "packed_rows": packed_rows,
+        "avg_fill_unpacked": round(tokens / (len(lengths) * max_seq_length), 3) if len(lengths) else 0.0,
+        "avg_fill_packed": round(tokens / (packed_rows * max_seq_length), 3) if packed_rows else 0.0,
+        # same number of real tokens in fewer forward passes
+        "expected_tokens_per_sec_gain": round(len(lengths) / packed_rows, 2) if packed_rows else 0.0,
+    }
+
+
+class PackedDataset:
+    """
+    torch-style Dataset over the memory-mapped cache. Each item is one row:
+    several examples back to back (pack=True) or a single example.
+    """
+
+    def __init__(self, cache_path, max_seq_length, pack=True):
+        self.input_ids, self.labels, self.offsets = load_cache(cache_path)
+        self.lengths = np.diff(self.offsets)
+        if pack:
+            self.rows = pack_lengths(self.lengths, max_seq_length)
+        else:
+            self.rows = [[i] for i in range(len(self.lengths))]
+        self.report = packing_report(self.lengths, self.rows, max_seq_length)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def row_length(self, i):
+        return int(sum(self.lengths[j] for j in self.rows[i]))
+
+    def __getitem__(self, i):
+        ids, labels, positions, seq_lens = [], [], [], []
+        for j in self.rows[i]:
+            start, end = int(self.offsets[j]), int(self.offsets[j + 1])
+            ids.append(np.asarray(self.input_ids[start:end]))
+            labels.append(np.asarray(self.labels[start:end]))
+            positions.append(np.arange(end - start))
+            seq_lens.append(end - start)
+        return {
+            "input_ids": np.concatenate(ids),
+            "labels": np.concatenate(labels),
+            "position_ids": np.concatenate(positions),
+            "seq_lens": seq_lens,
+        }
+
+
+class PackedCollator:
+    """
+    Pads rows to the longest in the batch and builds a block-diagonal causal
+    4D mask (0 = attend, dtype-min = blocked) so packed examples stay
+    independent with eager/sdpa attention. Also emits position_ids and the
+    token_type_ids Gemma-3 requires.
+    """
+
+    def __init__(self, pad_token_id, dtype=None, pad_to_multiple_of=None):
+        import torch
+        self.torch = torch
+        self.pad_token_id = pad_token_id
+        self.dtype = dtype or torch.float32
+        self.pad_to_multiple_of = pad_to_multiple_of
+
+    def __call__(self, features):
+        torch = self.torch
+        max_len = max(len(f["input_ids"]) for f in features)
+        if self.pad_to_multiple_of:
+            max_len = -(-max_len // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        batch = len(features)
+
+        input_ids = torch.full((batch, max_len), self.pad_token_id, dtype=torch.long)
+        labels = torch.full((batch, max_len), IGNORE_INDEX, dtype=torch.long)
+        position_ids = torch.zeros((batch, max_len), dtype=torch.long)
+        allowed = torch.zeros((batch, 1, max_len, max_len), dtype=torch.bool)
+
+        for b, f in enumerate(features):
+            n = len(f["input_ids"])
+            input_ids[b, :n] = torch.as_tensor(f["input_ids"], dtype=torch.long)
+            labels[b, :n] = torch.as_tensor(f["labels"], dtype=torch.long)
+            position_ids[b, :n] = torch.as_tensor(f["position_ids"], dtype=torch.long)
+
+            start = 0
+            for length in f["seq_lens"]:
+                end = start + length
+                allowed[b, 0, start:end, start:end] = torch.ones(length, length, dtype=torch.bool).tril()
+                start = end
+
+        # padded query rows attend to themselves only, so softmax never sees an all-masked row
+        eye = torch.eye(max_len, dtype=torch.bool).expand(batch, 1, max_len, max_len)
+        allowed = allowed | eye
+
+        attention_mask = torch.zeros(allowed.shape, dtype=self.dtype)
+        attention_mask.masked_fill_(~allowed, torch.finfo(self.dtype).min)
+
+        return {
+            "input_ids": input_ids,
+            "labels": labels,
+            "position_ids": position_ids,
+            "attention_mask": attention_mask,
+            # REQUIRED FOR GEMMA-3
+            "token_type_ids": torch.zeros_like(input_ids),
+        }
+
+
+# -----------------------------
+# CLI: build the cache and print the packing report
+# -----------------------------
+def main():
+    from transformers import AutoTokenizer
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name_or_path", type=str, required=True)
+    parser.add_argument("--dataset_path", type=str, required=True)
+    parser.add_argument("--max_seq_length", type=int, default=1024)
+    parser.add_argument("--cache_dir", type=str, default="tokenized_cache")
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model_name_or_path, trust_remote_code=True)
+    path = build_or_load_cache(args.dataset_path, tokenizer, args.max_seq_length, args.cache_dir)
+    print(json.dumps(PackedDataset(path, args.max_seq_length, pack=True).report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+import argparse
+import math
+import os
+import time
+import torch
+from torch.utils.data import DataLoader
+from transformers import (
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    TrainingArguments,
+    Trainer,
+    TrainerCallback,
+    get_scheduler,
+)
+from peft import (
+    LoraConfig,
+    get_peft_model,
+    prepare_model_for_kbit_training,
+)
+
+from pack_dataset import build_or_load_cache, PackedDataset, PackedCollator
+from length_sampler import TokenBudgetBatchSampler
+
+# -----------------------------
+# Args
+# -----------------------------
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name_or_path", type=str, required=True)
+    parser.add_argument("--dataset_path", type=str, default=None)
+    parser.add_argument("--output_dir", type=str, required=True)
+    # several adapters on one base load: --adapter exam=exam_lora.jsonl --adapter guided=guided_lora.jsonl
+    # each is saved to <output_dir>/<name>, ready for PeftModel.load_adapter(path, adapter_name=name)
+    parser.add_argument("--adapter", action="append", default=[], metavar="NAME=DATASET")
+    parser.add_argument("--schedule", choices=["sequential", "interleaved"], default="sequential",
+                        help="train adapters one after another, or alternate optimizer steps between them")
+    parser.add_argument("--num_train_epochs", type=float, default=2)
+    parser.add_argument("--learning_rate", type=float, default=2e-4)
+    parser.add_argument("--max_seq_length", type=int, default=1024)
+    # tokenized once into here, reused across runs (see pack_dataset.py)
+    parser.add_argument("--cache_dir", type=str, default="tokenized_cache")
+    parser.add_argument("--no_pack", action="store_true", help="one example per row (old behaviour)")
+    parser.add_argument("--per_device_train_batch_size", type=int, default=1)
+    parser.add_argument("--gradient_accumulation_steps", type=int, default=16)
+    # >0: length-bucketed batches of up to this many padded tokens (batch size becomes dynamic)
+    parser.add_argument("--max_tokens_per_batch", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.adapter and args.dataset_path:
+        parser.error("use either --dataset_path or --adapter, not both")
+    if not args.adapter and not args.dataset_path:
+        parser.error("one of --dataset_path or --adapter is required")
+    args.adapters = parse_adapter_specs(parser, args.adapter) if args.adapter else [("default", args.dataset_path)]
+    return args
+
+
+def parse_adapter_specs(parser, specs):
+    adapters = []
+    for spec in specs:
+        name, sep, path = spec.partition("=")
+        if not sep or not name or not path:
+            parser.error(f"--adapter expects NAME=DATASET, got {spec!r}")
+        adapters.append((name, path))
+
+    names = [name for name, _ in adapters]
+    if len(set(names)) != len(names):
+        parser.error(f"duplicate adapter names: {names}")
+    return adapters
+
+
+# -----------------------------
+# Length-bucketed batching
+# -----------------------------
+class TokenBudgetTrainer(Trainer):
+    """
+    Trainer whose train dataloader uses a TokenBudgetBatchSampler instead of
+    fixed-size batches.
+    """
+
+    def __init__(self, *args, batch_sampler=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_sampler = batch_sampler
+
+    def get_train_dataloader(self):
+        if self.batch_sampler is None:
+            return super().get_train_dataloader()
+        loader = DataLoader(
+            self.train_dataset,
+            batch_sampler=self.batch_sampler,
+            collate_fn=self.data_collator,
+            num_workers=self.args.dataloader_num_workers,
+            pin_memory=self.args.dataloader_pin_memory,
+        )
+        return self.accelerator.prepare(loader)
+
+
+class SamplerEpochCallback(TrainerCallback):
+    """
+    Reshuffles the buckets every epoch.
+    """
+
+    def __init__(self, sampler):
+        self.sampler = sampler
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self.sampler.set_epoch(int(state.epoch or 0))
+
+
+# -----------------------------
+# Throughput logging
+# -----------------------------
+class TokenCountingCollator:
+    """
+    Wraps a collator and counts real (non-padding) tokens it hands out.
+    """
+
+    def __init__(self, collator):
+        self.collator = collator
+        self.tokens = 0
+
+    def __call__(self, features):
+        self.tokens += sum(len(f["input_ids"]) for f in features)
+        return self.collator(features)
+
+
+class ThroughputCallback(TrainerCallback):
+    """
+    Adds train_tokens_per_sec (real tokens, padding excluded) to the logs,
+    so packed vs unpacked runs can be compared directly.
+    """
+
+    def __init__(self, counter):
+        self.counter = counter
+        self.start = None
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.start = time.perf_counter()
+        self.counter.tokens = 0
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if logs is None or self.start is None:
+            return
+        elapsed = time.perf_counter() - self.start
+        tokens_per_sec = round(self.counter.tokens / max(elapsed, 1e-9), 1)
+        # the default printer has already run, so record it in the history and print it here
+        if state.log_history:
+            state.log_history[-1]["train_tokens_per_sec"] = tokens_per_sec
+        print(f"step {state.global_step}: {tokens_per_sec} train tokens/sec")
+
+
+# -----------------------------
+# Per-adapter pieces
+# -----------------------------
+def load_dataset(name, dataset_path, tokenizer, args):
+    """
+    Tokenized once, memory-mapped. Every adapter shares the same tokenizer
+    fingerprint, so a second run over the same files is cache hits only.
+    """
+    cache_path = build_or_load_cache(dataset_path, tokenizer, args.max_seq_length, args.cache_dir)
+    dataset = PackedDataset(cache_path, args.max_seq_length, pack=not args.no_pack)
+    print(f"[{name}] Packing:", dataset.report)
+    return dataset
+
+
+def make_batch_sampler(name, dataset, args):
+    if not args.max_tokens_per_batch:
+        return None
+    batch_sampler = TokenBudgetBatchSampler(
+        [dataset.row_length(i) for i in range(len(dataset))],
+        max_tokens=args.max_tokens_per_batch,
+    )
+    print(f"[{name}] Bucketing:", batch_sampler.padding_report())
+    return batch_sampler
+
+
+def adapter_dir(output_dir, name):
+    # same layout PeftModel.save_pretrained uses: the default adapter at the
+    # root, named adapters in a subfolder
+    return output_dir if name == "default" else os.path.join(output_dir, name)
+
+
+# -----------------------------
+# Sequential: one Trainer per adapter
+# -----------------------------
+def train_sequential(model, adapters, args):
+    for name, dataset, collator, batch_sampler in adapters:
+        print(f"[{name}] training")
+        model.set_adapter(name)
+
+        training_args = TrainingArguments(
+            output_dir=adapter_dir(args.output_dir, name),
+            per_device_train_batch_size=args.per_device_train_batch_size,
+            gradient_accumulation_steps=args.gradient_accumulation_steps,
+            num_train_epochs=args.num_train_epochs,
+            learning_rate=args.learning_rate,
+            fp16=True,
+            logging_steps=5,
+            save_strategy="epoch",
+            save_total_limit=1,
+            report_to="none",
+            optim="paged_adamw_8bit",
+            # rows carry seq_lens for the collator, not model inputs
+            remove_unused_columns=False,
+        )
+
+        callbacks = [ThroughputCallback(collator)]
+        if batch_sampler is not None:
+            callbacks.append(SamplerEpochCallback(batch_sampler))
+
+        trainer = TokenBudgetTrainer(
+            model=model,
+            args=training_args,
+            train_dataset=dataset,
+            data_collator=collator,
+            callbacks=callbacks,
+            batch_sampler=batch_sampler,
+        )
+        trainer.train()
+
+
+# -----------------------------
+# Interleaved: alternate optimizer steps between adapters
+# -----------------------------
+class AdapterRun:
+    """
+    Dataloader, optimizer and progress for one adapter in an interleaved run.
+    """
+
+    def __init__(self, model, name, dataset, collator, batch_sampler, args):
+        self.name = name
+        self.collator = collator
+        self.batch_sampler = batch_sampler
+        if batch_sampler is not None:
+            self.loader = DataLoader(dataset, batch_sampler=batch_sampler, collate_fn=collator)
+        else:
+            self.loader = DataLoader(
+                dataset,
+                batch_size=args.per_device_train_batch_size,
+                shuffle=True,
+                collate_fn=collator,
+                generator=torch.Generator().manual_seed(42),
+            )
+
+        # set_adapter leaves only this adapter's LoRA weights trainable
+        model.set_adapter(name)
+        params = [p for p in model.parameters() if p.requires_grad]
+        self.optimizer = torch.optim.AdamW(params, lr=args.learning_rate, weight_decay=0.0)
+
+        steps_per_epoch = math.ceil(len(self.loader) / args.gradient_accumulation_steps)
+        self.total_steps = math.ceil(steps_per_epoch * args.num_train_epochs)
+        self.scheduler = get_scheduler("linear", self.optimizer, num_warmup_steps=0,
+                                       num_training_steps=self.total_steps)
+        self.scaler = torch.amp.GradScaler("cuda", enabled=torch.cuda.is_available())
+
+        self.step = 0
+        self.epoch = 0
+        self.batches = iter(self.loader)
+        self.logged_loss = 0.0
+        self.start = time.perf_counter()
+
+    def next_batch(self):
+        while True:
+            try:
+                return next(self.batches)
+            except StopIteration:
+                self.epoch += 1
+                if self.batch_sampler is not None:
+                    self.batch_sampler.set_epoch(self.epoch)
+                self.batches = iter(self.loader)
+
+    @property
+    def done(self):
+        return self.step >= self.total_steps
+
+
+def interleaved_step(model, run, args):
+    """
+    One optimizer step (gradient_accumulation_steps micro-batches) for `run`.
+    """
+    model.set_adapter(run.name)
+    device = next(p for p in model.parameters() if p.requires_grad).device
+    use_amp = device.type == "cuda"
+
+    for _ in range(args.gradient_accumulation_steps):
+        batch = {k: v.to(device) for k, v in run.next_batch().items()}
+        with torch.autocast(device_type=device.type, dtype=torch.float16, enabled=use_amp):
+            loss = model(**batch).loss / args.gradient_accumulation_steps
+        run.scaler.scale(loss).backward()
+        run.logged_loss += loss.item()
+
+    run.scaler.unscale_(run.optimizer)
+    torch.nn.utils.clip_grad_norm_([p for p in model.parameters() if p.requires_grad], 1.0)
+    run.scaler.step(run.optimizer)
+    run.scaler.update()
+    run.scheduler.step()
+    run.optimizer.zero_grad(set_to_none=True)
+    run.step += 1
+
+    if run.step % 5 == 0 or run.done:
+        elapsed = time.perf_counter() - run.start
+        steps = run.step % 5 or 5
+        print(
+            f"[{run.name}] step {run.step}/{run.total_steps}: "
+            f"loss {run.logged_loss / steps:.4f}, "
+            f"lr {run.scheduler.get_last_lr()[0]:.2e}, "
+            f"{run.collator.tokens / max(elapsed, 1e-9):.1f} train tokens/sec"
+        )
+        run.logged_loss = 0.0
+
+
+def train_interleaved(model, adapters, args):
+    """
+    Round-robin over the adapters, one optimizer step each, until every
+    adapter has done its epochs. All adapters make progress together instead
+    of the last one waiting for the rest to finish.
+    """
+    model.train()
+    runs = [AdapterRun(model, *adapter, args) for adapter in adapters]
+    while any(not run.done for run in runs):
+        for run in runs:
+            if not run.done:
+                interleaved_step(model, run, args)
+
+
+# -----------------------------
+# Main
+# -----------------------------
+def main():
+    args = parse_args()
+
+    # -----------------------------
+    # Tokenizer
+    # -----------------------------
+    tokenizer = AutoTokenizer.from_pretrained(
+        args.model_name_or_path,
+        trust_remote_code=True,
+    )
+    tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "right"
+
+    # -----------------------------
+    # Model (already 4-bit) - loaded and prepared once for every adapter
+    # -----------------------------
+    model = AutoModelForCausalLM.from_pretrained(
+        args.model_name_or_path,
+        device_map="auto",
+        trust_remote_code=True,
+    )
+
+    model.config.use_cache = False
+    model = prepare_model_for_kbit_training(model)
+    model.gradient_checkpointing_enable()
+
+    # -----------------------------
+    # LoRA (one named adapter per dataset)
+    # -----------------------------
+    lora_config = LoraConfig(
+        r=16,
+        lora_alpha=32,
+        lora_dropout=0.05,
+        target_modules=["q_proj", "k_proj", "v_proj", "o_proj"],
+        bias="none",
+        task_type="CAUSAL_LM",
+    )
+
+    names = [name for name, _ in args.adapters]
+    model = get_peft_model(model, lora_config, adapter_name=names[0])
+    for name in names[1:]:
+        model.add_adapter(name, lora_config)
+    model.print_trainable_parameters()
+
+    # -----------------------------
+    # Datasets (tokenized once, memory-mapped)
+    # -----------------------------
+    adapters = []
+    for name, dataset_path in args.adapters:
+        dataset = load_dataset(name, dataset_path, tokenizer, args)
+        collator = TokenCountingCollator(
+            PackedCollator(tokenizer.pad_token_id, dtype=model.dtype, pad_to_multiple_of=8)
+        )
+        adapters.append((name, dataset, collator, make_batch_sampler(name, dataset, args)))
+
+    # -----------------------------
+    # Training
+    # -----------------------------
+    if args.schedule == "interleaved":
+        train_interleaved(model, adapters, args)
+    else:
+        train_sequential(model, adapters, args)
+
+    for name in names:
+        model.save_pretrained(args.output_dir, selected_adapters=[name])
+        tokenizer.save_pretrained(adapter_dir(args.output_dir, name))
+        print(f"[{name}] saved to {adapter_dir(args.output_dir, name)}")
+
+    print("LoRA training finished correctly")
+
+if __name__ == "__main__":
+    main()
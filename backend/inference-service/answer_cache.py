@@ -0,0 +1,333 @@
+# Answer cache in front of generation.
+#
+# Key = (adapter, adapter version, subject, marks, normalised question).
+# Two tiers:
+#   exact     - same normalised question: one SQLite lookup
+#   semantic  - cosine similarity >= threshold against the cached questions
+#               of the same (adapter, version, subject, marks) bucket
+# Entries expire after `ttl_days`; the least recently used ones are evicted
+# once the cache holds more than `max_entries`. The adapter version is a hash
+# of the loaded LoRA weights, so deploying a new adapter retires its old
+# answers automatically (and /cache/invalidate drops them by hand).
+# Numerical questions that differ only in their values embed almost
+# identically, so a semantic hit also needs the same numbers and variable
+# assignments as the question asked.
+#
+#   python answer_cache.py stats      [--db answer_cache.db]
+#   python answer_cache.py prune      [--db answer_cache.db]
+#   python answer_cache.py invalidate exam [--db answer_cache.db]
+
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+DEFAULT_DB = "answer_cache.db"
+
+QUOTES = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"'})
+NUMBER = re.compile(r"\d+(?:[.,]\d+)*(?:e[-+]?\d+)?")
+ASSIGNMENT = re.compile(r"\b([a-z][a-z0-9_]*)\s*=\s*([^\s,;]+)")
+
+
+def normalize_question(question):
+    """
+    Case, whitespace, curly quotes and trailing ?/./! don't change the question.
+    """
+    text = unicodedata.normalize("NFKC", question).translate(QUOTES).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?.! ").strip()
+
+
+def numeric_signature(question):
+    """
+    The numbers (in order) and `name = value` assignments of a normalised
+    question: "m = 2 kg, v = 3 m/s" and "m = 5 kg, v = 3 m/s" differ here.
+    """
+    return NUMBER.findall(question), sorted(ASSIGNMENT.findall(question))
+
+
+def normalize_subject(subject):
+    return re.sub(r"\s+", "", subject or "").upper()
+
+
+def cache_key(adapter, version, subject, marks, question):
+    parts = [adapter, version, normalize_subject(subject), marks, normalize_question(question)]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+class Embedder:
+    """
+    Mean-pooled, L2-normalised sentence embeddings on CPU (same recipe as the
+    OCR service's search index).
+    """
+
+    def __init__(self, model_name, max_length=128):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).to("cpu").eval()
+        self.max_length = max_length
+
+    def encode(self, text):
+        torch = self.torch
+        with torch.inference_mode():
+            enc = self.tokenizer([text], truncation=True, max_length=self.max_length, return_tensors="pt")
+            hidden = self.model(**enc).last_hidden_state
+            mask = enc["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            return torch.nn.functional.normalize(pooled, dim=-1)[0].numpy().astype(np.float32)
+
+
+class AnswerCache:
+    """
+    SQLite-backed and safe to share between threads. The semantic tier keeps
+    one embedding matrix per bucket in memory, loaded on first use.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, ttl_days=30, max_entries=20000, threshold=0.92, embedder=None):
+        self.ttl = ttl_days * 86400 if ttl_days else None
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.embedder = embedder
+        self.versions = {}
+        self.buckets = {}  # (adapter, version, subject, marks) -> (keys, matrix)
+        self.lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "semantic_value_mismatches": 0, "misses": 0,
+                      "writes": 0, "evicted": 0, "invalidated": 0, "ms_saved": 0.0}
+
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key         TEXT PRIMARY KEY,
+                adapter     TEXT NOT NULL,
+                version     TEXT NOT NULL,
+                subject     TEXT NOT NULL,
+                marks       INTEGER,
+                question    TEXT NOT NULL,
+                answer      TEXT NOT NULL,
+                embedding   BLOB,
+                gen_ms      REAL NOT NULL,
+                created     REAL NOT NULL,
+                last_used   REAL NOT NULL,
+                hits        INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS answers_bucket ON answers(adapter, version, subject, marks)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers(last_used)")
+        self.db.commit()
+
+    # ---------------- ADAPTER VERSIONS ----------------
+
+    def set_adapter_version(self, adapter, version):
+        """
+        Registers the version of a loaded adapter and drops answers cached
+        for any other version of it.
+        """
+        with self.lock:
+            self.versions[adapter] = version
+            cur = self.db.execute("DELETE FROM answers WHERE adapter = ? AND version != ?", (adapter, version))
+            self.db.commit()
+            self.stats["invalidated"] += cur.rowcount
+            self._drop_buckets(adapter)
+
+    def invalidate(self, adapter):
+        with self.lock:
+            cur = self.db.execute("DELETE FROM answers WHERE adapter = ?", (adapter,))
+            self.db.commit()
+            self.stats["invalidated"] += cur.rowcount
+            self._drop_buckets(adapter)
+            return cur.rowcount
+
+    def _drop_buckets(self, adapter):
+        for bucket in [b for b in self.buckets if b[0] == adapter]:
+            del self.buckets[bucket]
+
+    # ---------------- LOOKUP ----------------
+
+    def get(self, adapter, subject, marks, question):
+        """
+        Returns {"answer", "tier", "similarity", "ms_saved"} or None.
+        """
+        version = self.versions.get(adapter, "")
+        key = cache_key(adapter, version, subject, marks, question)
+
+        with self.lock:
+            hit = self._fetch(key)
+            if hit:
+                return self._record_hit(key, hit, "exact", 1.0)
+
+        if self.embedder is not None:
+            embedding = self.embedder.encode(normalize_question(question))
+            bucket = (adapter, version, normalize_subject(subject), marks)
+            with self.lock:
+                keys, matrix = self._bucket(bucket)
+                if keys:
+                    scores = matrix @ embedding
+                    signature = numeric_signature(normalize_question(question))
+                    for best in np.argsort(-scores):
+                        if scores[best] < self.threshold:
+                            break
+                        hit = self._fetch(keys[best])
+                        if not hit:
+                            continue
+                        if numeric_signature(hit[3]) != signature:
+                            # same question with other values: its answer is wrong here
+                            self.stats["semantic_value_mismatches"] += 1
+                            continue
+                        return self._record_hit(keys[best], hit, "semantic", float(scores[best]))
+
+        with self.lock:
+            self.stats["misses"] += 1
+        return None
+
+    def _fetch(self, key):
+        # caller holds the lock
+        row = self.db.execute("SELECT answer, gen_ms, created, question FROM answers WHERE key = ?", (key,)).fetchone()
+        if row and self.ttl and time.time() - row[2] > self.ttl:
+            self._delete(key)
+            self.stats["evicted"] += 1
+            return None
+        return row
+
+    def _record_hit(self, key, row, tier, similarity):
+        # caller holds the lock
+        self.db.execute("UPDATE answers SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        self.stats[f"{tier}_hits"] += 1
+        self.stats["ms_saved"] += row[1]
+        return {"answer": row[0], "tier": tier, "similarity": round(similarity, 4), "ms_saved": row[1]}
+
+    def _bucket(self, bucket):
+        # caller holds the lock
+        if bucket not in self.buckets:
+            adapter, version, subject, marks = bucket
+            rows = self.db.execute(
+                "SELECT key, embedding FROM answers "
+                "WHERE adapter = ? AND version = ? AND subject = ? AND marks IS ? AND embedding IS NOT NULL",
+                (adapter, version, subject, marks)
+            ).fetchall()
+            keys = [r[0] for r in rows]
+            matrix = (np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+                      if rows else np.zeros((0, 0), dtype=np.float32))
+            self.buckets[bucket] = (keys, matrix)
+        return self.buckets[bucket]
+
+    # ---------------- WRITE ----------------
+
+    def put(self, adapter, subject, marks, question, answer, gen_ms):
+        version = self.versions.get(adapter, "")
+        key = cache_key(adapter, version, subject, marks, question)
+        embedding = self.embedder.encode(normalize_question(question)) if self.embedder is not None else None
+        now = time.time()
+
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(key, adapter, version, subject, marks, question, answer, embedding, gen_ms, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, adapter, version, normalize_subject(subject), marks, normalize_question(question), answer,
+                 embedding.tobytes() if embedding is not None else None, gen_ms, now, now)
+            )
+            self.db.commit()
+            self.stats["writes"] += 1
+
+            bucket = (adapter, version, normalize_subject(subject), marks)
+            if embedding is not None and bucket in self.buckets:
+                keys, matrix = self.buckets[bucket]
+                if key not in keys:
+                    self.buckets[bucket] = (keys + [key], np.vstack([matrix.reshape(-1, embedding.size), embedding]))
+
+            # cheap: only runs the eviction query every 100 writes
+            if self.max_entries and self.stats["writes"] % 100 == 0:
+                self.stats["evicted"] += self._evict_lru()
+
+    def _delete(self, key):
+        # caller holds the lock; the key may sit in a bucket matrix, so reload them
+        self.db.execute("DELETE FROM answers WHERE key = ?", (key,))
+        self.db.commit()
+        self.buckets.clear()
+
+    # ---------------- MAINTENANCE ----------------
+
+    def prune(self):
+        """
+        Removes expired entries, then trims to max_entries by LRU.
+        """
+        with self.lock:
+            removed = 0
+            if self.ttl:
+                cur = self.db.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl,))
+                removed += cur.rowcount
+            self.db.commit()
+            removed += self._evict_lru()
+            self.stats["evicted"] += removed
+            self.buckets.clear()
+            return removed
+
+    def _evict_lru(self):
+        # caller holds the lock
+        total = self.db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        excess = total - self.max_entries
+        if excess <= 0:
+            return 0
+        self.db.execute(
+            "DELETE FROM answers WHERE key IN "
+            "(SELECT key FROM answers ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self.db.commit()
+        self.buckets.clear()
+        return excess
+
+    def summary(self):
+        with self.lock:
+            entries = self.db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            per_adapter = dict(self.db.execute("SELECT adapter, COUNT(*) FROM answers GROUP BY adapter").fetchall())
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "ms_saved": round(self.stats["ms_saved"], 1),
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "avg_ms_saved_per_hit": round(self.stats["ms_saved"] / hits, 1) if hits else 0.0,
+            "threshold": self.threshold,
+            "entries": entries,
+            "entries_per_adapter": per_adapter,
+        }
+
+    def close(self):
+        self.db.close()
+
+
+# ---------------- CLI ----------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or maintain the answer cache")
+    parser.add_argument("command", choices=["stats", "prune", "invalidate"])
+    parser.add_argument("adapter", nargs="?", help="adapter to invalidate")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--ttl-days", type=float, default=30)
+    parser.add_argument("--max-entries", type=int, default=20000)
+    args = parser.parse_args()
+
+    cache = AnswerCache(args.db, args.ttl_days, args.max_entries)
+    if args.command == "prune":
+        print(f"Removed {cache.prune()} entries")
+    elif args.command == "invalidate":
+        if not args.adapter:
+            parser.error("invalidate needs an adapter name")
+        print(f"Removed {cache.invalidate(args.adapter)} entries for {args.adapter}")
+    print(json.dumps(cache.summary(), indent=2))
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Per-request latency with and without the instruction-prefix KV cache.
+
+Sends the same exam/guided prompts one at a time (so TTFT is prefill time,
+not batching) to an engine with the prefix cache off and then on, checks the
+greedy outputs match, and prints the TTFT saved per request.
+
+    python benchmark_prefix_cache.py --base-model unsloth/gemma-3-12b-it-bnb-4bit \
+        --adapters exam=walterwhite91/ask-m-gemma3-exam-lora,guided=walterwhite91/ask-m-gemma3-guide-lora
+    python benchmark_prefix_cache.py --base-model /path/to/tiny-model --adapters ""
+"""
+import argparse
+import asyncio
+import json
+import statistics
+
+from engine import BASE_ADAPTER, GenerationRequest, MultiLoraEngine
+from main import parse_adapters
+from prompts import build_prompt, prompt_prefix
+
+SAMPLE_QUESTIONS = [
+    ("PHYS101", 5, "State and derive Bernoulli's equation for fluid flow."),
+    ("COMP202", 10, "Explain the insertion algorithm of a B-tree with an example."),
+    ("MATH104", 2, "Define the rank of a matrix."),
+    ("COMP116", 5, "Differentiate between a process and a thread."),
+    ("EEEG101", 10, "Derive the expression for the resonant frequency of a series RLC circuit."),
+    ("CHEM101", 2, "What is hybridization?"),
+]
+
+
+def load_questions(path, limit):
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("question") and isinstance(record.get("marks"), int):
+                questions.append((record.get("subject", ""), record["marks"], record["question"]))
+            if len(questions) >= limit:
+                break
+    return questions
+
+
+async def run_one(engine, adapter, template, subject, marks, question, max_new_tokens):
+    prompt = build_prompt(template, subject, question, marks)
+    job = engine.submit(GenerationRequest(
+        prompt, adapter, max_new_tokens=max_new_tokens, temperature=0, prefix=prompt_prefix(prompt),
+    ))
+    text = "".join([chunk async for chunk in job.stream()])
+    return text, job.metrics()
+
+
+async def run_all(engine, workload, max_new_tokens):
+    return [await run_one(engine, *item, max_new_tokens) for item in workload]
+
+
+def summary(values):
+    return {
+        "mean": round(statistics.mean(values), 2),
+        "p50": round(statistics.median(values), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-model", required=True)
+    parser.add_argument("--adapters", default="", help='"exam=path,guided=path"; empty = base model only')
+    parser.add_argument("--dataset", default=None, help="expanded_dataset jsonl to take questions from")
+    parser.add_argument("--requests", type=int, default=24)
+    parser.add_argument("--max-new-tokens", type=int, default=16)
+    args = parser.parse_args()
+
+    adapters = parse_adapters(args.adapters)
+    questions = load_questions(args.dataset, args.requests) if args.dataset else SAMPLE_QUESTIONS
+    # (adapter, prompt template); without adapters the base model answers exam prompts
+    targets = [(a, a) for a in ("exam", "guided") if a in adapters] or [(BASE_ADAPTER, "exam")]
+    workload = [targets[i % len(targets)] + questions[i % len(questions)] for i in range(args.requests)]
+
+    # requests go one at a time, so don't wait for batch-mates
+    cached = MultiLoraEngine.load(args.base_model, adapters, prefix_cache=True, batch_wait_ms=0)
+    plain = MultiLoraEngine(cached.model, cached.tokenizer, adapters=cached.adapters, prefix_cache=False,
+                            batch_wait_ms=0)
+
+    results = {}
+    for name, engine in (("no_prefix_cache", plain), ("prefix_cache", cached)):
+        engine.start()
+        # warm-up: loads kernels and, for the cached engine, builds the prefix bank
+        asyncio.run(run_all(engine, workload[:len(targets) * 2], args.max_new_tokens))
+        results[name] = asyncio.run(run_all(engine, workload, args.max_new_tokens))
+        engine.stop()
+
+    def collect(name, key):
+        return [m[key] for _, m in results[name]]
+
+    plain_ttft, cached_ttft = collect("no_prefix_cache", "ttft_ms"), collect("prefix_cache", "ttft_ms")
+    plain_prefill, cached_prefill = collect("no_prefix_cache", "prefill_ms"), collect("prefix_cache", "prefill_ms")
+    same = sum(a[0] == b[0] for a, b in zip(results["no_prefix_cache"], results["prefix_cache"]))
+
+    print(json.dumps({
+        "requests": len(workload),
+        "prefix_tokens_reused_avg": round(statistics.mean(m["prefix_tokens_reused"] for _, m in results["prefix_cache"]), 1),
+        "prefill_ms_without_cache": summary(plain_prefill),
+        "prefill_ms_with_cache": summary(cached_prefill),
+        "ttft_ms_without_cache": summary(plain_ttft),
+        "ttft_ms_with_cache": summary(cached_ttft),
+        "ttft_ms_saved_per_request": summary([a - b for a, b in zip(plain_ttft, cached_ttft)]),
+        "identical_outputs": f"{same}/{len(workload)}",
+        "cached_prefixes": len(cached.prefix_bank),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Decode speed of speculative decoding vs the notebook's plain model.generate.
+
+Each request runs alone (greedy, so every mode must produce the same text):
+plain `model.generate` with the adapter set, then the engine without
+speculation, with prompt-lookup drafting and, given --draft-model, with a
+draft model. Prints tokens/sec, draft acceptance and tokens per target
+forward for each, and whether the outputs match model.generate.
+
+    python benchmark_speculative.py --base-model unsloth/gemma-3-12b-it-bnb-4bit \\
+        --adapters exam=walterwhite91/ask-m-gemma3-exam-lora,guided=walterwhite91/ask-m-gemma3-guide-lora \\
+        --draft-model google/gemma-3-270m-it --lookahead 4
+    python benchmark_speculative.py --base-model /path/to/tiny-model --adapters ""
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import torch
+
+from benchmark_prefix_cache import SAMPLE_QUESTIONS, load_questions
+from engine import BASE_ADAPTER, GenerationRequest, MultiLoraEngine
+from main import parse_adapters
+from prompts import build_prompt, prompt_prefix
+from speculative import load_drafter
+
+
+@torch.inference_mode()
+def run_generate(engine, workload, max_new_tokens):
+    """
+    The notebook's generate(), greedy, one adapter at a time.
+    """
+    model, tokenizer = engine.model, engine.tokenizer
+    results = []
+    for adapter, template, subject, marks, question in workload:
+        if adapter != BASE_ADAPTER:
+            model.set_adapter(adapter)
+        inputs = tokenizer(build_prompt(template, subject, question, marks), return_tensors="pt").to(engine.device)
+        start = time.perf_counter()
+        output = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            eos_token_id=tokenizer.eos_token_id,
+            pad_token_id=tokenizer.pad_token_id,
+        )
+        elapsed = time.perf_counter() - start
+        new = output[0, inputs["input_ids"].shape[1]:]
+        results.append((tokenizer.decode(new, skip_special_tokens=True), len(new), elapsed))
+    return results
+
+
+async def run_engine(engine, workload, max_new_tokens):
+    results = []
+    for adapter, template, subject, marks, question in workload:
+        prompt = build_prompt(template, subject, question, marks)
+        job = engine.submit(GenerationRequest(
+            prompt, adapter, max_new_tokens=max_new_tokens, temperature=0, prefix=prompt_prefix(prompt),
+        ))
+        text = "".join([chunk async for chunk in job.stream()])
+        results.append((text, job.new_tokens, job.finished_at - job.started_at))
+    return results
+
+
+def summarize(results, reference):
+    tokens = sum(n for _, n, _ in results)
+    seconds = sum(t for _, _, t in results)
+    return {
+        "tokens": tokens,
+        "tokens_per_sec": round(tokens / seconds, 1),
+        "ms_per_request_p50": round(statistics.median(t for _, _, t in results) * 1000, 1),
+        "same_as_generate": f"{sum(a[0] == b[0] for a, b in zip(results, reference))}/{len(results)}",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-model", required=True)
+    parser.add_argument("--adapters", default="", help='"exam=path,guided=path"; empty = base model only')
+    parser.add_argument("--draft-model", default=None, help="small model sharing the base vocabulary")
+    parser.add_argument("--lookahead", type=int, default=None)
+    parser.add_argument("--dataset", default=None, help="expanded_dataset jsonl to take questions from")
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    args = parser.parse_args()
+
+    adapters = parse_adapters(args.adapters)
+    questions = load_questions(args.dataset, args.requests) if args.dataset else SAMPLE_QUESTIONS
+    targets = [(a, a) for a in ("exam", "guided") if a in adapters] or [(BASE_ADAPTER, "exam")]
+    workload = [targets[i % len(targets)] + questions[i % len(questions)] for i in range(args.requests)]
+
+    plain = MultiLoraEngine.load(args.base_model, adapters, batch_wait_ms=0)
+    modes = {"engine": None, "prompt_lookup": load_drafter("prompt_lookup", plain.tokenizer, lookahead=args.lookahead)}
+    if args.draft_model:
+        modes["draft_model"] = load_drafter("draft_model", plain.tokenizer, args.draft_model, args.lookahead,
+                                            device=plain.device)
+
+    # warm-up, then the reference run
+    run_generate(plain, workload[:2], args.max_new_tokens)
+    reference = run_generate(plain, workload, args.max_new_tokens)
+    report = {"model.generate": summarize(reference, reference)}
+
+    for name, drafter in modes.items():
+        engine = MultiLoraEngine(plain.model, plain.tokenizer, adapters=plain.adapters, batch_wait_ms=0,
+                                 drafter=drafter)
+        engine.start()
+        asyncio.run(run_engine(engine, workload[:2], args.max_new_tokens))
+        results = asyncio.run(run_engine(engine, workload, args.max_new_tokens))
+        engine.stop()
+        stats = engine.stats()
+        report[name] = {
+            **summarize(results, reference),
+            "draft_acceptance_rate": stats["draft_acceptance_rate"],
+            "tokens_per_target_forward": stats["tokens_per_speculative_step"],
+        }
+
+    base = report["model.generate"]["tokens_per_sec"]
+    for name, row in report.items():
+        row["speedup_vs_generate"] = round(row["tokens_per_sec"] / base, 2)
+    print(json.dumps({"requests": len(workload), "max_new_tokens": args.max_new_tokens, **report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
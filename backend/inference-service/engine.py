@@ -0,0 +1,572 @@
+"""
+One base model with several LoRA adapters, generating for many requests at
+once.
+
+Requests wait in a queue for up to BATCH_WAIT_MS, then up to MAX_BATCH_SIZE
+of them are decoded together. Requests for different adapters share the same
+forward pass through PEFT's `adapter_names` (each row of the batch goes
+through its own LoRA), so an exam and a guided request don't have to take
+turns with set_adapter. Tokens are pushed to each request as they are
+decoded; a row that hits EOS or its token limit stops streaming while the
+rest of the batch carries on.
+
+Finished and cancelled rows are dropped from the batch (and its KV cache)
+as soon as they stop, so a client that disconnects stops costing compute on
+the next step.
+
+Prompts built from the adapter templates start from a cached KV of their
+instruction prefix (prefix_cache.py), so only the question part is prefilled.
+
+Once a batch is down to a single row, the rest of that request can be
+decoded speculatively (speculative.py): drafted tokens are verified several
+at a time by the LoRA'd model.
+
+A request can also stop on text markers (see generation_policy.py): tokens
+that could be the start of a marker are held back until they can't, so a
+marker is never streamed to the client.
+"""
+import hashlib
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+import torch
+from transformers import AsyncTextIteratorStreamer
+
+from prefix_cache import PrefixBank, left_pad
+from speculative import load_drafter, verify
+
+logger = logging.getLogger("askm.inference")
+
+# adapter name meaning "no LoRA" (PEFT's special name in mixed batches)
+BASE_ADAPTER = "base"
+_PEFT_BASE = "__base__"
+
+_ids = itertools.count(1)
+
+
+class GenerationRequest:
+    """
+    One prompt for one adapter. Must be submitted from inside the event loop:
+    the engine attaches an AsyncTextIteratorStreamer that the generation
+    thread feeds and `stream()` reads.
+    """
+
+    def __init__(self, prompt, adapter, max_new_tokens=300, temperature=0.7, top_p=0.9, prefix=None,
+                 stop_markers=(), draft_context=""):
+        self.id = next(_ids)
+        self.prompt = prompt
+        self.adapter = adapter
+        # fixed leading part of `prompt` whose KV cache may be reused
+        self.prefix = prefix
+        self.prefix_tokens = 0
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.stop_markers = tuple(stop_markers)
+        # marker that ended the request, if any
+        self.stop_marker = None
+        # extra text (retrieved notes) prompt-lookup drafting may copy from
+        self.draft_context = draft_context
+        self.prompt_ids = None
+        self.drafted = 0
+        self.accepted = 0
+
+        self.streamer = None
+        self.token_ids = []
+        # generated but not streamed yet: might be the start of a stop marker
+        self.held = []
+        self.finish_reason = None
+        self.error = None
+        self.cancelled = threading.Event()
+
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+
+    async def stream(self):
+        """
+        Yields decoded text chunks until the request finishes.
+        """
+        async for chunk in self.streamer:
+            # the streamer holds back partial words, which shows up as empty chunks
+            if chunk:
+                yield chunk
+        if self.error:
+            raise RuntimeError(self.error)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    @property
+    def new_tokens(self):
+        return len(self.token_ids)
+
+    def metrics(self):
+        """
+        queue_ms: waiting for a batch. ttft_ms: submit -> first token (what the
+        user feels), prefill_ms the part of it spent in the model.
+        tokens_per_sec: decode rate after the first token.
+        """
+        def ms(start, end):
+            return round((end - start) * 1000, 1) if start is not None and end is not None else None
+
+        decode_time = (self.finished_at or 0) - (self.first_token_at or 0)
+        return {
+            "new_tokens": self.new_tokens,
+            "max_new_tokens": self.max_new_tokens,
+            "stop_marker": self.stop_marker,
+            "prefix_tokens_reused": self.prefix_tokens,
+            "draft_acceptance": round(self.accepted / self.drafted, 3) if self.drafted else None,
+            "queue_ms": ms(self.submitted_at, self.started_at),
+            "ttft_ms": ms(self.submitted_at, self.first_token_at),
+            "prefill_ms": ms(self.started_at, self.first_token_at),
+            "total_ms": ms(self.submitted_at, self.finished_at),
+            "tokens_per_sec": (
+                round((self.new_tokens - 1) / decode_time, 1)
+                if self.first_token_at and self.new_tokens > 1 and decode_time > 0 else None
+            ),
+        }
+
+
+class MultiLoraEngine:
+    def __init__(self, model, tokenizer, adapters=(), max_batch_size=8, batch_wait_ms=10,
+                 max_input_tokens=2048, prefix_cache=True, max_prefixes=64, drafter=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.adapters = list(adapters)
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.max_input_tokens = max_input_tokens
+        self.prefix_bank = PrefixBank(max_prefixes) if prefix_cache else None
+        # speculative decoding for lone requests; None = off
+        self.drafter = drafter
+
+        self.model.eval()
+        self.device = next(model.parameters()).device
+        # Gemma's instruct models also end a turn with <end_of_turn>
+        eos = getattr(getattr(model, "generation_config", None), "eos_token_id", None)
+        eos = eos if isinstance(eos, (list, tuple)) else [eos]
+        end_of_turn = tokenizer.convert_tokens_to_ids("<end_of_turn>") if "<end_of_turn>" in tokenizer.get_vocab() else None
+        self.stop_ids = {t for t in (tokenizer.eos_token_id, end_of_turn, *eos) if t is not None}
+        self.pending = queue.Queue()
+        self._running = False
+        self._thread = None
+        self.counters = {"requests": 0, "batches": 0, "batched_rows": 0, "mixed_batches": 0,
+                         "generated_tokens": 0, "cancelled": 0, "errors": 0,
+                         "prefix_hits": 0, "prefix_tokens_reused": 0, "marker_stops": 0,
+                         "speculative_requests": 0, "speculative_steps": 0, "drafted_tokens": 0,
+                         "accepted_tokens": 0}
+        # metrics of the last finished requests, for /health
+        self.recent = deque(maxlen=200)
+
+    @classmethod
+    def load(cls, base_model, adapters, speculative="off", draft_model=None, lookahead=None, **kwargs):
+        """
+        Loads the base once and attaches every adapter ({name: path or hub id}),
+        same as the inference notebook: PeftModel.from_pretrained for the
+        first, load_adapter for the rest. `speculative` picks the drafter
+        (off, prompt_lookup, draft_model) and `lookahead` its draft length.
+        """
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(base_model, trust_remote_code=True)
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        # decode-time batches are left-padded so every row ends at the last column
+        tokenizer.padding_side = "left"
+
+        on_gpu = torch.cuda.is_available()
+        model = AutoModelForCausalLM.from_pretrained(
+            base_model,
+            device_map="auto" if on_gpu else None,
+            torch_dtype=torch.float16 if on_gpu else torch.float32,
+            trust_remote_code=True,
+        )
+
+        if adapters:
+            from peft import PeftModel
+
+            names = list(adapters)
+            model = PeftModel.from_pretrained(model, adapters[names[0]], adapter_name=names[0])
+            for name in names[1:]:
+                model.load_adapter(adapters[name], adapter_name=name)
+            logger.info("adapters loaded: %s", ", ".join(names))
+
+        drafter = load_drafter(speculative, tokenizer, draft_model, lookahead, device=model.device)
+        return cls(model, tokenizer, adapters=list(adapters), drafter=drafter, **kwargs)
+
+    # -----------------------------
+    # Queue
+    # -----------------------------
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._loop, name="generation", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, request):
+        if request.adapter != BASE_ADAPTER and request.adapter not in self.adapters:
+            raise ValueError(f"unknown adapter '{request.adapter}', loaded: {self.adapters}")
+        # created here, on the event loop, so it can hand text back to it
+        request.streamer = AsyncTextIteratorStreamer(self.tokenizer, skip_special_tokens=True)
+        self.counters["requests"] += 1
+        self.pending.put(request)
+        return request
+
+    def stats(self):
+        batches = self.counters["batches"]
+        ttft = sorted(m["ttft_ms"] for m in self.recent if m["ttft_ms"] is not None)
+        rates = [m["tokens_per_sec"] for m in self.recent if m["tokens_per_sec"] is not None]
+        return {
+            **self.counters,
+            "queued": self.pending.qsize(),
+            "avg_batch_size": round(self.counters["batched_rows"] / batches, 2) if batches else 0.0,
+            "ttft_ms_p50": ttft[len(ttft) // 2] if ttft else None,
+            "ttft_ms_p95": ttft[int(len(ttft) * 0.95)] if ttft else None,
+            "tokens_per_sec_avg": round(sum(rates) / len(rates), 1) if rates else None,
+            "cached_prefixes": len(self.prefix_bank) if self.prefix_bank is not None else 0,
+            "draft_acceptance_rate": (
+                round(self.counters["accepted_tokens"] / self.counters["drafted_tokens"], 3)
+                if self.counters["drafted_tokens"] else None
+            ),
+            # > 1 means speculation saved forward passes
+            "tokens_per_speculative_step": (
+                round((self.counters["accepted_tokens"] + self.counters["speculative_steps"])
+                      / self.counters["speculative_steps"], 2)
+                if self.counters["speculative_steps"] else None
+            ),
+            "adapters": self.adapters,
+        }
+
+    def adapter_fingerprint(self, adapter):
+        """
+        Short hash of the adapter's LoRA weights. Changes when a retrained
+        adapter is deployed under the same name, so caches keyed on it go stale.
+        """
+        digest = hashlib.sha256()
+        if adapter == BASE_ADAPTER or not self.adapters:
+            digest.update(str(self.model.config.name_or_path).encode("utf-8"))
+            return digest.hexdigest()[:16]
+        marker = f".{adapter}."
+        for name, param in sorted(self.model.named_parameters(), key=lambda item: item[0]):
+            if "lora_" in name and marker in name:
+                digest.update(name.encode("utf-8"))
+                digest.update(param.detach().cpu().contiguous().view(torch.uint8).numpy().tobytes())
+        return digest.hexdigest()[:16]
+
+    def _loop(self):
+        while self._running:
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                logger.exception("generation batch failed")
+                self.counters["errors"] += 1
+                for request in batch:
+                    if request.finish_reason is None:
+                        self._finish(request, "error", error=str(e))
+
+    def _collect(self):
+        """
+        Blocks for the first request, then gathers whatever else arrives
+        within batch_wait (up to max_batch_size). Cancelled requests are dropped.
+        """
+        try:
+            first = self.pending.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.pending.get(timeout=remaining) if remaining > 0
+                             else self.pending.get_nowait())
+            except queue.Empty:
+                break
+
+        live = []
+        for request in batch:
+            if request.cancelled.is_set():
+                self._finish(request, "cancelled")
+            else:
+                live.append(request)
+        return live
+
+    # -----------------------------
+    # Decoding
+    # -----------------------------
+    @torch.inference_mode()
+    def _run_batch(self, batch):
+        input_ids, attention_mask, position_ids, past_key_values = self._prefill_inputs(batch)
+
+        self.counters["batches"] += 1
+        self.counters["batched_rows"] += len(batch)
+        if len({r.adapter for r in batch}) > 1:
+            self.counters["mixed_batches"] += 1
+
+        started = time.perf_counter()
+        for request in batch:
+            request.started_at = started
+
+        temperature = torch.tensor([[r.temperature] for r in batch], device=self.device)
+        top_p = torch.tensor([[r.top_p] for r in batch], device=self.device)
+
+        for _ in range(max(r.max_new_tokens for r in batch)):
+            out = self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=past_key_values,
+                use_cache=True,
+                **self._adapter_kwargs([r.adapter for r in batch]),
+            )
+            past_key_values = out.past_key_values
+            next_tokens = sample_next(out.logits[:, -1, :], temperature, top_p)
+
+            for i, request in enumerate(batch):
+                if request.finish_reason is not None:
+                    # finished row still in a cache that can't drop it
+                    continue
+                token = int(next_tokens[i])
+                if request.cancelled.is_set():
+                    self._finish(request, "cancelled")
+                elif token in self.stop_ids:
+                    self._finish(request, "stop")
+                else:
+                    self._emit(request, token)
+                    if request.stop_marker is not None:
+                        self._finish(request, "stop")
+                    elif request.new_tokens >= request.max_new_tokens:
+                        self._finish(request, "length")
+
+            keep = [i for i, r in enumerate(batch) if r.finish_reason is None]
+            if not keep:
+                break
+
+            input_ids = next_tokens[:, None]
+            attention_mask = torch.cat([attention_mask, attention_mask.new_ones((len(batch), 1))], dim=-1)
+            position_ids = position_ids[:, -1:] + 1
+
+            # drop finished rows so they stop costing compute; caches that
+            # can't be re-indexed just keep decoding them (output ignored)
+            if len(keep) < len(batch) and hasattr(past_key_values, "batch_select_indices"):
+                index = torch.tensor(keep, device=self.device)
+                past_key_values.batch_select_indices(index)
+                input_ids, attention_mask, position_ids = input_ids[index], attention_mask[index], position_ids[index]
+                temperature, top_p = temperature[index], top_p[index]
+                batch = [batch[i] for i in keep]
+
+            if self.drafter is not None and len(batch) == 1 and hasattr(past_key_values, "crop"):
+                self._speculate(batch[0], input_ids, attention_mask, position_ids, past_key_values)
+                return
+
+    def _speculate(self, request, input_ids, attention_mask, position_ids, past_key_values):
+        """
+        Finishes a lone request speculatively. `input_ids` is its last token,
+        already emitted but not yet in the KV cache.
+        """
+        self.counters["speculative_requests"] += 1
+        if hasattr(past_key_values, "activate_past_recording"):
+            # sliding-window layers otherwise can't roll back rejected drafts
+            past_key_values.activate_past_recording()
+        context = self.tokenizer(request.draft_context, add_special_tokens=False)["input_ids"] if request.draft_context else []
+        self.drafter.start(context)
+        adapter_kwargs = self._adapter_kwargs([request.adapter])
+
+        while request.finish_reason is None:
+            if request.cancelled.is_set():
+                self._finish(request, "cancelled")
+                break
+
+            # the last token always comes from the target, so leave room for it
+            room = request.max_new_tokens - request.new_tokens - 1
+            draft = self.drafter.propose(request.prompt_ids + request.token_ids, room) if room > 0 else []
+            step = torch.tensor([draft], dtype=torch.long, device=self.device).reshape(1, -1)
+            mask = torch.cat([attention_mask, attention_mask.new_ones((1, len(draft)))], dim=-1)
+            positions = position_ids[:, -1:] + torch.arange(len(draft) + 1, device=self.device)
+
+            out = self.model(
+                input_ids=torch.cat([input_ids, step], dim=-1),
+                attention_mask=mask,
+                position_ids=positions,
+                past_key_values=past_key_values,
+                use_cache=True,
+                **adapter_kwargs,
+            )
+            past_key_values = out.past_key_values
+            accepted, next_token = verify(out.logits[0], draft, request.temperature, request.top_p)
+            rejected = len(draft) - accepted
+            if rejected:
+                # crop(-0) truncates the whole cache on older transformers
+                past_key_values.crop(-rejected)
+
+            self.counters["speculative_steps"] += 1
+            self.counters["drafted_tokens"] += len(draft)
+            self.counters["accepted_tokens"] += accepted
+            request.drafted += len(draft)
+            request.accepted += accepted
+
+            for token in draft[:accepted] + [next_token]:
+                if token in self.stop_ids:
+                    self._finish(request, "stop")
+                    break
+                self._emit(request, token)
+                if request.stop_marker is not None:
+                    self._finish(request, "stop")
+                    break
+                if request.new_tokens >= request.max_new_tokens:
+                    self._finish(request, "length")
+                    break
+
+            input_ids = torch.tensor([[next_token]], device=self.device)
+            attention_mask = torch.cat([mask[:, :mask.shape[1] - rejected], mask.new_ones((1, 1))], dim=-1)
+            position_ids = positions[:, accepted:accepted + 1] + 1
+
+    def _prefill_inputs(self, batch):
+        """
+        Left-padded prompt ids, attention mask, position ids and the starting
+        KV cache: None, or the cached instruction prefixes when any row can
+        reuse one (then the ids are only the part after the prefix).
+        """
+        pad_id = self.tokenizer.pad_token_id
+        prompt_ids = self.tokenizer(
+            [r.prompt for r in batch],
+            truncation=True,
+            max_length=self.max_input_tokens,
+        )["input_ids"]
+        for request, ids in zip(batch, prompt_ids):
+            request.prompt_ids = ids
+        rows = [self._prefix_row(r, ids) for r, ids in zip(batch, prompt_ids)]
+
+        if all(row is None for row in rows):
+            input_ids, mask = left_pad(prompt_ids, pad_id, self.device)
+            return input_ids, mask, (mask.cumsum(-1) - 1).clamp(min=0), None
+
+        if self.prefix_bank.stale:
+            self.prefix_bank.build(self.model, pad_id, self.device, self._adapter_kwargs)
+        past_key_values, prefix_mask = self.prefix_bank.gather(rows)
+
+        suffixes, offsets = [], []
+        for request, ids, row in zip(batch, prompt_ids, rows):
+            request.prefix_tokens = 0 if row is None else len(self.prefix_bank.token_ids[row])
+            suffixes.append(ids[request.prefix_tokens:])
+            offsets.append(request.prefix_tokens)
+            if row is not None:
+                self.counters["prefix_hits"] += 1
+                self.counters["prefix_tokens_reused"] += request.prefix_tokens
+
+        input_ids, suffix_mask = left_pad(suffixes, pad_id, self.device)
+        # suffix positions continue from each row's own prefix length
+        position_ids = (suffix_mask.cumsum(-1) - 1).clamp(min=0) + torch.tensor(offsets, device=self.device)[:, None]
+        return input_ids, torch.cat([prefix_mask, suffix_mask], dim=-1), position_ids, past_key_values
+
+    def _prefix_row(self, request, prompt_ids):
+        if self.prefix_bank is None or not request.prefix:
+            return None
+        row = self.prefix_bank.lookup(request.adapter, request.prefix, self.tokenizer)
+        if row is None:
+            return None
+        prefix_ids = self.prefix_bank.token_ids[row]
+        # only if the prompt really tokenizes as prefix + suffix, with a non-empty suffix
+        if len(prompt_ids) <= len(prefix_ids) or prompt_ids[:len(prefix_ids)] != prefix_ids:
+            return None
+        return row
+
+    def _adapter_kwargs(self, adapters):
+        if not self.adapters:
+            return {}
+        # finished rows may already be dropped, so callers pass the live batch's adapters
+        return {"adapter_names": [_PEFT_BASE if a == BASE_ADAPTER else a for a in adapters]}
+
+    def _emit(self, request, token):
+        if request.first_token_at is None:
+            request.first_token_at = time.perf_counter()
+        request.token_ids.append(token)
+        self.counters["generated_tokens"] += 1
+        if not request.stop_markers:
+            self._stream(request, request.streamer.put, torch.tensor([token]))
+            return
+
+        request.held.append(token)
+        text = self.tokenizer.decode(request.held, skip_special_tokens=True)
+        found = [text.find(m) for m in request.stop_markers if m in text]
+        if found:
+            cut = min(found)
+            request.stop_marker = next(m for m in request.stop_markers if text.find(m) == cut)
+            self.counters["marker_stops"] += 1
+            # stream the held tokens that come before the marker, drop the rest
+            keep = len(request.held)
+            while keep and len(self.tokenizer.decode(request.held[:keep], skip_special_tokens=True)) > cut:
+                keep -= 1
+            request.held = request.held[:keep]
+            self._flush(request)
+        elif not any(_ends_with_prefix(text, m) for m in request.stop_markers):
+            self._flush(request)
+
+    def _flush(self, request):
+        if request.held:
+            self._stream(request, request.streamer.put, torch.tensor(request.held))
+            request.held = []
+
+    def _finish(self, request, reason, error=None):
+        if request.finish_reason is not None:
+            return
+        request.finish_reason = reason
+        request.error = error
+        request.finished_at = time.perf_counter()
+        # a partial marker at EOS / the token limit is just text
+        self._flush(request)
+        self._stream(request, request.streamer.end)
+
+        if reason == "cancelled":
+            self.counters["cancelled"] += 1
+        metrics = request.metrics()
+        self.recent.append(metrics)
+        logger.info("request %s finished (%s, adapter=%s): %s", request.id, reason, request.adapter, metrics)
+
+    def _stream(self, request, fn, *args):
+        try:
+            fn(*args)
+        except RuntimeError:
+            # event loop already gone (shutdown); nobody is listening
+            request.cancelled.set()
+
+
+def _ends_with_prefix(text, marker):
+    """
+    True if the end of `text` could be the start of `marker`.
+    """
+    return any(text.endswith(marker[:n]) for n in range(1, len(marker)))
+
+
+def sample_next(logits, temperature, top_p):
+    """
+    Per-row sampling: temperature <= 0 is greedy, otherwise temperature +
+    nucleus (top-p) sampling, matching the notebook's generate() defaults.
+    """
+    logits = logits.float()
+    greedy = logits.argmax(dim=-1)
+
+    scaled = logits / temperature.clamp(min=1e-5)
+    probs = torch.softmax(scaled, dim=-1)
+    sorted_probs, sorted_idx = probs.sort(dim=-1, descending=True)
+    # drop tokens once the mass before them already exceeds top_p
+    cutoff = (sorted_probs.cumsum(dim=-1) - sorted_probs) > top_p
+    sorted_probs = sorted_probs.masked_fill(cutoff, 0.0)
+    sampled = sorted_idx.gather(-1, torch.multinomial(sorted_probs, 1)).squeeze(-1)
+
+    return torch.where(temperature.squeeze(-1) <= 0, greedy, sampled)
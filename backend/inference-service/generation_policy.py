@@ -0,0 +1,364 @@
+"""
+How long each request may generate, and when it is done.
+
+The notebook decodes up to a fixed 250/500 tokens whatever the marks, so a
+1-mark definition has the same ceiling as a 10-mark derivation and, when
+the adapter rambles past its answer, runs all the way to it. Here the
+ceiling comes from the answers the adapters were trained on: the 95th
+percentile answer length for the adapter's field, per (family, marks),
+plus headroom. Groups with too few answers fall back to the family, then
+to all families; marks with no data are interpolated (or scaled up
+linearly past the largest known marks, so long answers are never cut
+short by a missing group).
+
+Generation also stops on structural markers - the model starting another
+"Subject:/Question:" block after its answer - and every finished request
+is recorded as actual vs budgeted tokens.
+
+The expanded dataset has no marks field, so marks come from the seed
+dataset by (subject, question); records that don't match only count
+towards the all-marks ("*") budgets. Requests without marks use those, so
+they never go below the notebook's fixed ceilings (FIXED_BUDGETS). Build
+with the serving tokenizer: the fallback estimate is only a stand-in.
+
+    python generation_policy.py build \\
+        --dataset "../../Fine Tuning/dataset_expansion/expanded_dataset_v1.jsonl" \\
+        --seeds "../../Fine Tuning/dataset_expansion/structured_dataset_v1.json" \\
+        --tokenizer unsloth/gemma-3-12b-it-bnb-4bit
+    python generation_policy.py show --subject "PHYS 101" --marks 5
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import shlex
+import sys
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger("askm.inference")
+
+DEFAULT_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generation_budgets.json")
+
+# same prefixes as syllbus_family_mapping.py
+FAMILY_MAP = {
+    "PHYS": "math_phys",
+    "MATH": "math_phys",
+    "CHEM": "math_phys",
+    "ENGG": "math_phys",
+    "ENVE": "math_phys",
+    "EEEG": "math_phys",
+    "MCSC": "math_phys",
+
+    "COMP": "programming",
+
+    "EDRG": "design",
+    "ENGT": "design"
+}
+
+# dataset field each adapter was trained to produce
+ANSWER_FIELDS = {
+    "exam": "exam_mode_answer",
+    "guided": "guided_mode_answer",
+    "exam_followup": "exam_f_question",
+    "guided_followup": "guided_f_question",
+}
+
+# the start of another prompt block means the answer is over; none of these
+# appear inside a training answer
+STOP_MARKERS = {
+    "exam": ("\nSubject:", "\nMarks:", "\nQuestion:", "\nAnswer:", "\nFollow-up"),
+    "guided": ("\nSubject:", "\nQuestion:", "\nExplanation:"),
+    "exam_followup": ("\nSubject:", "\nOriginal Question:", "\nExam Answer:", "\nAnswer:"),
+    "guided_followup": ("\nSubject:", "\nExplanation:", "\nAnswer:"),
+}
+
+QUANTILE = 0.95
+HEADROOM = 1.25
+MIN_SAMPLES = 8
+MIN_BUDGET = 64
+ROUND_TO = 16
+ALL = "*"
+# the notebook's fixed max_new_tokens (300 = its generate() default); the
+# all-marks budget of every family stays at least this, since requests
+# without marks land there
+FIXED_BUDGETS = {"exam": 250, "guided": 500, "exam_followup": 300, "guided_followup": 300}
+
+NON_ALPHA = re.compile(r"[\W\d_]+")
+
+
+def infer_family(subject):
+    return FAMILY_MAP.get(NON_ALPHA.sub("", subject or "").upper(), "general")
+
+
+def normalize_subject(subject):
+    return re.sub(r"\s+", "", subject or "").upper()
+
+
+def quantile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(math.ceil(q * len(values))) - 1)]
+
+
+def to_budget(length, headroom=HEADROOM):
+    return max(MIN_BUDGET, int(math.ceil(length * headroom / ROUND_TO)) * ROUND_TO)
+
+
+# -----------------------------
+# Building the table
+# -----------------------------
+APPROX_PIECE = re.compile(r"[A-Za-z]+|\S")
+APPROX_NAME = "approx (letters / 4, every other character 1)"
+
+
+def approx_tokens(text):
+    """
+    Without the serving tokenizer: Gemma's splits every digit and most
+    LaTeX symbols ($, \\, {, ^, _) into tokens of their own, so only runs
+    of letters are counted at ~4 characters a token. Errs long on prose.
+    """
+    return sum(math.ceil(len(p) / 4) if p[0].isalpha() else 1 for p in APPROX_PIECE.findall(text))
+
+
+def build_table(records, count_tokens, marks_of, quantile_=QUANTILE, headroom=HEADROOM):
+    """
+    {adapter: {family or "*": {marks or "*": budget}}} from answer lengths.
+    `marks_of(record)` returns the record's marks or None.
+    """
+    lengths = defaultdict(list)  # (adapter, family, marks) -> token counts
+    for record in records:
+        family = infer_family(record.get("subject"))
+        marks = marks_of(record)
+        for adapter, field in ANSWER_FIELDS.items():
+            text = (record.get(field) or "").strip()
+            if not text:
+                continue
+            n = count_tokens(text)
+            for fam in (family, ALL):
+                lengths[(adapter, fam, ALL)].append(n)
+                if marks is not None:
+                    lengths[(adapter, fam, str(marks))].append(n)
+
+    table = {}
+    for (adapter, family, marks), values in sorted(lengths.items()):
+        # the all-marks bucket always exists; per-marks ones need enough answers
+        if marks != ALL and len(values) < MIN_SAMPLES:
+            continue
+        table.setdefault(adapter, {}).setdefault(family, {})[marks] = to_budget(quantile(values, quantile_), headroom)
+
+    # more marks never get a smaller budget
+    for adapter, families in table.items():
+        for budgets in families.values():
+            known = sorted(int(m) for m in budgets if m != ALL)
+            for lower, higher in zip(known, known[1:]):
+                budgets[str(higher)] = max(budgets[str(higher)], budgets[str(lower)])
+            budgets[ALL] = max(budgets[ALL], FIXED_BUDGETS.get(adapter, 0))
+
+    return table
+
+
+def coverage(table, records, count_tokens, marks_of, fixed):
+    """
+    Per adapter: training answers that would fit the budget vs a fixed
+    max_new_tokens, and the average ceiling of each.
+    """
+    policy = GenerationPolicy(table, max_new_tokens=10 ** 6)
+    report = {}
+    for adapter, field in ANSWER_FIELDS.items():
+        rows = [
+            (count_tokens(r[field].strip()), policy.budget(adapter, r.get("subject"), marks_of(r)))
+            for r in records if (r.get(field) or "").strip()
+        ]
+        if rows:
+            report[adapter] = {
+                "answers": len(rows),
+                "fits_budget": round(sum(n <= b for n, b in rows) / len(rows), 3),
+                "avg_budget": round(sum(b for _, b in rows) / len(rows), 1),
+                f"fits_fixed_{fixed}": round(sum(n <= fixed for n, _ in rows) / len(rows), 3),
+            }
+    return report
+
+
+# -----------------------------
+# Policy
+# -----------------------------
+class GenerationPolicy:
+    def __init__(self, table=None, max_new_tokens=1024, default_budget=300):
+        self.table = table or {}
+        self.max_new_tokens = max_new_tokens
+        # adapters without a table (base, or no table file) keep the old default
+        self.default_budget = min(default_budget, max_new_tokens)
+        self.lock = threading.Lock()
+        self.groups = defaultdict(lambda: {"requests": 0, "budget_tokens": 0, "used_tokens": 0,
+                                           "hit_budget": 0, "stop_marker": 0})
+
+    @classmethod
+    def load(cls, path=DEFAULT_TABLE, **kwargs):
+        if not os.path.exists(path):
+            logger.warning("no generation budget table at %s, using fixed budgets", path)
+            return cls(None, **kwargs)
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["budgets"], **kwargs)
+
+    def budget(self, adapter, subject="", marks=None):
+        families = self.table.get(adapter)
+        if not families:
+            return self.default_budget
+        budgets = families.get(infer_family(subject)) or families[ALL]
+        value = self._for_marks(budgets, marks)
+        if value is None:
+            value = self._for_marks(families[ALL], marks)
+        if value is None:
+            value = budgets[ALL]
+        return max(MIN_BUDGET, min(int(value), self.max_new_tokens))
+
+    @staticmethod
+    def _for_marks(budgets, marks):
+        if marks is None:
+            return budgets[ALL]
+        known = sorted(int(m) for m in budgets if m != ALL)
+        if not known:
+            return None
+        if marks <= known[0]:
+            return budgets[str(known[0])]
+        if marks >= known[-1]:
+            # no data above: grow in proportion to the marks
+            return math.ceil(budgets[str(known[-1])] * marks / known[-1])
+        for lower, higher in zip(known, known[1:]):
+            if lower <= marks <= higher:
+                low, high = budgets[str(lower)], budgets[str(higher)]
+                return math.ceil(low + (high - low) * (marks - lower) / (higher - lower))
+
+    def stop_markers(self, adapter):
+        return STOP_MARKERS.get(adapter, ())
+
+    def record(self, request, marks=None):
+        """
+        Actual vs budgeted tokens of a finished request.
+        """
+        if request.finish_reason not in ("stop", "length"):
+            return
+        with self.lock:
+            group = self.groups[(request.adapter, ALL if marks is None else str(marks))]
+            group["requests"] += 1
+            group["budget_tokens"] += request.max_new_tokens
+            group["used_tokens"] += request.new_tokens
+            group["hit_budget"] += request.finish_reason == "length"
+            group["stop_marker"] += request.stop_marker is not None
+
+    def summary(self):
+        with self.lock:
+            groups = {f"{adapter}/{marks}": dict(g) for (adapter, marks), g in sorted(self.groups.items())}
+        for g in groups.values():
+            g["avg_budget"] = round(g["budget_tokens"] / g["requests"], 1)
+            g["avg_used"] = round(g["used_tokens"] / g["requests"], 1)
+            g["budget_used"] = round(g["used_tokens"] / g["budget_tokens"], 3)
+            g["truncated_rate"] = round(g["hit_budget"] / g["requests"], 3)
+        return {"table_loaded": bool(self.table), "groups": groups}
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def iter_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def load_marks(path):
+    """
+    (subject, question) -> marks from a seed dataset (.json or .jsonl; the
+    seed files use "marks" or "mark").
+    """
+    if path.endswith(".jsonl"):
+        seeds = iter_jsonl(path)
+    else:
+        with open(path, encoding="utf-8") as f:
+            seeds = json.load(f)
+    marks = {}
+    for s in seeds:
+        if isinstance(s, dict) and s.get("question"):
+            value = s.get("marks", s.get("mark"))
+            if isinstance(value, int):
+                marks[(normalize_subject(s.get("subject")), s["question"].strip())] = value
+    return marks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the marks-aware generation budgets")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build")
+    build.add_argument("--dataset", required=True, help="expanded dataset (.jsonl)")
+    build.add_argument("--seeds", action="append", default=[], help="seed dataset(s) with marks")
+    build.add_argument("--tokenizer", default=None, help="serving tokenizer; default approximates from length")
+    build.add_argument("--quantile", type=float, default=QUANTILE)
+    build.add_argument("--headroom", type=float, default=HEADROOM)
+    build.add_argument("--out", default=DEFAULT_TABLE)
+
+    show = sub.add_parser("show")
+    show.add_argument("--table", default=DEFAULT_TABLE)
+    show.add_argument("--subject", default="")
+    show.add_argument("--marks", type=int, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == "show":
+        policy = GenerationPolicy.load(args.table, max_new_tokens=10 ** 6)
+        for adapter in ANSWER_FIELDS:
+            print(f"{adapter:16s} {policy.budget(adapter, args.subject, args.marks)}")
+        return
+
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+
+        def count_tokens(text):
+            return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+    else:
+        logger.warning("no --tokenizer: budgets come from %s, rebuild with the serving tokenizer", APPROX_NAME)
+        count_tokens = approx_tokens
+
+    marks = {}
+    for path in args.seeds:
+        marks.update(load_marks(path))
+
+    def marks_of(record):
+        value = record.get("marks", record.get("mark"))
+        if isinstance(value, int):
+            return value
+        return marks.get((normalize_subject(record.get("subject")), (record.get("question") or "").strip()))
+
+    records = list(iter_jsonl(args.dataset))
+    table = build_table(records, count_tokens, marks_of, args.quantile, args.headroom)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "dataset": os.path.basename(args.dataset),
+                "records": len(records),
+                "records_with_marks": sum(marks_of(r) is not None for r in records),
+                "tokenizer": args.tokenizer or APPROX_NAME,
+                "quantile": args.quantile,
+                "headroom": args.headroom,
+                "built": time.strftime("%Y-%m-%d"),
+                "command": shlex.join(["python", os.path.basename(sys.argv[0])] + sys.argv[1:]),
+            },
+            "budgets": table,
+        }, f, indent=2)
+        f.write("\n")
+
+    print(f"Wrote {args.out}")
+    print(json.dumps(coverage(table, records, count_tokens, marks_of, fixed=250), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+Ask-M inference backend: one Gemma base model with the LoRA adapters loaded
+once, requests for any adapter batched together (see engine.py).
+
+    BASE_MODEL=unsloth/gemma-3-12b-it-bnb-4bit \
+    ADAPTERS="exam=walterwhite91/ask-m-gemma3-exam-lora,guided=walterwhite91/ask-m-gemma3-guide-lora" \
+    uvicorn main:app --port 8002
+
+CPU smoke test with a tiny stand-in (any small causal LM; adapters optional):
+
+    BASE_MODEL=hf-internal-testing/tiny-random-LlamaForCausalLM ADAPTERS="" uvicorn main:app
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+
+from answer_cache import AnswerCache, Embedder
+from engine import BASE_ADAPTER, GenerationRequest, MultiLoraEngine
+from generation_policy import DEFAULT_TABLE, GenerationPolicy
+from prompts import build_prompt, prompt_prefix
+
+# code shared by the services lives one level up (backend/shared/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.admission import AdmissionController, user_key
+
+load_dotenv(dotenv_path=Path(".") / ".env")
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+
+BASE_MODEL = os.environ.get("BASE_MODEL", "unsloth/gemma-3-12b-it-bnb-4bit")
+ADAPTERS = os.environ.get(
+    "ADAPTERS",
+    "exam=walterwhite91/ask-m-gemma3-exam-lora,guided=walterwhite91/ask-m-gemma3-guide-lora",
+)
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "8"))
+BATCH_WAIT_MS = int(os.environ.get("BATCH_WAIT_MS", "10"))
+MAX_NEW_TOKENS = int(os.environ.get("MAX_NEW_TOKENS", "1024"))
+# speculative decoding for requests decoded alone (see speculative.py):
+# off | prompt_lookup | draft_model (DRAFT_MODEL must share the base vocabulary)
+SPECULATIVE = os.environ.get("SPECULATIVE", "off")
+DRAFT_MODEL = os.environ.get("DRAFT_MODEL", "google/gemma-3-270m-it")
+SPECULATIVE_LOOKAHEAD = int(os.environ.get("SPECULATIVE_LOOKAHEAD", "0")) or None
+# per-(adapter, family, marks) token budgets (see generation_policy.py)
+GENERATION_BUDGETS = os.environ.get("GENERATION_BUDGETS", DEFAULT_TABLE)
+# reuse the KV cache of each adapter's instruction prefix (see prefix_cache.py)
+PREFIX_CACHE = os.environ.get("PREFIX_CACHE", "1") != "0"
+# answers to repeated questions (see answer_cache.py); ANSWER_CACHE_EMBED_MODEL=""
+# turns the semantic tier off and leaves exact matches only
+ANSWER_CACHE = os.environ.get("ANSWER_CACHE", "1") != "0"
+ANSWER_CACHE_DB = os.environ.get("ANSWER_CACHE_DB", "answer_cache.db")
+ANSWER_CACHE_TTL_DAYS = float(os.environ.get("ANSWER_CACHE_TTL_DAYS", "30"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "20000"))
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_EMBED_MODEL = os.environ.get("ANSWER_CACHE_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# X-Admin-Token for POST /cache/invalidate; unset = the endpoint is off and
+# invalidation is CLI only (python answer_cache.py invalidate <adapter>)
+CACHE_ADMIN_TOKEN = os.environ.get("CACHE_ADMIN_TOKEN")
+# admission control (see ../shared/admission.py): generations in the engine at once,
+# queue bound in budgeted tokens, per-user running / queued limits
+GEN_MAX_RUNNING = int(os.environ.get("GEN_MAX_RUNNING", str(MAX_BATCH_SIZE)))
+GEN_MAX_QUEUED_TOKENS = int(os.environ.get("GEN_MAX_QUEUED_TOKENS", str(16 * MAX_NEW_TOKENS)))
+GEN_PER_USER_RUNNING = int(os.environ.get("GEN_PER_USER_RUNNING", "2"))
+GEN_PER_USER_QUEUED = int(os.environ.get("GEN_PER_USER_QUEUED", "4"))
+
+
+def parse_adapters(spec):
+    """
+    "exam=path,guided=path" -> {"exam": "path", "guided": "path"}
+    """
+    adapters = {}
+    for part in spec.split(","):
+        if part.strip():
+            name, _, path = part.partition("=")
+            adapters[name.strip()] = path.strip()
+    return adapters
+
+
+engine = None
+answer_cache = None
+policy = GenerationPolicy.load(GENERATION_BUDGETS, max_new_tokens=MAX_NEW_TOKENS)
+# the engine gets at most a batch worth of requests; the rest wait here, fairly
+admission = AdmissionController(
+    "Generation",
+    max_running=GEN_MAX_RUNNING,
+    max_queued_cost=GEN_MAX_QUEUED_TOKENS,
+    per_user_running=GEN_PER_USER_RUNNING,
+    per_user_queued=GEN_PER_USER_QUEUED,
+    unit="tokens",
+    # batched decode on the GPU
+    seconds_per_unit=0.01,
+)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global engine, answer_cache
+    engine = MultiLoraEngine.load(
+        BASE_MODEL,
+        parse_adapters(ADAPTERS),
+        max_batch_size=MAX_BATCH_SIZE,
+        batch_wait_ms=BATCH_WAIT_MS,
+        prefix_cache=PREFIX_CACHE,
+        speculative=SPECULATIVE,
+        draft_model=DRAFT_MODEL,
+        lookahead=SPECULATIVE_LOOKAHEAD,
+    )
+    if ANSWER_CACHE:
+        answer_cache = AnswerCache(
+            ANSWER_CACHE_DB,
+            ttl_days=ANSWER_CACHE_TTL_DAYS,
+            max_entries=ANSWER_CACHE_MAX_ENTRIES,
+            threshold=ANSWER_CACHE_THRESHOLD,
+            embedder=Embedder(ANSWER_CACHE_EMBED_MODEL) if ANSWER_CACHE_EMBED_MODEL else None,
+        )
+        # a retrained adapter deployed under the same name gets a new
+        # fingerprint, which drops the answers its old weights produced
+        for adapter in [BASE_ADAPTER] + engine.adapters:
+            answer_cache.set_adapter_version(adapter, engine.adapter_fingerprint(adapter))
+        answer_cache.prune()
+    engine.start()
+    yield
+    engine.stop()
+    if answer_cache is not None:
+        answer_cache.close()
+
+
+app = FastAPI(title="Ask-M Inference Backend", lifespan=lifespan)
+
+ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", "*").split(",")
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=ALLOWED_ORIGINS,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+class GenerateRequest(BaseModel):
+    adapter: str = "exam"
+    subject: str = ""
+    question: str = ""
+    marks: Optional[int] = None
+    # answer being followed up on (exam_followup / guided_followup adapters)
+    answer: str = ""
+    # raw prompt; skips the adapter's prompt builder
+    prompt: Optional[str] = None
+    # retrieved notes; only used as a source for prompt-lookup drafting
+    draft_context: str = ""
+    # default: the policy's budget for the adapter, subject and marks
+    max_new_tokens: Optional[int] = Field(None, ge=1, le=MAX_NEW_TOKENS)
+    temperature: float = Field(0.7, ge=0.0)
+    top_p: float = Field(0.9, gt=0.0, le=1.0)
+    stream: bool = False
+    # set false to force a fresh generation (the result still refreshes the cache)
+    use_cache: bool = True
+
+
+def cacheable(req: GenerateRequest) -> bool:
+    """
+    Only answers that depend on nothing but (adapter, subject, marks,
+    question) are shared: raw prompts and follow-ups on an answer are not.
+    """
+    return answer_cache is not None and not req.prompt and not req.answer and bool(req.question)
+
+
+async def cache_lookup(req: GenerateRequest):
+    if not (req.use_cache and cacheable(req)):
+        return None
+    # embedding the question and SQLite are blocking, keep them off the event loop
+    return await asyncio.to_thread(answer_cache.get, req.adapter, req.subject, req.marks, req.question)
+
+
+async def cache_store(req: GenerateRequest, job: GenerationRequest, text: str):
+    # cut-off or failed generations aren't worth repeating to the next user
+    if cacheable(req) and job.finish_reason == "stop" and text.strip():
+        gen_ms = job.metrics()["total_ms"] or 0.0
+        await asyncio.to_thread(answer_cache.put, req.adapter, req.subject, req.marks, req.question, text, gen_ms)
+
+
+def token_budget(req: GenerateRequest) -> int:
+    return req.max_new_tokens or policy.budget(req.adapter, req.subject, req.marks)
+
+
+async def admit(req: GenerateRequest, http_request: Request):
+    """
+    Waits for a generation slot (429 with Retry-After when the queue is
+    full); the ticket must be released once the generation is over.
+    """
+    return await admission.acquire(user_key(http_request), token_budget(req))
+
+
+def submit(req: GenerateRequest, ticket) -> GenerationRequest:
+    try:
+        if req.prompt:
+            prompt, prefix, markers = req.prompt, None, ()
+        else:
+            prompt = build_prompt(req.adapter, req.subject, req.question, req.marks, req.answer)
+            prefix, markers = prompt_prefix(prompt), policy.stop_markers(req.adapter)
+        return engine.submit(GenerationRequest(
+            prompt,
+            req.adapter,
+            max_new_tokens=token_budget(req),
+            temperature=req.temperature,
+            top_p=req.top_p,
+            prefix=prefix,
+            stop_markers=markers,
+            draft_context=req.draft_context,
+        ))
+    except ValueError as e:
+        admission.release(ticket)
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def release_job(job: GenerationRequest, ticket):
+    # idempotent; also the streaming responses' background task, which runs
+    # even when the client left before the body started
+    job.cancel()
+    admission.release(ticket)
+
+
+def finish(job: GenerationRequest, ticket, marks):
+    release_job(job, ticket)
+    policy.record(job, marks)
+
+
+@app.post("/generate")
+async def generate(req: GenerateRequest, http_request: Request):
+    started = time.perf_counter()
+    hit = await cache_lookup(req)
+    if hit:
+        if req.stream:
+            return StreamingResponse(iter([hit["answer"]]), media_type="text/plain; charset=utf-8")
+        return {
+            "status": "success",
+            "adapter": req.adapter,
+            "text": hit["answer"],
+            "new_tokens": 0,
+            "finish_reason": "cached",
+            "cache": hit,
+            "metrics": cached_metrics(started),
+        }
+
+    ticket = await admit(req, http_request)
+    job = submit(req, ticket)
+
+    if req.stream:
+        async def body():
+            chunks = []
+            try:
+                async for chunk in job.stream():
+                    chunks.append(chunk)
+                    yield chunk
+                await cache_store(req, job, "".join(chunks))
+            finally:
+                finish(job, ticket, req.marks)
+
+        return StreamingResponse(
+            body(),
+            media_type="text/plain; charset=utf-8",
+            background=BackgroundTask(release_job, job, ticket),
+        )
+
+    try:
+        text = "".join([chunk async for chunk in job.stream()])
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=f"Generation failed: {e}")
+    finally:
+        finish(job, ticket, req.marks)
+
+    await cache_store(req, job, text)
+    return {
+        "status": "success",
+        "adapter": job.adapter,
+        "text": text,
+        "new_tokens": job.new_tokens,
+        "finish_reason": job.finish_reason,
+        "metrics": job.metrics(),
+    }
+
+
+def cached_metrics(started):
+    """
+    job.metrics() shape for an answer served from the cache: the lookup
+    is the time to first token, and nothing was queued or decoded.
+    """
+    ms = round((time.perf_counter() - started) * 1000, 1)
+    return {
+        "new_tokens": 0,
+        "max_new_tokens": None,
+        "stop_marker": None,
+        "prefix_tokens_reused": None,
+        "draft_acceptance": None,
+        "queue_ms": None,
+        "ttft_ms": ms,
+        "prefill_ms": None,
+        "total_ms": ms,
+        "tokens_per_sec": None,
+    }
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/generate/stream")
+async def generate_stream(req: GenerateRequest, http_request: Request):
+    """
+    Server-sent events: `token` events ({"text"}) as tokens decode, then one
+    `done` event with finish_reason, ttft_ms and tokens_per_sec, or `error`.
+    A client disconnect cancels the request and frees its slot in the batch.
+    A cached answer comes back as a single `token` event, then `done` with
+    finish_reason "cached", the cache tier and the same metrics (ttft_ms is
+    the lookup, tokens_per_sec null). A full queue is a 429 with Retry-After
+    before the stream starts.
+    """
+    started = time.perf_counter()
+    hit = await cache_lookup(req)
+    if hit:
+        async def cached_events():
+            yield sse("token", {"text": hit["answer"]})
+            yield sse("done", {"adapter": req.adapter, "finish_reason": "cached", "cache": hit,
+                               **cached_metrics(started)})
+
+        return StreamingResponse(
+            cached_events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    ticket = await admit(req, http_request)
+    job = submit(req, ticket)
+
+    async def watch_disconnect():
+        # also covers requests still waiting in the queue, before any token is sent
+        while job.finish_reason is None:
+            if await http_request.is_disconnected():
+                job.cancel()
+                return
+            await asyncio.sleep(0.25)
+
+    async def events():
+        watcher = asyncio.create_task(watch_disconnect())
+        chunks = []
+        try:
+            async for chunk in job.stream():
+                chunks.append(chunk)
+                yield sse("token", {"text": chunk})
+            await cache_store(req, job, "".join(chunks))
+            yield sse("done", {"adapter": job.adapter, "finish_reason": job.finish_reason, **job.metrics()})
+        except RuntimeError as e:
+            yield sse("error", {"detail": f"Generation failed: {e}"})
+        finally:
+            watcher.cancel()
+            finish(job, ticket, req.marks)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # no proxy buffering, or the tokens arrive in one lump at the end
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release_job, job, ticket),
+    )
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "base_model": BASE_MODEL,
+        "adapters": [BASE_ADAPTER] + engine.adapters,
+        "engine": engine.stats(),
+        "answer_cache": answer_cache.summary() if answer_cache is not None else None,
+        "generation_policy": policy.summary(),
+        "admission": admission.summary(),
+    }
+
+
+@app.get("/admission")
+async def admission_stats():
+    """
+    Queue depth, wait times (p50/p95/max) and rejections of the generation
+    queue.
+    """
+    return admission.summary()
+
+
+class InvalidateRequest(BaseModel):
+    adapter: str
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit rate per tier and generation time saved (sum of the original
+    generation times of the answers served from cache).
+    """
+    if answer_cache is None:
+        raise HTTPException(status_code=404, detail="answer cache is disabled")
+    return await asyncio.to_thread(answer_cache.summary)
+
+
+@app.post("/cache/invalidate")
+async def cache_invalidate(req: InvalidateRequest, x_admin_token: str = Header("")):
+    if not CACHE_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="cache invalidation is CLI only (set CACHE_ADMIN_TOKEN)")
+    if not hmac.compare_digest(x_admin_token.encode(), CACHE_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    if answer_cache is None:
+        raise HTTPException(status_code=404, detail="answer cache is disabled")
+    removed = await asyncio.to_thread(answer_cache.invalidate, req.adapter)
+    return {"status": "success", "adapter": req.adapter, "removed": removed}
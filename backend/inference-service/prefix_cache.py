@@ -0,0 +1,113 @@
+"""
+Reusable KV cache for the fixed instruction prefix of each adapter's prompts.
+
+Every exam prompt starts with the same instruction paragraph (one per marks
+value), every guided prompt with another, and so on. The bank prefills each
+(adapter, prefix) once, under that adapter, and keeps the KV as one row of a
+batched cache. All rows are left-padded to the same length, so a batch that
+mixes adapters just gathers the rows it needs (index_select per layer) and
+prefills only the subject/marks/question suffix after them.
+
+A prompt only reuses a row if its token ids really start with the prefix's
+token ids, so a tokenizer merging across the boundary can't change outputs.
+"""
+import copy
+
+import torch
+
+
+def left_pad(seqs, pad_id, device):
+    """
+    List of token id lists -> (ids, mask), left-padded to the longest.
+    """
+    width = max(len(s) for s in seqs)
+    ids = torch.full((len(seqs), width), pad_id, dtype=torch.long)
+    mask = torch.zeros((len(seqs), width), dtype=torch.long)
+    for i, s in enumerate(seqs):
+        if s:
+            ids[i, width - len(s):] = torch.tensor(s, dtype=torch.long)
+            mask[i, width - len(s):] = 1
+    return ids.to(device), mask.to(device)
+
+
+def select_rows(cache, index):
+    """
+    New cache holding only the `index` rows of `cache`, which is left as is.
+    index_select copies just those rows of each layer's keys / values; the
+    cache and layer objects are shallow copies around the new tensors.
+    """
+    batch = copy.copy(cache)
+    if hasattr(cache, "layers"):
+        batch.layers = []
+        for layer in cache.layers:
+            layer = copy.copy(layer)
+            if getattr(layer, "keys", None) is not None and layer.keys.numel():
+                layer.keys = layer.keys.index_select(0, index)
+                layer.values = layer.values.index_select(0, index)
+            batch.layers.append(layer)
+    else:
+        # transformers < 4.56: per-layer tensor lists on the cache itself
+        batch.key_cache = [k.index_select(0, index) for k in cache.key_cache]
+        batch.value_cache = [v.index_select(0, index) for v in cache.value_cache]
+    return batch
+
+
+class PrefixBank:
+    def __init__(self, max_prefixes=64):
+        self.max_prefixes = max_prefixes
+        self.rows = {}        # (adapter, prefix text) -> row
+        self.adapters = []    # adapter of each row
+        self.token_ids = []   # prefix token ids of each row
+        self.cache = None
+        self.mask = None
+        self.stale = False
+        self.builds = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def lookup(self, adapter, prefix, tokenizer):
+        """
+        Row for (adapter, prefix), registering it if there is room.
+        None when the bank is full.
+        """
+        key = (adapter, prefix)
+        if key not in self.rows:
+            if len(self.rows) >= self.max_prefixes:
+                return None
+            self.rows[key] = len(self.rows)
+            self.adapters.append(adapter)
+            self.token_ids.append(tokenizer(prefix)["input_ids"])
+            self.stale = True
+        return self.rows[key]
+
+    def build(self, model, pad_id, device, adapter_kwargs):
+        """
+        One forward over every registered prefix. Re-run whenever a new prefix
+        is registered; the set is small (adapters x marks values).
+        """
+        ids, mask = left_pad(self.token_ids, pad_id, device)
+        out = model(
+            input_ids=ids,
+            attention_mask=mask,
+            position_ids=(mask.cumsum(-1) - 1).clamp(min=0),
+            use_cache=True,
+            **adapter_kwargs(self.adapters),
+        )
+        self.cache = out.past_key_values
+        self.mask = mask
+        self.stale = False
+        self.builds += 1
+
+    def gather(self, rows):
+        """
+        Batch cache + attention mask for `rows` (None = row reuses nothing:
+        it gets row 0's KV fully masked out).
+        """
+        index = torch.tensor([row or 0 for row in rows], device=self.mask.device)
+        cache = select_rows(self.cache, index)
+        mask = self.mask[index].clone()
+        for i, row in enumerate(rows):
+            if row is None:
+                mask[i] = 0
+        return cache, mask
@@ -0,0 +1,82 @@
+# Prompt builders, one per adapter. exam/guided are the inference notebook's
+# builders verbatim; the follow-up ones match final_splitter.py's templates
+# (instruction + input + "Answer:"), which is what those adapters were trained on.
+
+
+def build_exam_prompt(subject: str, question: str, marks: int) -> str:
+    return f"""You are an exam-answering assistant. Write an answer appropriate for a {marks}-mark question. Be clear, correct, and concise. Do not add follow-up questions.
+
+Subject: {subject}
+Marks: {marks}
+Question: {question}
+
+Answer:
+"""
+
+
+def build_guided_prompt(subject: str, question: str) -> str:
+    return f"""You are a tutor. Explain the concept clearly and step-by-step for learning. Use simple language and structure the explanation well.
+
+Subject: {subject}
+Question: {question}
+
+Explanation:
+"""
+
+
+def build_exam_followup_prompt(subject: str, question: str, marks: int, answer: str) -> str:
+    return f"""Generate exam-style follow-up questions that test understanding of the given answer. Do not provide answers.
+
+Subject: {subject}
+Original Marks: {marks}
+Original Question: {question}
+Exam Answer: {answer}
+
+Answer:
+"""
+
+
+def build_guided_followup_prompt(subject: str, answer: str) -> str:
+    return f"""Generate learning-focused follow-up questions based on the explanation. Do not provide answers.
+
+Subject: {subject}
+Explanation: {answer}
+
+Answer:
+"""
+
+
+def prompt_prefix(prompt):
+    """
+    The instruction paragraph every builder starts with, up to and including
+    the first blank line. It is fixed per adapter (per marks value for exam),
+    so the inference engine can reuse its KV cache across requests.
+    """
+    end = prompt.find("\n\n")
+    return prompt[:end + 2] if end != -1 else None
+
+
+def build_prompt(adapter, subject="", question="", marks=None, answer=""):
+    """
+    Prompt for `adapter` from the request fields. Raises ValueError if the
+    adapter has no builder or a required field is missing.
+    """
+    if adapter == "exam":
+        _require(adapter, question=question, marks=marks)
+        return build_exam_prompt(subject, question, marks)
+    if adapter == "guided":
+        _require(adapter, question=question)
+        return build_guided_prompt(subject, question)
+    if adapter == "exam_followup":
+        _require(adapter, question=question, marks=marks, answer=answer)
+        return build_exam_followup_prompt(subject, question, marks, answer)
+    if adapter == "guided_followup":
+        _require(adapter, answer=answer)
+        return build_guided_followup_prompt(subject, answer)
+    raise ValueError(f"no prompt builder for adapter '{adapter}', send a raw prompt instead")
+
+
+def _require(adapter, **fields):
+    missing = [name for name, value in fields.items() if value in (None, "")]
+    if missing:
+        raise ValueError(f"adapter '{adapter}' needs: {', '.join(missing)}")
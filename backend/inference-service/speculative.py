@@ -0,0 +1,171 @@
+"""
+Speculative decoding for a request that has the GPU to itself.
+
+A 12B model in 4-bit is memory-bandwidth-bound at batch size 1: a forward
+pass over 1 token costs about the same as over 8. A drafter guesses the
+next `lookahead` tokens cheaply, the LoRA'd model scores all of them in a
+single forward, and every guess it agrees with is a token for free.
+
+Drafters:
+    prompt_lookup  the n-gram the answer just produced is looked up in the
+                   prompt, the retrieved notes (`draft_context`) and the
+                   answer so far; the tokens that followed it are the draft.
+                   No extra model, works best when answers quote the
+                   question or notes.
+    draft_model    a small model with the same vocabulary (e.g.
+                   google/gemma-3-270m-it for Gemma 3) drafts greedily with
+                   its own KV cache. It runs without LoRA; only the target's
+                   (LoRA'd) distribution decides what is accepted.
+
+Verification keeps the target's output distribution: drafts are
+deterministic, so a drafted token x is accepted with probability p(x) under
+the request's temperature/top-p (for greedy: if it is the argmax), and the
+first rejected position is resampled from p with x removed. With
+temperature 0 the output is identical to plain decoding.
+
+Only used when a batch is down to one live row; with several rows batching
+already amortises the weight reads.
+"""
+import torch
+
+
+def target_probs(logits, temperature, top_p):
+    """
+    [n, vocab] logits -> the distribution sample_next() samples from.
+    """
+    probs = torch.softmax(logits.float() / max(temperature, 1e-5), dim=-1)
+    sorted_probs, sorted_idx = probs.sort(dim=-1, descending=True)
+    cutoff = (sorted_probs.cumsum(dim=-1) - sorted_probs) > top_p
+    sorted_probs = sorted_probs.masked_fill(cutoff, 0.0)
+    filtered = torch.zeros_like(probs).scatter(-1, sorted_idx, sorted_probs)
+    return filtered / filtered.sum(dim=-1, keepdim=True)
+
+
+def verify(logits, draft, temperature, top_p):
+    """
+    logits: [k + 1, vocab] target logits for the positions after the last
+    accepted token and each of the k drafted ones. Returns (accepted, next):
+    how many drafted tokens to keep and the target's token after them.
+    """
+    if temperature <= 0:
+        choices = logits.argmax(dim=-1).tolist()
+        accepted = 0
+        while accepted < len(draft) and choices[accepted] == draft[accepted]:
+            accepted += 1
+        return accepted, choices[accepted]
+
+    probs = target_probs(logits, temperature, top_p)
+    for i, token in enumerate(draft):
+        if torch.rand(()) < probs[i, token]:
+            continue
+        residual = probs[i].clone()
+        residual[token] = 0.0
+        return i, int(torch.multinomial(residual / residual.sum(), 1))
+    return len(draft), int(torch.multinomial(probs[len(draft)], 1))
+
+
+# -----------------------------
+# Drafters
+# -----------------------------
+class PromptLookupDrafter:
+    def __init__(self, lookahead=8, max_ngram=3):
+        self.lookahead = lookahead
+        self.max_ngram = max_ngram
+
+    def start(self, source_ids):
+        # notes / question tokens that aren't part of the running sequence
+        self.source = list(source_ids)
+
+    def propose(self, ids, k):
+        """
+        Tokens that followed the latest earlier occurrence of the longest
+        trailing n-gram of `ids`.
+        """
+        k = min(k, self.lookahead)
+        haystack = self.source + ids
+        skip = len(self.source)
+        for n in range(min(self.max_ngram, len(ids)), 0, -1):
+            tail = ids[-n:]
+            # newest match first; the match must not be the tail itself
+            for start in range(len(haystack) - n - 1, -1, -1):
+                if haystack[start:start + n] == tail and start + n < len(haystack):
+                    end = start + n
+                    draft = haystack[end:end + k]
+                    # a match inside the notes shouldn't run on into the answer
+                    if start < skip:
+                        draft = haystack[end:min(end + k, skip)]
+                    if draft:
+                        return draft
+        return []
+
+
+class DraftModelDrafter:
+    def __init__(self, model, lookahead=4):
+        self.model = model
+        self.lookahead = lookahead
+        self.device = next(model.parameters()).device
+
+    def start(self, source_ids):
+        self.cache = None
+        self.cached = []  # token ids whose KV is in self.cache
+
+    @torch.inference_mode()
+    def propose(self, ids, k):
+        k = min(k, self.lookahead)
+        if k <= 0:
+            return []
+
+        # drop whatever the target rejected since the last proposal
+        common = 0
+        for a, b in zip(self.cached, ids):
+            if a != b:
+                break
+            common += 1
+        common = min(common, len(ids) - 1)
+        if self.cache is not None and common < len(self.cached):
+            self.cache.crop(-(len(self.cached) - common))
+            self.cached = self.cached[:common]
+
+        pending = ids[len(self.cached):]
+        draft = []
+        for _ in range(k):
+            out = self.model(
+                input_ids=torch.tensor([pending], device=self.device),
+                past_key_values=self.cache,
+                use_cache=True,
+            )
+            if self.cache is None and hasattr(out.past_key_values, "activate_past_recording"):
+                # sliding-window layers otherwise can't roll back rejected drafts
+                out.past_key_values.activate_past_recording()
+            self.cache = out.past_key_values
+            self.cached += pending
+            token = int(out.logits[0, -1].argmax())
+            draft.append(token)
+            pending = [token]
+        return draft
+
+
+def load_drafter(mode, tokenizer, draft_model=None, lookahead=None, max_ngram=3, device=None):
+    """
+    Drafter for SPECULATIVE=prompt_lookup|draft_model, or None for "off".
+    Raises ValueError for an unknown mode or a draft model whose vocabulary
+    doesn't match the tokenizer's.
+    """
+    if mode in (None, "", "off"):
+        return None
+    if mode == "prompt_lookup":
+        return PromptLookupDrafter(lookahead or 8, max_ngram)
+    if mode == "draft_model":
+        if not draft_model:
+            raise ValueError("SPECULATIVE=draft_model needs DRAFT_MODEL")
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        draft_tokenizer = AutoTokenizer.from_pretrained(draft_model)
+        if draft_tokenizer.get_vocab() != tokenizer.get_vocab():
+            raise ValueError(f"draft model {draft_model} doesn't share the base model's vocabulary")
+        model = AutoModelForCausalLM.from_pretrained(
+            draft_model,
+            torch_dtype=torch.float16 if device is not None and device.type == "cuda" else torch.float32,
+        ).to(device or "cpu").eval()
+        return DraftModelDrafter(model, lookahead or 4)
+    raise ValueError(f"unknown SPECULATIVE mode '{mode}' (off, prompt_lookup, draft_model)")
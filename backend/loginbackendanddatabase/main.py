@@ -1,16 +1,21 @@
 import os
-from fastapi import FastAPI, HTTPException, Header
+import time
+from fastapi import FastAPI, HTTPException, Header, Request
 from supabase import create_client, Client
 from dotenv import load_dotenv
 from pathlib import Path
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from structured_logging import configure_logging, get_logger, mask_email, start_request, request_timings, timed
 
 # Load environment variables
 env_path = Path('.') / '.env'
 load_dotenv(dotenv_path=env_path)
 
+configure_logging()
+logger = get_logger("askm.auth")
+
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI()
@@ -25,12 +30,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """
+    Tags every log line with a request id and logs one summary line per request
+    with total latency plus any per-stage timings recorded via `timed()`.
+    """
+    request_id = start_request(request.headers.get("X-Request-ID"))
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        logger.info(
+            "request completed",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                **request_timings(),
+            },
+        )
+
 # Supabase Configuration
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
 
 if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    print("WARNING: SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY not found in environment variables.")
+    logger.warning("SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY not found in environment variables.")
 
 # Create Supabase client with Service Role key (to bypass RLS for administrative tasks)
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
@@ -41,21 +72,20 @@ async def root():
 
 async def send_welcome_email(email: str, name: str):
     """
-    Sends a real Welcome Email using Gmail SMTP with detailed logging.
+    Sends a real Welcome Email using Gmail SMTP.
     """
     smtp_host = os.getenv("SMTP_HOST", "smtp.gmail.com")
     smtp_port = int(os.getenv("SMTP_PORT", 587))
     smtp_user = os.getenv("SMTP_USER")
     smtp_pass = os.getenv("SMTP_PASS")
 
-    print(f"DEBUG: SMTP Config - Host: {smtp_host}, Port: {smtp_port}, User: {smtp_user}, Pass loaded: {'Yes' if smtp_pass else 'No'}")
+    logger.debug("smtp config", extra={"smtp_host": smtp_host, "smtp_port": smtp_port, "smtp_pass_loaded": bool(smtp_pass)})
 
     if not smtp_user or not smtp_pass:
-        print("DEBUG: SMTP credentials missing in .env file. Skipping email.")
+        logger.warning("SMTP credentials missing in .env file. Skipping email.")
         return False
 
     try:
-        print(f"DEBUG: Preparing email for {email}...")
         msg = MIMEMultipart()
         msg['From'] = smtp_user
         msg['To'] = email
@@ -72,7 +102,6 @@ async def send_welcome_email(email: str, name: str):
         """
         msg.attach(MIMEText(body, 'plain'))
 
-        print(f"DEBUG: Connecting to {smtp_host}:{smtp_port}...")
         if smtp_port == 465:
             # Use SSL for port 465
             server_context = smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=10)
@@ -80,29 +109,22 @@ async def send_welcome_email(email: str, name: str):
             # Use STARTTLS for port 587
             server_context = smtplib.SMTP(smtp_host, smtp_port, timeout=10)
 
-        with server_context as server:
-            server.set_debuglevel(1)
+        with timed("smtp"), server_context as server:
             if smtp_port != 465:
-                print("DEBUG: Starting TLS...")
                 server.starttls()
-            
-            print(f"DEBUG: Logging in as {smtp_user}...")
             server.login(smtp_user, smtp_pass)
-            print("DEBUG: Sending message...")
             server.send_message(msg)
-            
-        print(f"DEBUG: Welcome email sent successfully to {email}")
+
+        logger.info("welcome email sent", extra={"to": mask_email(email)})
         return True
     except smtplib.SMTPAuthenticationError:
-        print("ERROR: SMTP Authentication Failed. Check your email and App Password.")
+        logger.error("SMTP Authentication Failed. Check your email and App Password.")
         return False
     except smtplib.SMTPConnectError:
-        print("ERROR: Could not connect to the SMTP server. Check host/port and firewall.")
+        logger.error("Could not connect to the SMTP server. Check host/port and firewall.", extra={"smtp_host": smtp_host, "smtp_port": smtp_port})
         return False
-    except Exception as e:
-        print(f"ERROR: General failure sending email: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("General failure sending email")
         return False
 
 @app.post("/auth/verify")
@@ -111,14 +133,14 @@ async def verify_user(authorization: str = Header(None)):
     Receives a JWT from the frontend, verifies it with Supabase,
     and ensures the user exists in the 'profiles' table without overwriting data.
     """
-    print("DEBUG: Sync request received at /auth/verify")
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization Header")
     
     token = authorization.replace("Bearer ", "")
     
     try:
-        user_response = supabase.auth.get_user(token)
+        with timed("supabase_auth"):
+            user_response = supabase.auth.get_user(token)
         user = user_response.user
         if not user:
             raise HTTPException(status_code=401, detail="Invalid token")
@@ -130,7 +152,8 @@ async def verify_user(authorization: str = Header(None)):
         avatar_url = metadata.get("avatar_url") or metadata.get("picture", "")
 
         # 3. Sync with 'profiles' table - FIXED: Don't overwrite existing phone/address/etc.
-        existing = supabase.table("profiles").select("*").eq("id", user_id).execute()
+        with timed("supabase_select"):
+            existing = supabase.table("profiles").select("*").eq("id", user_id).execute()
         
         profile_data = {
             "id": user_id,
@@ -141,15 +164,15 @@ async def verify_user(authorization: str = Header(None)):
         
         if not existing.data:
             # FIRST LOGIN: Create profile and send welcome email
-            print(f"DEBUG: New user detected: {email}. Sending welcome email...")
-            supabase.table("profiles").insert(profile_data).execute()
+            logger.info("new user, creating profile", extra={"user_id": user_id})
+            with timed("supabase_write"):
+                supabase.table("profiles").insert(profile_data).execute()
             await send_welcome_email(email, full_name or "New User")
         else:
             # SUBSEQUENT LOGINS: Sync metadata only if it differs from database
             # This prevents stale metadata from overwriting custom updates in the database
             db_profile = existing.data[0]
-            print(f"DEBUG: Syncing metadata for existing user: {email}")
-            
+
             update_payload = {"updated_at": "now()"}
             should_update = False
 
@@ -163,10 +186,11 @@ async def verify_user(authorization: str = Header(None)):
                 should_update = True
                 
             if should_update:
-                print(f"DEBUG: Metadata differs from DB for {email}, updating...")
-                supabase.table("profiles").update(update_payload).eq("id", user_id).execute()
+                logger.debug("profile metadata changed, updating", extra={"user_id": user_id})
+                with timed("supabase_write"):
+                    supabase.table("profiles").update(update_payload).eq("id", user_id).execute()
             else:
-                print(f"DEBUG: Metadata for {email} matches DB or is empty, skipping update.")
+                logger.debug("profile metadata unchanged", extra={"user_id": user_id})
         
         return {
             "status": "success",
@@ -175,5 +199,5 @@ async def verify_user(authorization: str = Header(None)):
         }
 
     except Exception as e:
-        print(f"Verification Error: {str(e)}")
+        logger.warning("verification failed", extra={"error": f"{type(e).__name__}: {e}"})
         raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
@@ -0,0 +1,122 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+# Per-request context. Set by the middleware in main.py and read by the
+# formatter, so handlers never have to pass request ids around by hand.
+_request_id = contextvars.ContextVar("request_id", default=None)
+_timings = contextvars.ContextVar("timings", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra=`.
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, msg, request_id + extra fields.
+    """
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+
+        request_id = _request_id.get()
+        if request_id:
+            entry["request_id"] = request_id
+
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of records below WARNING. Warnings and errors always pass.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+def configure_logging():
+    """
+    LOG_LEVEL (default INFO), LOG_SAMPLE_RATE (0..1, default 1) and
+    LOG_FORMAT ("json" or "text") come from the environment.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    sample_rate = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+    handler = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json") == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+
+def mask_email(email) -> str:
+    """
+    a***@gmail.com - enough to correlate, not enough to leak.
+    """
+    if not email or "@" not in email:
+        return "<none>"
+    local, domain = email.split("@", 1)
+    return f"{local[:1]}***@{domain}"
+
+
+# ---------------- REQUEST CONTEXT ----------------
+
+def start_request(request_id=None) -> str:
+    request_id = request_id or uuid.uuid4().hex
+    _request_id.set(request_id)
+    _timings.set({})
+    return request_id
+
+
+def request_timings() -> dict:
+    return dict(_timings.get() or {})
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Adds the elapsed milliseconds of the block to the current request's
+    timing fields (logged once when the request completes).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _timings.get()
+        if timings is not None:
+            elapsed = (time.perf_counter() - start) * 1000
+            timings[f"{stage}_ms"] = round(timings.get(f"{stage}_ms", 0.0) + elapsed, 2)
@@ -0,0 +1,159 @@
+# benchmark_ocr_routing.py
+"""
+TrOCR-only vs routed (printed lines -> PaddleOCR, handwriting -> TrOCR)
+on a folder of mixed documents: typed handouts, printed question papers,
+handwritten notes, pages with both.
+
+Every page image / PDF in --data needs a ground-truth <name>.txt next to
+it (for a PDF, the text of all its pages). Pages are recognised without
+the page cache, once per mode; prints seconds per page, lines routed to
+each engine and the character / word error rate against the ground truth,
+per document and overall.
+
+    python benchmark_ocr_routing.py --data bench_docs/
+    python benchmark_ocr_routing.py --data bench_docs/ --modes auto --json
+"""
+import argparse
+import io
+import json
+import os
+import re
+import time
+
+from ocr_pipeline import ocr_image_bytes, routing_counts, routing_enabled
+from pdf_utils import pdf_bytes_to_images
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+
+
+def load_documents(folder):
+    docs = []
+    for name in sorted(os.listdir(folder)):
+        stem, ext = os.path.splitext(name)
+        truth = os.path.join(folder, stem + ".txt")
+        if ext.lower() not in IMAGE_EXTENSIONS + (".pdf",) or not os.path.exists(truth):
+            continue
+        with open(os.path.join(folder, name), "rb") as f:
+            data = f.read()
+        if ext.lower() == ".pdf":
+            pages = []
+            for page in pdf_bytes_to_images(data):
+                buf = io.BytesIO()
+                page.save(buf, format="PNG")
+                pages.append(buf.getvalue())
+        else:
+            pages = [data]
+        with open(truth, encoding="utf-8") as f:
+            docs.append((name, pages, f.read()))
+    return docs
+
+
+def normalize(text):
+    text = re.sub(r"--- Page \d+ ---", " ", text)
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y)))
+        previous = current
+    return previous[-1]
+
+
+def error_rates(predicted, truth):
+    predicted, truth = normalize(predicted), normalize(truth)
+    words = truth.split()
+    return {
+        "cer": round(edit_distance(predicted, truth) / max(1, len(truth)), 4),
+        "wer": round(edit_distance(predicted.split(), words) / max(1, len(words)), 4),
+    }
+
+
+def run_mode(docs, routed):
+    rows = []
+    for name, pages, truth in docs:
+        before = routing_counts()
+        start = time.perf_counter()
+        text = "\n".join(ocr_image_bytes(page, routing=routed) for page in pages)
+        seconds = time.perf_counter() - start
+        after = routing_counts()
+        delta = {k: after.get(k, 0) - before.get(k, 0) for k in after}
+        rows.append({
+            "document": name,
+            "pages": len(pages),
+            "seconds_per_page": round(seconds / len(pages), 2),
+            "printed_lines": delta.get("printed_lines", 0),
+            "handwritten_lines": delta.get("handwritten_lines", 0),
+            "printed_fallbacks": delta.get("printed_fallbacks", 0),
+            "trocr_lines": delta.get("trocr_lines", 0),
+            "seconds": seconds,
+            **error_rates(text, truth),
+        })
+    return rows
+
+
+def overall(rows):
+    pages = sum(r["pages"] for r in rows)
+    seconds = sum(r["seconds"] for r in rows)
+    return {
+        "pages": pages,
+        "seconds_per_page": round(seconds / pages, 2),
+        "pages_per_minute": round(60 * pages / seconds, 1),
+        "printed_lines": sum(r["printed_lines"] for r in rows),
+        "handwritten_lines": sum(r["handwritten_lines"] for r in rows),
+        "printed_fallbacks": sum(r["printed_fallbacks"] for r in rows),
+        "trocr_lines": sum(r["trocr_lines"] for r in rows),
+        # page-weighted
+        "cer": round(sum(r["cer"] * r["pages"] for r in rows) / pages, 4),
+        "wer": round(sum(r["wer"] * r["pages"] for r in rows) / pages, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR recogniser routing on mixed documents")
+    parser.add_argument("--data", required=True, help="folder of images / PDFs with <name>.txt ground truth")
+    parser.add_argument("--modes", default="handwritten,auto", help="handwritten = TrOCR only, auto = routed")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    docs = load_documents(args.data)
+    if not docs:
+        raise SystemExit(f"No documents with ground truth in {args.data}")
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    if "auto" in modes and not routing_enabled():
+        raise SystemExit("Printed-text engine unavailable (pip install paddlepaddle paddleocr)")
+
+    # warm-up: model loading shouldn't count against the first mode
+    ocr_image_bytes(docs[0][1][0], routing="auto" in modes)
+
+    report = {}
+    for mode in modes:
+        rows = run_mode(docs, routed=mode == "auto")
+        report[mode] = {"overall": overall(rows), "documents": rows}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for mode, result in report.items():
+        print(f"\n=== {mode} ===")
+        for r in result["documents"]:
+            print(
+                f"{r['document'][:40]:40s} pages={r['pages']:3d} s/page={r['seconds_per_page']:7.2f} "
+                f"printed={r['printed_lines']:4d} hand={r['handwritten_lines']:4d} "
+                f"fallback={r['printed_fallbacks']:3d} trocr={r['trocr_lines']:4d} CER={r['cer']:.3f} WER={r['wer']:.3f}"
+            )
+        print("overall:", json.dumps(result["overall"]))
+
+    if {"handwritten", "auto"} <= report.keys():
+        base, routed = report["handwritten"]["overall"], report["auto"]["overall"]
+        print(f"\nspeedup: {base['seconds_per_page'] / routed['seconds_per_page']:.2f}x, "
+              f"CER {base['cer']:.3f} -> {routed['cer']:.3f}, WER {base['wer']:.3f} -> {routed['wer']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# line_classify.py
+import cv2
+import numpy as np
+
+# Printed text sits on a straight baseline with near-identical letter
+# heights; handwriting wanders. Measured on a line crop from
+# segment_lines_from_image_bytes, on its connected components:
+#   off_baseline   share of components whose bottom is off the fitted
+#                  (skew-corrected) baseline - descenders and punctuation
+#                  keep this around 0.1-0.2 for print
+#   height_spread  median absolute deviation of component heights / median
+PRINTED_MAX_OFF_BASELINE = 0.3
+PRINTED_MAX_HEIGHT_SPREAD = 0.12
+MIN_COMPONENTS = 6
+MIN_COMPONENT_AREA = 12
+
+def line_features(line):
+    ink = cv2.adaptiveThreshold(
+        line, 255,
+        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY_INV,
+        31, 15
+    )
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    boxes = stats[1:]
+    boxes = boxes[boxes[:, cv2.CC_STAT_AREA] >= MIN_COMPONENT_AREA]
+
+    # too little to judge (a lone word, a formula fragment)
+    if len(boxes) < MIN_COMPONENTS:
+        return None
+
+    heights = boxes[:, cv2.CC_STAT_HEIGHT].astype(float)
+    bottoms = boxes[:, cv2.CC_STAT_TOP] + heights
+    centers = boxes[:, cv2.CC_STAT_LEFT] + boxes[:, cv2.CC_STAT_WIDTH] / 2
+    median_height = np.median(heights)
+    tolerance = max(2.0, 0.12 * median_height)
+
+    # fit the baseline, drop what's off it (descenders), refit
+    on_baseline = np.ones(len(boxes), bool)
+    for _ in range(3):
+        slope, intercept = np.polyfit(centers[on_baseline], bottoms[on_baseline], 1)
+        on_baseline = np.abs(bottoms - (slope * centers + intercept)) <= tolerance
+        if on_baseline.sum() < 3:
+            break
+
+    return {
+        "off_baseline": float(1 - on_baseline.mean()),
+        "height_spread": float(np.median(np.abs(heights - median_height)) / median_height),
+    }
+
+def is_printed(line):
+    features = line_features(line)
+    return (
+        features is not None
+        and features["off_baseline"] <= PRINTED_MAX_OFF_BASELINE
+        and features["height_spread"] <= PRINTED_MAX_HEIGHT_SPREAD
+    )
@@ -1,27 +1,131 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from r2 import download_from_r2
-from ocr_pipeline import run_ocr
+from ocr_pipeline import get_page_cache, routing_stats, run_ocr
+from pdf_utils import pdf_page_count
+
+# code shared by the services lives one level up (backend/shared/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.admission import AdmissionController, user_key
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Ask-M OCR Backend")
 
+# OCR is CPU-bound: a few documents at a time, one per user, and a queue
+# bounded in pages (see ../shared/admission.py)
+admission = AdmissionController(
+    "OCR",
+    max_running=int(os.getenv("OCR_WORKERS", "2")),
+    max_queued_cost=int(os.getenv("OCR_MAX_QUEUED_PAGES", "300")),
+    per_user_running=int(os.getenv("OCR_PER_USER_RUNNING", "1")),
+    per_user_queued=int(os.getenv("OCR_PER_USER_QUEUED", "2")),
+    unit="pages",
+    # TrOCR on CPU, line by line
+    seconds_per_unit=5.0,
+)
+
+# built on first use: loading the embedding model / opening Qdrant is slow
+_index = None
+# /search and indexing call this from worker threads; embedded Qdrant
+# can only be opened once
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            from vector_index import VectorIndex
+            _index = VectorIndex()
+    return _index
+
+
 class OCRRequest(BaseModel):
     bucket: str = "ask-m-notes"
-    file_key: str 
+    file_key: str
+    # payload for the search index
+    subject: Optional[str] = None
+    semester: Optional[int] = None
+    index: bool = True
+
+class SearchRequest(BaseModel):
+    query: str
+    subject: Optional[str] = None
+    # question-bank records only have one if indexed with --seeds (see vector_index.py)
+    semester: Optional[int] = None
+    source: Optional[str] = None  # "notes" or "question_bank"
+    limit: int = 5
 
 @app.post("/process-ocr")
-async def process_ocr(req: OCRRequest):
+async def process_ocr(req: OCRRequest, request: Request):
+    user = user_key(request)
     try:
         # 1. Fetch file (PDF or Image) from R2
-        file_bytes = download_from_r2(req.bucket, req.file_key)
-        
-        # 2. Run the pipeline (now handles PDF pages automatically)
-        extracted_text = run_ocr(file_bytes, req.file_key)
-        
-        return {
-            "status": "success",
-            "file_key": req.file_key,
-            "raw_text": extracted_text
-        }
+        file_bytes = await asyncio.to_thread(download_from_r2, req.bucket, req.file_key)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"OCR Failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"OCR Failed: {str(e)}")
+
+    # 2. Cost in pages, from the PDF structure before anything is rasterized;
+    #    429 / 413 here if it doesn't fit in the queue
+    pages = pdf_page_count(file_bytes) if req.file_key.lower().endswith(".pdf") else 1
+    ticket = await admission.acquire(user, pages)
+    try:
+        # 3. Run the pipeline (now handles PDF pages automatically), off the event loop
+        extracted_text = await asyncio.to_thread(run_ocr, file_bytes, req.file_key)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"OCR Failed: {str(e)}")
+    finally:
+        admission.release(ticket)
+
+    # 4. Make the notes searchable; an indexing problem shouldn't lose the OCR result
+    indexed_chunks = None
+    if req.index:
+        try:
+            # loading the model on first use, embedding and the upsert all block
+            indexed_chunks = await asyncio.to_thread(
+                lambda: get_index().index_ocr(req.file_key, extracted_text, req.subject, req.semester)
+            )
+        except Exception:
+            logger.exception("Indexing failed for %s", req.file_key)
+
+    return {
+        "status": "success",
+        "file_key": req.file_key,
+        "raw_text": extracted_text,
+        "pages": pages,
+        "indexed_chunks": indexed_chunks
+    }
+
+@app.post("/search")
+def search(req: SearchRequest):
+    start = time.perf_counter()
+    try:
+        results = get_index().search(req.query, req.subject, req.semester, req.source, req.limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Search Failed: {str(e)}")
+    return {
+        "status": "success",
+        "results": results,
+        "took_ms": round((time.perf_counter() - start) * 1000, 2)
+    }
+
+@app.get("/ocr/stats")
+def ocr_stats():
+    # blank / duplicate pages skipped and OCR time saved by the page cache,
+    # lines per recogniser and their cost
+    return {**get_page_cache().summary(), "recognisers": routing_stats()}
+
+@app.get("/admission")
+def admission_stats():
+    # queue depth, wait times and rejections of the OCR work queue
+    return admission.summary()
@@ -2,37 +2,156 @@
 from ocr import extract_text_trocr
 from pdf_utils import pdf_bytes_to_images
 from line_segment import segment_lines_from_image_bytes
+from line_classify import is_printed
+from page_cache import PageCache, SeenPage, find_duplicate, fingerprint, is_blank
+import printed_ocr
+from collections import Counter
 import cv2
 import io
+import os
+import threading
+import time
+
+# Recogniser routing: "auto" sends lines that look printed (line_classify.py)
+# to the fast printed-text engine and handwriting to TrOCR; a printed result
+# below PRINTED_MIN_SCORE confidence is redone by TrOCR. "handwritten" = TrOCR only.
+OCR_ROUTING = os.getenv("OCR_ROUTING", "auto")
+PRINTED_MIN_SCORE = float(os.getenv("PRINTED_MIN_SCORE", "0.9"))
+
+# cached page text is only reused when it came from the same recogniser(s)
+OCR_VERSION = "trocr-base-handwritten"
+
+_page_cache = None
+_routing = Counter()
+_routing_lock = threading.Lock()
+
+
+def routing_enabled():
+    return OCR_ROUTING == "auto" and printed_ocr.available()
+
+
+def get_page_cache():
+    global _page_cache
+    if _page_cache is None:
+        version = OCR_VERSION + (f"+{printed_ocr.PRINTED_OCR_MODEL}" if routing_enabled() else "")
+        _page_cache = PageCache(version=version)
+    return _page_cache
+
+
+def _count(**deltas):
+    with _routing_lock:
+        _routing.update(deltas)
+
+
+def routing_counts():
+    with _routing_lock:
+        return dict(_routing)
+
+
+def routing_stats():
+    c = routing_counts()
+
+    def per_line_ms(ms, lines):
+        return round(c.get(ms, 0) / c[lines], 1) if c.get(lines) else None
+
+    return {
+        "routing": OCR_ROUTING,
+        # None when routing is off or the engine couldn't be loaded
+        "printed_engine": printed_ocr.PRINTED_OCR_MODEL if routing_enabled() else None,
+        "printed_lines": c.get("printed_lines", 0),
+        "handwritten_lines": c.get("handwritten_lines", 0),
+        "printed_fallbacks": c.get("printed_fallbacks", 0),
+        # handwritten lines + printed fallbacks: what TrOCR actually recognised
+        "trocr_lines": c.get("trocr_lines", 0),
+        "printed_ms_per_line": per_line_ms("printed_ms", "printed_attempts"),
+        "trocr_ms_per_line": per_line_ms("trocr_ms", "trocr_lines"),
+    }
+
+
+def ocr_image_bytes(image_bytes: bytes, routing=None) -> str:
+    lines = segment_lines_from_image_bytes(image_bytes)
+    texts = [None] * len(lines)
+    printed = []
+
+    # printed lines in one batch through the fast engine
+    if routing_enabled() if routing is None else routing:
+        printed = [i for i, line in enumerate(lines) if is_printed(line)]
+        if printed:
+            start = time.perf_counter()
+            results = printed_ocr.extract_text_printed([lines[i] for i in printed])
+            _count(printed_attempts=len(printed), printed_ms=(time.perf_counter() - start) * 1000)
+            for i, (text, score) in zip(printed, results):
+                if score >= PRINTED_MIN_SCORE:
+                    texts[i] = text
+            accepted = sum(texts[i] is not None for i in printed)
+            _count(printed_lines=accepted, printed_fallbacks=len(printed) - accepted)
+
+    # handwriting, and printed lines the fast engine wasn't sure about
+    trocr = [i for i, text in enumerate(texts) if text is None]
+    start = time.perf_counter()
+    for i in trocr:
+        _, enc = cv2.imencode(".png", lines[i])
+        texts[i] = extract_text_trocr(enc.tobytes())
+    _count(handwritten_lines=len(lines) - len(printed), trocr_lines=len(trocr),
+           trocr_ms=(time.perf_counter() - start) * 1000)
+
+    return "\n".join(t for t in texts if t.strip())
+
+
+def ocr_page(page, cache, seen, source):
+    """
+    Text of one page (PIL image or encoded bytes): blank pages are skipped,
+    near-duplicates of a page earlier in this document (`seen`) and exact
+    copies of a page recognised in any document before reuse its text.
+    """
+    fp = fingerprint(page)
+    cache.count(pages=1)
+
+    if is_blank(fp):
+        # estimate: what an average recognised page costs
+        cache.count(blank=1, ms_saved=cache.avg_ocr_ms())
+        return ""
+
+    duplicate = find_duplicate(fp, seen)
+    if duplicate is not None:
+        cache.count(duplicate=1, ms_saved=duplicate.ocr_ms)
+        return duplicate.text
+
+    hit = cache.lookup(fp)
+    if hit is not None:
+        text, ocr_ms = hit
+        cache.count(cache_hits=1, ms_saved=ocr_ms)
+        seen.append(SeenPage(fp, text, ocr_ms))
+        return text
+
+    start = time.perf_counter()
+    if isinstance(page, bytes):
+        page_bytes = page
+    else:
+        buf = io.BytesIO()
+        page.save(buf, format="PNG")
+        page_bytes = buf.getvalue()
+    text = ocr_image_bytes(page_bytes)
+    ocr_ms = (time.perf_counter() - start) * 1000
+
+    cache.put(fp, text, ocr_ms, source)
+    seen.append(SeenPage(fp, text, ocr_ms))
+    cache.count(ocr_pages=1, ocr_ms=ocr_ms)
+    return text
+
 
 def run_ocr(file_bytes: bytes, filename: str) -> str:
-    texts = []
+    cache = get_page_cache()
+    seen = []
 
     if filename.lower().endswith(".pdf"):
+        texts = []
         pages = pdf_bytes_to_images(file_bytes)
 
         for page_idx, page in enumerate(pages, start=1):
-            buf = io.BytesIO()
-            page.save(buf, format="PNG")
-            page_bytes = buf.getvalue()
-
-            lines = segment_lines_from_image_bytes(page_bytes)
+            page_text = ocr_page(page, cache, seen, filename)
+            texts.append(f"--- Page {page_idx} ---\n" + page_text)
 
-            page_text = []
-            for line in lines:
-                _, enc = cv2.imencode(".png", line)
-                line_text = extract_text_trocr(enc.tobytes())
-                if line_text.strip():
-                    page_text.append(line_text)
+        return "\n".join(texts)
 
-            texts.append(f"--- Page {page_idx} ---\n" + "\n".join(page_text))
-
-    else:
-        lines = segment_lines_from_image_bytes(file_bytes)
-        for line in lines:
-            _, enc = cv2.imencode(".png", line)
-            line_text = extract_text_trocr(enc.tobytes())
-            if line_text.strip():
-                texts.append(line_text)
-
-    return "\n".join(texts)
+    return ocr_page(file_bytes, cache, seen, filename)
@@ -0,0 +1,252 @@
+# page_cache.py
+"""
+Per-page fingerprints so run_ocr only segments and recognises pages it
+hasn't seen.
+
+Each page gets:
+    ink        fraction of ink pixels (adaptive threshold, speckle removed,
+               on a 600px-wide copy); below BLANK_INK_RATIO the page is
+               blank and skipped. Bytes that don't decode count as blank.
+    phash      64-bit DCT perceptual hash, to find candidate duplicates
+    thumbnail  64x90 grayscale copy; a candidate is a duplicate only if the
+               thumbnails correlate >= DUPLICATE_MIN_CORRELATION (pages of
+               the same layout with different text land close in phash,
+               a rescan of the same page doesn't move either)
+    digest     SHA-256 of the page content (encoded bytes, or the pixels of
+               a rendered PDF page)
+
+Near-duplicates are only matched within one document: two students'
+copies of the same ruled answer sheet are near-duplicates too. Across
+documents, recognised pages are reused from a local SQLite cache
+(PAGE_CACHE_DB, "" keeps it in memory) only on an exact digest match,
+under the OCR version that produced them.
+
+    python page_cache.py stats
+    python page_cache.py clear
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, namedtuple
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PAGE_CACHE_DB = os.getenv("PAGE_CACHE_DB", "page_cache.db")
+BLANK_INK_RATIO = float(os.getenv("BLANK_INK_RATIO", "0.0005"))
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "10"))  # of 64 phash bits
+DUPLICATE_MIN_CORRELATION = float(os.getenv("DUPLICATE_MIN_CORRELATION", "0.95"))
+
+INK_WIDTH = 600
+THUMB_SIZE = (64, 90)  # (width, height), roughly A4
+
+Fingerprint = namedtuple("Fingerprint", "ink phash thumbnail digest")
+# a page recognised earlier in the current document
+SeenPage = namedtuple("SeenPage", "fingerprint text ocr_ms")
+
+
+def to_gray(image):
+    """
+    PIL image, encoded image bytes or a numpy array -> 2D uint8 array.
+    """
+    if isinstance(image, (bytes, bytearray)):
+        return cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if not isinstance(image, np.ndarray):
+        image = np.array(image.convert("L"))
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    return image
+
+
+def ink_density(gray):
+    h, w = gray.shape
+    small = cv2.resize(gray, (INK_WIDTH, max(1, int(h * INK_WIDTH / w))), interpolation=cv2.INTER_AREA)
+    # same thresholding as line_segment.py
+    ink = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 31, 15)
+    # scanner dust
+    ink = cv2.medianBlur(ink, 3)
+    return cv2.countNonZero(ink) / ink.size
+
+
+def phash(gray):
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = np.packbits(low > np.median(low[1:]))
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def digest(image):
+    if isinstance(image, (bytes, bytearray)):
+        data = bytes(image)
+    elif isinstance(image, np.ndarray):
+        data = repr(image.shape).encode() + image.tobytes()
+    else:
+        data = f"{image.mode}{image.size}".encode() + image.tobytes()
+    return hashlib.sha256(data).hexdigest()
+
+
+def fingerprint(image):
+    gray = to_gray(image)
+    if gray is None or not gray.size:
+        # undecodable upload: nothing to recognise
+        return Fingerprint(0.0, 0, None, digest(image))
+    thumbnail = cv2.resize(gray, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+    return Fingerprint(ink_density(gray), phash(gray), thumbnail, digest(image))
+
+
+def is_blank(fp):
+    return fp.ink < BLANK_INK_RATIO
+
+
+def _normalized(thumbnail):
+    t = thumbnail.astype(np.float32).ravel()
+    t -= t.mean()
+    return t / (np.linalg.norm(t) + 1e-6)
+
+
+def find_duplicate(fp, seen, max_distance=DUPLICATE_MAX_DISTANCE, min_correlation=DUPLICATE_MIN_CORRELATION):
+    """
+    The SeenPage in `seen` (this document's pages) that `fp` duplicates, or None.
+    """
+    thumb = None
+    best, best_corr = None, min_correlation
+    for page in seen:
+        if page.fingerprint.digest == fp.digest:
+            return page
+        if (page.fingerprint.phash ^ fp.phash).bit_count() > max_distance:
+            continue
+        if thumb is None:
+            thumb = _normalized(fp.thumbnail)
+        corr = float(_normalized(page.fingerprint.thumbnail) @ thumb)
+        if corr >= best_corr:
+            best, best_corr = page, corr
+    return best
+
+
+# -----------------------------
+# Cache
+# -----------------------------
+class PageCache:
+    """
+    Recognised text per page digest. Thread-safe.
+    """
+
+    def __init__(self, db_path=PAGE_CACHE_DB, version=""):
+        self.version = version
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        columns = {r[1] for r in self.db.execute("PRAGMA table_info(pages)")}
+        if columns and "digest" not in columns:
+            # cache from before exact matching; it only holds derived text
+            self.db.execute("DROP TABLE pages")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                id        INTEGER PRIMARY KEY,
+                version   TEXT NOT NULL,
+                digest    TEXT NOT NULL,
+                text      TEXT NOT NULL,
+                ocr_ms    REAL NOT NULL,
+                source    TEXT,
+                hits      INTEGER NOT NULL DEFAULT 0,
+                created   REAL,
+                last_used REAL,
+                UNIQUE (version, digest)
+            )
+        """)
+        self.db.commit()
+        self.counters = Counter()
+
+    def lookup(self, fp):
+        """
+        (text, ocr_ms) of a cached page with exactly `fp`'s content, or None.
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT id, text, ocr_ms FROM pages WHERE version = ? AND digest = ?", (self.version, fp.digest)
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "UPDATE pages SET hits = hits + 1, last_used = ? WHERE id = ?", (time.time(), row[0])
+            )
+            self.db.commit()
+            return row[1], row[2]
+
+    def put(self, fp, text, ocr_ms, source=None):
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO pages (version, digest, text, ocr_ms, source, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.version, fp.digest, text, ocr_ms, source, now, now)
+            )
+            self.db.commit()
+
+    # -----------------------------
+    # Counters
+    # -----------------------------
+    def count(self, **deltas):
+        with self.lock:
+            self.counters.update(deltas)
+
+    def avg_ocr_ms(self):
+        with self.lock:
+            n = self.counters.get("ocr_pages", 0)
+            return self.counters.get("ocr_ms", 0) / n if n else 0.0
+
+    def summary(self):
+        with self.lock:
+            c = dict(self.counters)
+            size = self.db.execute("SELECT COUNT(*) FROM pages WHERE version = ?", (self.version,)).fetchone()[0]
+        pages = c.get("pages", 0)
+        skipped = c.get("blank", 0) + c.get("duplicate", 0) + c.get("cache_hits", 0)
+        return {
+            "version": self.version,
+            "cached_pages": size,
+            "pages": pages,
+            "ocr_pages": c.get("ocr_pages", 0),
+            "blank_skipped": c.get("blank", 0),
+            "duplicates_in_document": c.get("duplicate", 0),
+            "cache_hits": c.get("cache_hits", 0),
+            "skipped_rate": round(skipped / pages, 3) if pages else 0.0,
+            "ocr_ms": round(c.get("ocr_ms", 0), 1),
+            "ms_saved": round(c.get("ms_saved", 0), 1),
+        }
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM pages")
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the OCR page cache")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--db", default=PAGE_CACHE_DB)
+    args = parser.parse_args()
+
+    cache = PageCache(args.db)
+    if args.command == "clear":
+        cache.clear()
+        print(f"Cleared {args.db}")
+    else:
+        rows = cache.db.execute(
+            "SELECT version, COUNT(*), SUM(hits), SUM(ocr_ms * hits) FROM pages GROUP BY version"
+        ).fetchall()
+        for version, n, hits, saved in rows:
+            print(f"{version or '-':32s} pages={n} hits={hits} ms_saved={round(saved or 0, 1)}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
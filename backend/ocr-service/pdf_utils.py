@@ -1,6 +1,7 @@
 # pdf_utils.py
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
 import io
+import re
 
 def pdf_bytes_to_images(pdf_bytes: bytes, dpi=300):
     pages = convert_from_bytes(
@@ -8,3 +9,11 @@ def pdf_bytes_to_images(pdf_bytes: bytes, dpi=300):
         dpi=dpi
     )
     return pages  # list of PIL Images
+
+def pdf_page_count(pdf_bytes: bytes) -> int:
+    # from the PDF structure, without rasterizing anything
+    try:
+        return int(pdfinfo_from_bytes(pdf_bytes)["Pages"])
+    except Exception:
+        # no poppler / unreadable info: count page objects instead
+        return max(1, len(re.findall(rb"/Type\s*/Page(?![s\w])", pdf_bytes)))
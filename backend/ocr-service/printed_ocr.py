@@ -0,0 +1,55 @@
+# printed_ocr.py
+"""
+Fast recogniser for printed text lines: PaddleOCR text recognition on CPU
+(lines are already segmented, so no detection model). A few ms per line
+against TrOCR's hundreds.
+
+Loaded on first use. Without paddleocr / paddlepaddle, or if the model
+can't be loaded, available() is False and the pipeline sends every line
+to TrOCR as before.
+"""
+import logging
+import os
+import threading
+
+import cv2
+
+PRINTED_OCR_MODEL = os.getenv("PRINTED_OCR_MODEL", "PP-OCRv5_mobile_rec")
+
+logger = logging.getLogger(__name__)
+
+_model = None
+_failed = False
+_lock = threading.Lock()
+
+
+def _load():
+    global _model, _failed
+    with _lock:
+        if _model is None and not _failed:
+            try:
+                from paddleocr import TextRecognition
+
+                _model = TextRecognition(model_name=PRINTED_OCR_MODEL, device="cpu")
+            except Exception:
+                _failed = True
+                logger.warning("Printed-text OCR unavailable, using TrOCR for every line", exc_info=True)
+    return _model
+
+
+def available() -> bool:
+    return _load() is not None
+
+
+def extract_text_printed(lines):
+    """
+    Grayscale line crops -> [(text, confidence)], recognised as one batch.
+    """
+    if not lines:
+        return []
+    model = _load()
+    images = [cv2.cvtColor(line, cv2.COLOR_GRAY2BGR) for line in lines]
+    # the predictor isn't safe to share between OCR workers
+    with _lock:
+        results = model.predict(input=images, batch_size=len(images))
+    return [(r["rec_text"].strip(), float(r["rec_score"])) for r in results]
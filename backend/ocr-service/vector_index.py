@@ -0,0 +1,343 @@
+# vector_index.py
+"""
+Qdrant index over OCR'd notes and the expanded question bank.
+
+Text is embedded on CPU in batches with a small sentence-embedding model
+(mean-pooled, normalised; cosine distance) and upserted with subject /
+semester / source payloads, which are indexed so filtered searches stay
+inside Qdrant's HNSW graph instead of scanning.
+
+Set QDRANT_URL for a Qdrant server; without it the client runs embedded,
+storing under QDRANT_PATH (":memory:" for throwaway tests).
+
+    python vector_index.py index-questions expanded_dataset.jsonl --seeds merged_dataset.jsonl
+    python vector_index.py search "what is a mole" --subject "CHEM 101"
+
+Expanded records written before the engine recorded "semester" (e.g.
+expanded_dataset_v1.jsonl) only get one through --seeds; without it a
+semester filter never matches them.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import time
+import uuid
+
+import numpy as np
+import torch
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient, models
+from transformers import AutoModel, AutoTokenizer
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+QDRANT_PATH = os.getenv("QDRANT_PATH", "qdrant_data")
+COLLECTION = os.getenv("QDRANT_COLLECTION", "askm")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+
+CHUNK_WORDS = 120
+CHUNK_OVERLAP = 20
+PAGE_MARKER = re.compile(r"^--- Page (\d+) ---$", re.M)
+
+SOURCE_NOTES = "notes"
+SOURCE_QUESTIONS = "question_bank"
+
+
+def make_client():
+    if QDRANT_URL:
+        return QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+    if QDRANT_PATH == ":memory:":
+        return QdrantClient(location=":memory:")
+    return QdrantClient(path=QDRANT_PATH)
+
+
+def normalize_subject(subject):
+    """
+    "CHEM 101" and "chem101" are the same course.
+    """
+    code = re.sub(r"\s+", "", subject or "").upper()
+    return code or None
+
+
+def point_id(*parts):
+    # deterministic, so re-indexing the same chunk overwrites it
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, "/".join(str(p) for p in parts)))
+
+
+# -----------------------------
+# Embeddings
+# -----------------------------
+class Embedder:
+    """
+    Mean-pooled, L2-normalised sentence embeddings on CPU.
+    """
+
+    def __init__(self, model_name=EMBED_MODEL, max_length=256):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name)
+        self.model.to("cpu").eval()
+        self.max_length = max_length
+        self.dim = self.model.config.hidden_size
+
+    @torch.inference_mode()
+    def encode(self, texts, batch_size=EMBED_BATCH_SIZE):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        # similar lengths share a batch, so little compute goes to padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            enc = self.tokenizer(
+                [texts[i] for i in idx],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="pt",
+            )
+            hidden = self.model(**enc).last_hidden_state
+            mask = enc["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            out[idx] = torch.nn.functional.normalize(pooled, dim=-1).numpy()
+
+        return out
+
+
+# -----------------------------
+# Chunking
+# -----------------------------
+def chunk_words(text, size=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    words = text.split()
+    if not words:
+        return []
+    step = size - overlap
+    return [" ".join(words[i:i + size]) for i in range(0, max(len(words) - overlap, 1), step)]
+
+
+def chunk_ocr_text(text):
+    """
+    run_ocr output -> [(page, chunk)]. PDFs come with "--- Page N ---"
+    markers; a single image is page 1.
+    """
+    parts = PAGE_MARKER.split(text)
+    if len(parts) == 1:
+        pages = [(1, text)]
+    else:
+        pages = [(int(parts[i]), parts[i + 1]) for i in range(1, len(parts), 2)]
+    return [(page, chunk) for page, body in pages for chunk in chunk_words(body)]
+
+
+def question_text(record):
+    answer = record.get("exam_mode_answer") or record.get("guided_mode_answer") or ""
+    return f"{record['question']}\n{answer}".strip()
+
+
+# -----------------------------
+# Index
+# -----------------------------
+class VectorIndex:
+    def __init__(self, client=None, embedder=None, collection=COLLECTION):
+        self.client = client or make_client()
+        self.embedder = embedder or Embedder()
+        self.collection = collection
+        self.ensure_collection()
+
+    def ensure_collection(self):
+        if self.client.collection_exists(self.collection):
+            return
+        self.client.create_collection(
+            self.collection,
+            vectors_config=models.VectorParams(size=self.embedder.dim, distance=models.Distance.COSINE),
+        )
+        for field, schema in (
+            ("source", models.PayloadSchemaType.KEYWORD),
+            ("subject", models.PayloadSchemaType.KEYWORD),
+            ("semester", models.PayloadSchemaType.INTEGER),
+            ("file_key", models.PayloadSchemaType.KEYWORD),
+        ):
+            self.client.create_payload_index(self.collection, field, field_schema=schema)
+
+    def upsert(self, ids, texts, payloads):
+        if not texts:
+            return 0
+        vectors = self.embedder.encode(texts)
+        self.client.upsert(
+            self.collection,
+            points=[
+                models.PointStruct(id=i, vector=v.tolist(), payload=p)
+                for i, v, p in zip(ids, vectors, payloads)
+            ],
+            wait=True,
+        )
+        return len(texts)
+
+    def delete_document(self, file_key):
+        self.client.delete(
+            self.collection,
+            points_selector=models.FilterSelector(filter=models.Filter(must=[
+                models.FieldCondition(key="file_key", match=models.MatchValue(value=file_key)),
+            ])),
+        )
+
+    def index_ocr(self, file_key, text, subject=None, semester=None):
+        """
+        Chunks and indexes one OCR result. Re-OCR of the same file replaces
+        its old chunks. Returns the number of chunks indexed.
+        """
+        chunks = chunk_ocr_text(text)
+        self.delete_document(file_key)
+        return self.upsert(
+            [point_id(SOURCE_NOTES, file_key, i) for i in range(len(chunks))],
+            [chunk for _, chunk in chunks],
+            [
+                {
+                    "source": SOURCE_NOTES,
+                    "file_key": file_key,
+                    "page": page,
+                    "chunk": i,
+                    "subject": normalize_subject(subject),
+                    "semester": semester,
+                    "text": chunk,
+                }
+                for i, (page, chunk) in enumerate(chunks)
+            ],
+        )
+
+    def index_questions(self, records, semester_of=None, batch_size=256):
+        """
+        One point per expanded Q&A record (question + exam answer), embedded
+        and upserted `batch_size` records at a time. `semester_of` maps a
+        normalised subject code to its semester for records that lack one.
+        """
+        semester_of = semester_of or {}
+        total = missing = 0
+        batch = []
+
+        def semester(r):
+            return r.get("semester") or semester_of.get(normalize_subject(r.get("subject")))
+
+        def flush():
+            nonlocal total, missing
+            missing += sum(semester(r) is None for r in batch)
+            total += self.upsert(
+                [point_id(SOURCE_QUESTIONS, r["subject"], r["question"]) for r in batch],
+                [question_text(r) for r in batch],
+                [
+                    {
+                        "source": SOURCE_QUESTIONS,
+                        "subject": normalize_subject(r.get("subject")),
+                        "semester": semester(r),
+                        "marks": r.get("marks"),
+                        "question": r["question"],
+                        "text": question_text(r),
+                    }
+                    for r in batch
+                ],
+            )
+            batch.clear()
+
+        for record in records:
+            if record.get("question"):
+                batch.append(record)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        if missing:
+            logger.warning(
+                "%d of %d questions have no semester (pass the seed dataset); semester-filtered searches skip them",
+                missing, total,
+            )
+        return total
+
+    def search(self, query, subject=None, semester=None, source=None, limit=5):
+        conditions = []
+        if subject:
+            conditions.append(models.FieldCondition(key="subject", match=models.MatchValue(value=normalize_subject(subject))))
+        if semester is not None:
+            conditions.append(models.FieldCondition(key="semester", match=models.MatchValue(value=semester)))
+        if source:
+            conditions.append(models.FieldCondition(key="source", match=models.MatchValue(value=source)))
+
+        result = self.client.query_points(
+            self.collection,
+            query=self.embedder.encode([query])[0].tolist(),
+            query_filter=models.Filter(must=conditions) if conditions else None,
+            limit=limit,
+            with_payload=True,
+        )
+        return [{"id": str(p.id), "score": round(p.score, 4), **p.payload} for p in result.points]
+
+
+# -----------------------------
+# Readers for the CLI
+# -----------------------------
+def iter_jsonl(path):
+    """
+    Skips malformed lines (the expanded dataset has a few).
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def load_semester_map(path):
+    """
+    Subject -> semester from the annotated seed dataset (.json or .jsonl).
+    """
+    if path.endswith(".jsonl"):
+        seeds = iter_jsonl(path)
+    else:
+        with open(path, encoding="utf-8") as f:
+            seeds = json.load(f)
+    return {
+        normalize_subject(s["subject"]): s["semester"]
+        for s in seeds
+        if isinstance(s, dict) and s.get("subject") and s.get("semester") is not None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index and search notes / question bank in Qdrant")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    index_cmd = sub.add_parser("index-questions")
+    index_cmd.add_argument("path", help="expanded dataset (.jsonl)")
+    index_cmd.add_argument("--seeds", default=None,
+                           help="seed dataset with semesters, for records that lack one")
+
+    search_cmd = sub.add_parser("search")
+    search_cmd.add_argument("query")
+    search_cmd.add_argument("--subject", default=None)
+    search_cmd.add_argument("--semester", type=int, default=None)
+    search_cmd.add_argument("--source", choices=[SOURCE_NOTES, SOURCE_QUESTIONS], default=None)
+    search_cmd.add_argument("--limit", type=int, default=5)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    index = VectorIndex()
+
+    if args.command == "index-questions":
+        start = time.perf_counter()
+        semester_of = load_semester_map(args.seeds) if args.seeds else None
+        count = index.index_questions(iter_jsonl(args.path), semester_of=semester_of)
+        print(f"Indexed {count} questions in {time.perf_counter() - start:.1f}s")
+    else:
+        start = time.perf_counter()
+        results = index.search(args.query, args.subject, args.semester, args.source, args.limit)
+        print(f"{len(results)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for r in results:
+            print(f"  {r['score']:.3f} [{r['source']}] {r.get('subject')}: {r['text'][:100]!r}")
+
+
+if __name__ == "__main__":
+    main()
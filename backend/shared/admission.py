@@ -0,0 +1,252 @@
+# admission.py
+"""
+Admission control: a bounded, fair-share work queue in front of the
+expensive endpoints, shared by ocr-service/ and inference-service/.
+
+Every request has a user (the Supabase user id from a verified bearer
+token, else the client address) and a cost (pages for OCR, budgeted tokens for
+generation). At most `max_running` jobs run at once, and one user runs
+at most `per_user_running` of them. The rest wait in a queue bounded by
+total cost (`max_queued_cost`) and by jobs per user (`per_user_queued`).
+A request that doesn't fit is refused straight away with 429 and a
+Retry-After estimated from the queued cost and the recent seconds per
+unit of cost, instead of timing out later; one that could never fit
+gets 413.
+
+Waiting jobs are served by start-time fair queuing on cost: each user's
+jobs get virtual finish tags that advance by their cost, so a student
+with a 200-page PDF queued doesn't hold back everyone with a 1-page
+photo behind it.
+
+All state is touched from the event loop only, so there are no locks.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import math
+import os
+import time
+from collections import Counter, deque
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+
+load_dotenv()
+
+# Supabase project JWT secret; without it tokens can't be verified and
+# every request is keyed by client address (a client could otherwise pick
+# a fresh user id per request and dodge its fair share)
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+
+
+class Overloaded(HTTPException):
+    def __init__(self, detail, retry_after):
+        super().__init__(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+
+# -----------------------------
+# Who is asking
+# -----------------------------
+def _b64decode(part):
+    return base64.urlsafe_b64decode(part + "=" * (-len(part) % 4))
+
+
+def user_key(request: Request) -> str:
+    """
+    "user:<supabase id>" from a verified `Authorization: Bearer <access
+    token>`, or "ip:<client address>" without one or without
+    SUPABASE_JWT_SECRET to verify it.
+    """
+    auth = request.headers.get("authorization", "")
+    if SUPABASE_JWT_SECRET and auth.lower().startswith("bearer "):
+        token = auth[7:].strip()
+        try:
+            header, payload, signature = token.split(".")
+            alg = json.loads(_b64decode(header)).get("alg")
+            claims = json.loads(_b64decode(payload))
+        except (ValueError, AttributeError):
+            raise HTTPException(status_code=401, detail="Malformed bearer token")
+        # Supabase signs with HS256; anything else (including "none") is refused
+        if alg != "HS256":
+            raise HTTPException(status_code=401, detail="Unsupported bearer token algorithm")
+
+        expected = hmac.new(
+            SUPABASE_JWT_SECRET.encode(), f"{header}.{payload}".encode(), hashlib.sha256
+        ).digest()
+        try:
+            valid = hmac.compare_digest(expected, _b64decode(signature))
+        except ValueError:
+            valid = False
+        if not valid:
+            raise HTTPException(status_code=401, detail="Invalid bearer token")
+        if claims.get("exp", math.inf) < time.time():
+            raise HTTPException(status_code=401, detail="Expired bearer token")
+
+        if claims.get("sub"):
+            return f"user:{claims['sub']}"
+
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+# -----------------------------
+# Queue
+# -----------------------------
+_seq = itertools.count()
+
+
+class Ticket:
+    def __init__(self, user, cost, start, finish):
+        self.seq = next(_seq)
+        self.user = user
+        self.cost = cost
+        # virtual start / finish tags for fair queuing
+        self.start = start
+        self.finish = finish
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.released = False
+
+
+class AdmissionController:
+    def __init__(self, name, max_running, max_queued_cost, per_user_running=1, per_user_queued=2, unit="units",
+                 seconds_per_unit=1.0):
+        self.name = name
+        self.max_running = max_running
+        self.max_queued_cost = max_queued_cost
+        self.per_user_running = per_user_running
+        self.per_user_queued = per_user_queued
+        self.unit = unit
+
+        self.queue = []
+        self.running = Counter()  # user -> running jobs
+        self.n_running = 0
+        self.vtime = 0.0
+        self.user_finish = {}  # user -> finish tag of their latest job
+        # seconds per unit of cost for Retry-After: a guess until jobs finish,
+        # then an EWMA over them
+        self.seconds_per_unit = seconds_per_unit
+        self.measured = False
+        self.waits = deque(maxlen=1000)
+        self.counters = Counter()
+
+    def queued_cost(self):
+        return sum(t.cost for t in self.queue)
+
+    def retry_after(self, cost=0):
+        per_unit = self.seconds_per_unit
+        return max(1, math.ceil((self.queued_cost() + cost) * per_unit / self.max_running))
+
+    def _can_run(self, user):
+        return self.n_running < self.max_running and self.running[user] < self.per_user_running
+
+    async def acquire(self, user, cost):
+        """
+        Waits for a slot and returns the ticket to release() afterwards.
+        Raises Overloaded (429) when the queue is full, 413 when `cost`
+        alone is more than the queue holds.
+        """
+        cost = max(1, int(cost))
+        if cost > self.max_queued_cost:
+            self.counters["rejected_too_large"] += 1
+            raise HTTPException(
+                status_code=413,
+                detail=f"Request too large for {self.name}: {cost} {self.unit} (limit {self.max_queued_cost})",
+            )
+
+        start = max(self.vtime, self.user_finish.get(user, 0.0))
+        ticket = Ticket(user, cost, start, start + cost)
+
+        if not self._can_run(user):
+            queued_by_user = sum(t.user == user for t in self.queue)
+            if queued_by_user >= self.per_user_queued or self.queued_cost() + cost > self.max_queued_cost:
+                self.counters["rejected"] += 1
+                raise Overloaded(
+                    f"{self.name} is busy ({len(self.queue)} queued, {queued_by_user} of them yours), try again later",
+                    self.retry_after(cost),
+                )
+
+        self.user_finish[user] = ticket.finish
+        self.queue.append(ticket)
+        self._dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            # the client went away while waiting (or right as its turn came)
+            if ticket in self.queue:
+                self.queue.remove(ticket)
+                self.counters["abandoned"] += 1
+            else:
+                self.release(ticket)
+            raise
+        return ticket
+
+    def _dispatch(self):
+        while self.n_running < self.max_running:
+            eligible = [t for t in self.queue if self.running[t.user] < self.per_user_running]
+            if not eligible:
+                return
+            ticket = min(eligible, key=lambda t: (t.finish, t.seq))
+            self.queue.remove(ticket)
+            if ticket.future.cancelled():
+                self.counters["abandoned"] += 1
+                continue
+
+            self.vtime = max(self.vtime, ticket.start)
+            self.n_running += 1
+            self.running[ticket.user] += 1
+            ticket.started_at = time.monotonic()
+            self.waits.append(ticket.started_at - ticket.enqueued_at)
+            self.counters["admitted"] += 1
+            ticket.future.set_result(None)
+
+    def release(self, ticket):
+        if ticket.released or ticket.started_at is None:
+            return
+        ticket.released = True
+        self.n_running -= 1
+        self.running[ticket.user] -= 1
+        if not self.running[ticket.user]:
+            del self.running[ticket.user]
+        self.counters["completed"] += 1
+
+        per_unit = (time.monotonic() - ticket.started_at) / ticket.cost
+        self.seconds_per_unit = per_unit if not self.measured else 0.8 * self.seconds_per_unit + 0.2 * per_unit
+        self.measured = True
+
+        # users with nothing left can't be ahead of anyone any more
+        if ticket.user not in self.running and not any(t.user == ticket.user for t in self.queue):
+            if self.user_finish.get(ticket.user, 0.0) <= self.vtime:
+                self.user_finish.pop(ticket.user, None)
+
+        self._dispatch()
+
+    # -----------------------------
+    # Metrics
+    # -----------------------------
+    def summary(self):
+        waits = sorted(self.waits)
+
+        def wait_ms(q):
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))] * 1000, 1) if waits else None
+
+        return {
+            "running": self.n_running,
+            "max_running": self.max_running,
+            "queue_depth": len(self.queue),
+            "queued_cost": self.queued_cost(),
+            "max_queued_cost": self.max_queued_cost,
+            "cost_unit": self.unit,
+            "users_running": len(self.running),
+            "users_queued": len({t.user for t in self.queue}),
+            "wait_ms_p50": wait_ms(0.5),
+            "wait_ms_p95": wait_ms(0.95),
+            "wait_ms_max": round(waits[-1] * 1000, 1) if waits else None,
+            "seconds_per_unit": round(self.seconds_per_unit, 4),
+            "retry_after_s": self.retry_after(),
+            **{k: self.counters.get(k, 0) for k in ("admitted", "completed", "rejected", "rejected_too_large",
+                                                    "abandoned")},
+        }
@@ -15,17 +15,24 @@ interface StreamingResponseProps {
     }>;
   };
   isComplete: boolean;
+  // content grows as tokens arrive: show it as-is instead of revealing points on a timer
+  live?: boolean;
+  metrics?: {
+    ttft_ms: number | null;
+    tokens_per_sec: number | null;
+  } | null;
 }
 
-export function StreamingResponse({ query, content, isComplete }: StreamingResponseProps) {
-  const [visiblePoints, setVisiblePoints] = useState(0);
+export function StreamingResponse({ query, content, isComplete, live = false, metrics }: StreamingResponseProps) {
+  const [revealedPoints, setRevealedPoints] = useState(0);
   const [showSources, setShowSources] = useState(false);
+  const visiblePoints = live ? content.summary.length : revealedPoints;
 
   useEffect(() => {
     // Simulate streaming by revealing points one by one
-    if (visiblePoints < content.summary.length) {
+    if (!live && revealedPoints < content.summary.length) {
       const timer = setTimeout(() => {
-        setVisiblePoints(prev => prev + 1);
+        setRevealedPoints(prev => prev + 1);
       }, 400); // 400ms delay between each point
       return () => clearTimeout(timer);
     } else if (isComplete && !showSources) {
@@ -35,7 +42,7 @@ export function StreamingResponse({ query, content, isComplete }: StreamingRespo
       }, 300);
       return () => clearTimeout(timer);
     }
-  }, [visiblePoints, content.summary.length, isComplete, showSources]);
+  }, [live, revealedPoints, content.summary.length, isComplete, showSources]);
 
   return (
     <div className="max-w-4xl mx-auto px-4 md:px-8 py-8 md:py-12 space-y-4 md:space-y-6">
@@ -92,7 +99,7 @@ export function StreamingResponse({ query, content, isComplete }: StreamingRespo
           </AnimatePresence>
 
           {/* Typing indicator while streaming */}
-          {!isComplete && visiblePoints < content.summary.length && (
+          {!isComplete && (live || visiblePoints < content.summary.length) && (
             <motion.div
               className="flex gap-3 items-center"
               initial={{ opacity: 0 }}
@@ -118,6 +125,14 @@ export function StreamingResponse({ query, content, isComplete }: StreamingRespo
               </div>
             </motion.div>
           )}
+
+          {/* Generation speed once the answer is complete */}
+          {isComplete && metrics && metrics.ttft_ms != null && (
+            <p className="text-[#A0A0A0] text-xs">
+              First token in {Math.round(metrics.ttft_ms)} ms
+              {metrics.tokens_per_sec != null && ` · ${metrics.tokens_per_sec} tokens/sec`}
+            </p>
+          )}
         </div>
 
         {/* Sources & Syllabus Alignment - Fade in when complete */}
@@ -0,0 +1,82 @@
+import { supabase } from './supabaseClient'
+
+const inferenceUrl = import.meta.env.VITE_INFERENCE_URL || 'http://localhost:8002'
+
+export interface GenerateParams {
+    adapter: string
+    question: string
+    subject?: string
+    marks?: number
+    max_new_tokens?: number
+}
+
+export interface GenerationMetrics {
+    adapter: string
+    finish_reason: string
+    new_tokens: number
+    queue_ms: number | null
+    ttft_ms: number | null
+    total_ms: number | null
+    tokens_per_sec: number | null
+}
+
+interface StreamHandlers {
+    onToken: (text: string) => void
+    onDone?: (metrics: GenerationMetrics) => void
+    signal?: AbortSignal
+}
+
+// POSTs to the inference service's /generate/stream and reads the
+// server-sent events as they arrive. Aborting `signal` closes the
+// connection, which cancels the generation on the server. The Supabase
+// access token identifies the user for the server's per-user fair share;
+// a full queue answers 429 with Retry-After (seconds).
+export async function streamGeneration(params: GenerateParams, { onToken, onDone, signal }: StreamHandlers) {
+    const { data: { session } } = await supabase.auth.getSession()
+    const headers: Record<string, string> = { 'Content-Type': 'application/json' }
+    if (session) headers['Authorization'] = `Bearer ${session.access_token}`
+
+    const response = await fetch(`${inferenceUrl}/generate/stream`, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify(params),
+        signal,
+    })
+    if (response.status === 429) {
+        const retryAfter = response.headers.get('Retry-After')
+        throw new Error(`The server is busy, try again in ${retryAfter ?? 'a few'} seconds`)
+    }
+    if (!response.ok || !response.body) {
+        throw new Error(`Generation failed (${response.status}): ${await response.text()}`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+
+    while (true) {
+        const { value, done } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+
+        let boundary
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const { event, data } = parseEvent(buffer.slice(0, boundary))
+            buffer = buffer.slice(boundary + 2)
+
+            if (event === 'token') onToken(data.text)
+            else if (event === 'done') onDone?.(data)
+            else if (event === 'error') throw new Error(data.detail)
+        }
+    }
+}
+
+function parseEvent(raw: string) {
+    let event = 'message'
+    const data: string[] = []
+    for (const line of raw.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data.push(line.slice(5).trimStart())
+    }
+    return { event, data: JSON.parse(data.join('\n')) }
+}